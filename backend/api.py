@@ -17,6 +17,10 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(config)
     
+    # NumPy-aware JSON (orjson when installed) for request and response bodies
+    from app.serialization import NumpyJSONProvider
+    app.json = NumpyJSONProvider(app)
+    
     # ✅ CORS enabled for frontend
     CORS(app, resources={
         r"/api/*": {
@@ -50,16 +54,22 @@ def create_app():
             "environment": config.FLASK_ENV
         }), 200
     
+    # Request timing
+    from app.middleware import init_instrumentation
+    init_instrumentation(app)
+    
     # Register blueprints
     from app.routes.threat_detection import threat_bp
     from app.routes.monitoring import monitoring_bp
     from app.routes.admin import admin_bp
     from app.routes.reports import reports_bp
+    from app.routes.metrics import metrics_bp
     
     app.register_blueprint(threat_bp)
     app.register_blueprint(monitoring_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(reports_bp)
+    app.register_blueprint(metrics_bp)
     
     logger.info("✅ All blueprints registered")
     
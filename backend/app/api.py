@@ -14,6 +14,10 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(config)
     
+    # NumPy-aware JSON (orjson when installed) for request and response bodies
+    from app.serialization import NumpyJSONProvider
+    app.json = NumpyJSONProvider(app)
+    
     # Enable CORS - CORRECT LOCATION
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     
@@ -30,14 +34,20 @@ def create_app():
     def server_error(error):
         return jsonify({'error': 'Internal Server Error'}), 500
     
+    # Request timing
+    from app.middleware import init_instrumentation
+    init_instrumentation(app)
+    
     # Register blueprints
     from app.routes.threat_detection import threat_bp
     from app.routes.monitoring import monitoring_bp
     from app.routes.admin import admin_bp
+    from app.routes.metrics import metrics_bp
     
     app.register_blueprint(threat_bp)
     app.register_blueprint(monitoring_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(metrics_bp)
     
     # Health check
     @app.route('/api/system/health', methods=['GET'])
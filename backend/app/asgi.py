@@ -0,0 +1,189 @@
+"""
+ASGI Serving
+create_asgi_app() serves the whole API under uvicorn:
+
+  gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker "app.asgi:create_asgi_app()"
+  uvicorn --factory app.asgi:create_asgi_app --workers 4 --port 5000
+  python main.py --asgi
+
+The scoring routes (/api/threats/detect, /batch and /batch-csv) are native
+async handlers. Request bodies are read off the socket by the event loop, CSV
+uploads are spooled to a temporary file by python-multipart and parsed from
+it (every body, uploads included, is capped at ASGI["max_body_mb"]), and scoring, the threat writes and response encoding run on a bounded
+thread pool (ASGI["scoring_threads"]). A worker with ASGI["max_pending"]
+scoring calls already queued answers 503 at once instead of queueing more.
+They use the same handlers as the Flask routes (threat_detection.detect_one,
+detect_batch, detect_csv), so both servers answer alike.
+
+Every other route (/api/threats, /api/monitoring, /api/admin, /api/reports,
+/metrics, /api/system/health) is the Flask app from api.create_app, mounted
+through a2wsgi's WSGIMiddleware: each call runs on its thread pool and its
+SQLite reads never block the event loop.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import config
+from app import payloads
+from app.middleware import record_request
+from app.serialization import dumpb, loads
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Busy(Exception):
+    """Every scoring slot of this worker is taken"""
+
+
+class BodyTooLarge(Exception):
+    """Request body over ASGI["max_body_mb"]"""
+
+
+class ScoringPool:
+    """Thread pool for scoring calls, with a cap on calls queued or running.
+    Only the event loop thread submits, so the counter needs no lock."""
+
+    def __init__(self, threads: int, max_pending: int):
+        self._pool = ThreadPoolExecutor(max(1, threads), thread_name_prefix="asgi-scoring")
+        self._max_pending = max_pending
+        self._pending = 0
+
+    async def run(self, fn, *args):
+        if self._pending >= self._max_pending:
+            metrics.inc("asgi_rejected_total")
+            raise Busy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def read_body(request: Request, limit: int) -> bytes:
+    """The request body, refused once it passes limit bytes"""
+    if int(request.headers.get("content-length") or 0) > limit:
+        raise BodyTooLarge()
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            raise BodyTooLarge()
+    return b"".join(chunks)  # bytes, so .npy bodies are viewed in place (np.frombuffer)
+
+
+def capped(request: Request, limit: int) -> Request:
+    """The request, reading its body through a counter that raises BodyTooLarge past limit bytes
+    (for multipart uploads, which request.form() streams to disk rather than into memory)"""
+    if int(request.headers.get("content-length") or 0) > limit:
+        raise BodyTooLarge()
+    size = 0
+
+    async def receive():
+        nonlocal size
+        message = await request.receive()
+        if message["type"] == "http.request":
+            size += len(message.get("body", b""))
+            if size > limit:
+                raise BodyTooLarge()
+        return message
+    return Request(request.scope, receive)
+
+
+def _encoded(route: str, handler, *args):
+    """Run a scoring handler and encode its JSON body, both on the pool"""
+    status, payload, headers = handler(*args)
+    if not isinstance(payload, bytes):
+        with metrics.timer("serialize_seconds", route=route):
+            payload = dumpb(payload)
+        headers = {"Content-Type": "application/json", **headers}
+    return status, payload, headers
+
+
+def create_asgi_app(settings: Dict = None) -> FastAPI:
+    """FastAPI app: native scoring routes in front of the mounted Flask app"""
+    from api import create_app
+    from app.routes import threat_detection as routes
+
+    s = settings or config.ASGI
+    flask_app = create_app()
+    scoring = ScoringPool(s["scoring_threads"], s["max_pending"])
+    limit = int(s["max_body_mb"] * 2**20)
+
+    api = FastAPI(title="EHR Threat Detection", docs_url=None, redoc_url=None, openapi_url=None)
+    api.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET", "POST", "OPTIONS"],
+                       allow_headers=["Content-Type", "Authorization"])
+    api.add_event_handler("shutdown", scoring.shutdown)
+
+    async def serve(rule: str, route: str, request: Request, read, handler, error: str):
+        """Read the request on the loop, score on the pool, and time it like the Flask routes"""
+        start = time.perf_counter()
+        try:
+            args = await read()
+            status, body, headers = await scoring.run(_encoded, route, handler, *args)
+            response = Response(body, status_code=status, headers=headers)
+        except Busy:
+            response = Response(dumpb({"error": "Scoring queue full, retry shortly"}), status_code=503,
+                                media_type="application/json", headers={"Retry-After": "1"})
+        except BodyTooLarge:
+            response = Response(dumpb({"error": f"Body over {s['max_body_mb']} MB"}), status_code=413,
+                                media_type="application/json")
+        except payloads.UnsupportedPayload as e:
+            response = Response(dumpb({"error": str(e)}), status_code=415, media_type="application/json")
+        except Exception as e:
+            logger.error(f"{error}: {e}")
+            response = Response(dumpb({"error": str(e)}), status_code=400, media_type="application/json")
+        record_request(rule, request.method, response.status_code, time.perf_counter() - start)
+        return response
+
+    @api.post("/api/threats/detect")
+    async def detect_threat(request: Request):
+        async def read():
+            return loads(await read_body(request, limit)), request.query_params
+        return await serve("/api/threats/detect", "detect", request, read, routes.detect_one, "Detection error")
+
+    @api.post("/api/threats/batch")
+    async def detect_batch(request: Request):
+        async def read():
+            accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+            content_type = request.headers.get("content-type", "").split(";")[0].strip()
+            return await read_body(request, limit), content_type, accept, request.query_params
+        return await serve("/api/threats/batch", "batch", request, read, routes.detect_batch,
+                           "Batch detection error")
+
+    @api.post("/api/threats/batch-csv")
+    async def detect_batch_csv(request: Request):
+        form = None
+
+        async def read():
+            nonlocal form
+            form = await capped(request, limit).form()  # Files are spooled to disk as they arrive
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise ValueError("No file provided")
+            return upload.file, upload.filename or ""
+        try:
+            return await serve("/api/threats/batch-csv", "batch-csv", request, read, routes.detect_csv,
+                               "CSV batch detection error")
+        finally:
+            if form is not None:
+                await form.close()
+
+    # Everything else is served by the Flask app on the server's thread pool
+    api.mount("/", WSGIMiddleware(flask_app))
+    logger.info(f"✅ ASGI app created ({s['scoring_threads']} scoring threads, {s['max_pending']} pending max)")
+    return api
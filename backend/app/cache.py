@@ -0,0 +1,114 @@
+"""
+Response Cache
+Read endpoints (dashboard, admin metrics, threat listing) only change when
+threats are written or a model bundle is loaded, so each worker caches their
+bodies keyed on the database generation counter, which every threats write
+bumps in its own transaction, so writes from any worker count, plus the
+loaded bundle version. Endpoints that also show live latency figures add a
+short time bucket (live_seconds) to the key.
+
+Responses carry the key as their ETag: a poll with a matching If-None-Match
+gets 304 before the view runs. Hit ratios per route are counted in
+response_cache_total and reported by /api/admin/metrics.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict
+
+from flask import request, make_response
+
+import config
+from utils.metrics import metrics, parse_key
+
+logger = logging.getLogger(__name__)
+
+
+def _generation() -> str:
+    """Threats generation plus the loaded bundle version"""
+    from app.database import db
+    from app.routes.threat_detection import detector
+    return f"{db.generation()}-{detector.model_version or 'none'}"
+
+
+class ResponseCache:
+    """Per-worker LRU of response bodies, validated against a generation key"""
+
+    def __init__(self, generation: Callable[[], str], settings: Dict = None):
+        self.generation = generation
+        self.settings = settings or config.RESPONSE_CACHE
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, live: bool = False):
+        """Decorator for a GET view; live=True also expires entries every live_seconds"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.settings["enabled"]:
+                    return view(*args, **kwargs)
+                route = request.endpoint
+                # Read before the view runs, so a body is never older than its tag
+                tag = self.generation()
+                if live:
+                    tag += f"-{int(time.time() // self.settings['live_seconds'])}"
+
+                if request.if_none_match.contains(tag):
+                    metrics.inc("response_cache_total", route=route, result="not_modified")
+                    response = make_response("", 304)
+                    response.set_etag(tag)
+                    return response
+
+                key = (route, request.query_string, tuple(sorted(kwargs.items())))
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[0] == tag:
+                        self._entries.move_to_end(key)
+                    else:
+                        entry = None
+                if entry is not None:
+                    metrics.inc("response_cache_total", route=route, result="hit")
+                    response = make_response(entry[1], 200)
+                    response.mimetype = entry[2]
+                else:
+                    metrics.inc("response_cache_total", route=route, result="miss")
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    self._store(key, (tag, response.get_data(), response.mimetype))
+                response.set_etag(tag)
+                response.headers["Cache-Control"] = "no-cache"  # Revalidate with If-None-Match
+                return response
+            return wrapper
+        return decorator
+
+    def _store(self, key: tuple, entry: tuple):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.settings["max_entries"]:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def hit_ratios(aggregated: Dict) -> Dict:
+        """{route: {hit, miss, not_modified, hit_ratio}} from a metrics aggregate (all workers)"""
+        routes: Dict[str, Dict] = {}
+        for key, value in aggregated["counters"].items():
+            name, labels = parse_key(key)
+            if name != "response_cache_total":
+                continue
+            counts = routes.setdefault(labels["route"], {"hit": 0, "miss": 0, "not_modified": 0})
+            counts[labels["result"]] += int(value)
+        for counts in routes.values():
+            total = counts["hit"] + counts["miss"] + counts["not_modified"]
+            counts["hit_ratio"] = round((counts["hit"] + counts["not_modified"]) / total, 4) if total else 0.0
+        return routes
+
+
+response_cache = ResponseCache(_generation)
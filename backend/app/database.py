@@ -1,14 +1,50 @@
 import sqlite3
+import ipaddress
+import itertools
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
+import time
+import logging
+
+import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Relative to the working directory unless THREAT_DB_PATH points elsewhere
+DB_NAME = os.getenv("THREAT_DB_PATH", "threat_detector.db")
+
+def ipv4_int(ip):
+    """IPv4 address as an integer (None for anything else), for CIDR range scans"""
+    try:
+        return int(ipaddress.IPv4Address(str(ip).strip()))
+    except ValueError:
+        return None
+
+
+def _fts_query(text):
+    """User words as quoted FTS5 phrases (all must match); word* keeps prefix matching"""
+    terms = []
+    for word in str(text).split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms) or '""'
 
-DB_NAME = "threat_detector.db"
 
 class Database:
     def __init__(self):
+        self._listeners = []
         self._init_db()
 
+    def add_listener(self, fn, batch=None):
+        """Call fn(threat_id, data) after every add_threat commit, and batch(ids, columns)
+        after every add_threats commit (fn once per row when batch is not given)"""
+        self._listeners.append((fn, batch))
+
     def _get_conn(self):
         return sqlite3.connect(DB_NAME, check_same_thread=False)
 
@@ -30,17 +66,115 @@ class Database:
             )
         ''')
         
+        # Precomputed explanations (ml/explainer.pack_explanation), one per threat
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS threat_explanations (
+                threat_id INTEGER PRIMARY KEY,
+                model_version TEXT,
+                payload BLOB,
+                created_at TEXT
+            )
+        ''')
+        
+        # Daily rollups for range reports, maintained incrementally from the
+        # last rolled-up threat id (refresh_rollups)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS threat_daily (
+                day TEXT PRIMARY KEY,
+                total INTEGER,
+                threats INTEGER,
+                critical INTEGER,
+                warning INTEGER,
+                confidence_sum REAL,
+                max_id INTEGER
+            )
+        ''')
+        cur.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, last_id INTEGER)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_threats_timestamp ON threats(timestamp)")
+        
+        # Search (search_threats): equality filters are paired with id so
+        # results come out in keyset order, IPv4 sources as integers for CIDR
+        # ranges, and an FTS5 index over the free-text columns
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(threats)")}
+        if "source_ip_int" not in columns:
+            conn.create_function("ipv4_int", 1, ipv4_int, deterministic=True)
+            cur.execute("ALTER TABLE threats ADD COLUMN source_ip_int INTEGER")
+            cur.execute("UPDATE threats SET source_ip_int = ipv4_int(source_ip)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_threats_source_ip_int ON threats(source_ip_int)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_threats_source_ip ON threats(source_ip, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_threats_severity ON threats(severity, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_threats_attack_type ON threats(attack_type, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_threats_confidence ON threats(confidence)")
+        fts_exists = cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'threats_fts'"
+        ).fetchone()
+        if not fts_exists:
+            cur.execute('''
+                CREATE VIRTUAL TABLE threats_fts USING fts5(
+                    attack_type, source_ip, content='threats', content_rowid='id',
+                    tokenize="unicode61 tokenchars '.'"
+                )
+            ''')
+            cur.execute("INSERT INTO threats_fts(threats_fts) VALUES ('rebuild')")
+        cur.executescript('''
+            CREATE TRIGGER IF NOT EXISTS threats_fts_insert AFTER INSERT ON threats BEGIN
+                INSERT INTO threats_fts(rowid, attack_type, source_ip)
+                VALUES (new.id, new.attack_type, new.source_ip);
+            END;
+            CREATE TRIGGER IF NOT EXISTS threats_fts_delete AFTER DELETE ON threats BEGIN
+                INSERT INTO threats_fts(threats_fts, rowid, attack_type, source_ip)
+                VALUES ('delete', old.id, old.attack_type, old.source_ip);
+            END;
+            CREATE TRIGGER IF NOT EXISTS threats_fts_update AFTER UPDATE OF attack_type, source_ip ON threats BEGIN
+                INSERT INTO threats_fts(threats_fts, rowid, attack_type, source_ip)
+                VALUES ('delete', old.id, old.attack_type, old.source_ip);
+                INSERT INTO threats_fts(rowid, attack_type, source_ip)
+                VALUES (new.id, new.attack_type, new.source_ip);
+            END;
+        ''')
+        
+        # Bumped in the same transaction as every threats write, so response
+        # caches in any worker can tell their copy is stale (app/cache.py)
+        cur.execute("CREATE TABLE IF NOT EXISTS generation (name TEXT PRIMARY KEY, value INTEGER)")
+        cur.execute("INSERT OR IGNORE INTO generation (name, value) VALUES ('threats', 0)")
+        # Bumped when stored rows are rewritten (re-scoring) rather than added, for
+        # state kept incrementally from the last seen id (stream totals, report snapshots)
+        cur.execute("INSERT OR IGNORE INTO generation (name, value) VALUES ('history', 0)")
+        
+        # Model bundle that scored each row, and re-scoring jobs (app/rescoring.py)
+        if "model_version" not in columns:
+            cur.execute("ALTER TABLE threats ADD COLUMN model_version TEXT")
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS rescore_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model_version TEXT,
+                signature TEXT,
+                status TEXT,
+                cursor INTEGER,
+                total INTEGER,
+                rescored INTEGER,
+                changed INTEGER,
+                owner TEXT,
+                heartbeat REAL,
+                started_at TEXT,
+                updated_at TEXT,
+                error TEXT
+            )
+        ''')
+        
         conn.commit()
         conn.close()
 
     def add_threat(self, data):
-        """Add a new threat record"""
+        """Add a new threat record; returns its id"""
+        start = time.perf_counter()
         conn = self._get_conn()
         cur = conn.cursor()
         
         cur.execute('''
-            INSERT INTO threats (timestamp, prediction, confidence, severity, threat_type, source_ip, attack_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO threats (timestamp, prediction, confidence, severity, threat_type, source_ip, attack_type,
+                                 source_ip_int, model_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             data.get('timestamp', datetime.now().isoformat()),
             data.get('prediction'),
@@ -48,11 +182,491 @@ class Database:
             data.get('severity'),
             data.get('threat_type'),
             data.get('source_ip', 'Unknown'),
-            data.get('type', 'Unknown')
+            data.get('type', 'Unknown'),
+            ipv4_int(data.get('source_ip', 'Unknown')),
+            data.get('model_version')
         ))
         
+        threat_id = cur.lastrowid
+        self._bump(cur)
         conn.commit()
         conn.close()
+        metrics.observe("db_write_seconds", time.perf_counter() - start)
+        
+        for listener, _ in self._listeners:
+            try:
+                listener(threat_id, data)
+            except Exception as e:
+                logger.warning(f"⚠️ Threat listener failed: {e}")
+        return threat_id
+
+    def add_threats(self, columns):
+        """Add many threats in one transaction; returns their ids
+
+        columns maps add_threat keys to equal-length arrays, or to one value
+        for every row ("features" is a rows x features matrix).
+        """
+        n = len(columns["confidence"])
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+
+        def column(name, default=None):
+            value = columns.get(name, default)
+            return itertools.repeat(value, n) if np.ndim(value) == 0 else np.asarray(value).tolist()
+
+        ips = column('source_ip', 'Unknown')
+        if np.ndim(columns.get('source_ip', 'Unknown')) == 0:
+            ip_ints = itertools.repeat(ipv4_int(columns.get('source_ip', 'Unknown')), n)
+        else:
+            lookup = {ip: ipv4_int(ip) for ip in set(ips)}  # Batches repeat a few addresses
+            ip_ints = map(lookup.__getitem__, ips)
+
+        with metrics.timer("db_batch_write_seconds"):
+            conn = self._get_conn()
+            cur = conn.cursor()
+            cur.executemany('''
+                INSERT INTO threats (timestamp, prediction, confidence, severity, threat_type, source_ip, attack_type,
+                                     source_ip_int, model_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', zip(column('timestamp', datetime.now().isoformat()), column('prediction'), column('confidence'),
+                     column('severity'), column('threat_type'), ips, column('type', 'Unknown'), ip_ints,
+                     column('model_version')))
+            # The write lock is held from the first insert, so the new rowids are consecutive
+            last = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+            self._bump(cur)
+            conn.commit()
+            conn.close()
+        ids = np.arange(last - n + 1, last + 1, dtype=np.int64)
+
+        for listener, batch in self._listeners:
+            try:
+                if batch is not None:
+                    batch(ids, columns)
+                else:
+                    for threat_id, data in zip(ids.tolist(), self.rows(columns, n)):
+                        listener(threat_id, data)
+            except Exception as e:
+                logger.warning(f"⚠️ Threat listener failed: {e}")
+        return ids
+
+    @staticmethod
+    def rows(columns, n):
+        """add_threats columns → one add_threat dict per row"""
+        shared = {name: value for name, value in columns.items() if np.ndim(value) == 0}
+        per_row = {name: value for name, value in columns.items() if np.ndim(value) > 0}
+        for i in range(n):
+            yield {**shared, **{name: value[i] for name, value in per_row.items()}}
+
+    @staticmethod
+    def _bump(cur, name='threats'):
+        cur.execute("UPDATE generation SET value = value + 1 WHERE name = ?", (name,))
+
+    def generation(self, name='threats'):
+        """Counter of threats writes (all workers); 'history' counts rewrites of stored rows"""
+        conn = self._get_conn()
+        value = conn.execute("SELECT value FROM generation WHERE name = ?", (name,)).fetchone()[0]
+        conn.close()
+        return value
+
+    def save_explanations(self, rows):
+        """Store (threat_id, model_version, payload) rows in one transaction"""
+        now = datetime.now().isoformat()
+        conn = self._get_conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO threat_explanations VALUES (?, ?, ?, ?)",
+                [(threat_id, version, payload, now) for threat_id, version, payload in rows]
+            )
+        conn.close()
+
+    def get_explanation(self, threat_id, model_version):
+        """Stored payload for a threat if it was computed by model_version"""
+        conn = self._get_conn()
+        row = conn.execute(
+            "SELECT payload FROM threat_explanations WHERE threat_id = ? AND model_version = ?",
+            (threat_id, model_version)
+        ).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def delete_stale_explanations(self, model_version):
+        """Drop explanations computed by any other model version"""
+        conn = self._get_conn()
+        with conn:
+            deleted = conn.execute(
+                "DELETE FROM threat_explanations WHERE model_version != ?", (model_version,)
+            ).rowcount
+        conn.close()
+        return deleted
+
+    def max_threat_id(self):
+        """Highest threat id (0 for an empty table); the data watermark"""
+        conn = self._get_conn()
+        row = conn.execute("SELECT MAX(id) FROM threats").fetchone()
+        conn.close()
+        return row[0] or 0
+
+    def refresh_rollups(self):
+        """Fold threats added since the last call into threat_daily; returns rows rolled up"""
+        conn = self._get_conn()
+        try:
+            # IMMEDIATE: one worker at a time, and no insert can land mid-rollup
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'daily'").fetchone()
+            last = row[0] if row else 0
+            top = conn.execute("SELECT MAX(id) FROM threats").fetchone()[0] or 0
+            if top <= last:
+                conn.rollback()
+                return 0
+            rolled = conn.execute(
+                "SELECT COUNT(*) FROM threats WHERE id > ? AND id <= ?", (last, top)
+            ).fetchone()[0]
+            conn.execute('''
+                INSERT INTO threat_daily
+                SELECT substr(timestamp, 1, 10), COUNT(*), SUM(prediction = 1),
+                       SUM(severity = 'critical'), SUM(severity = 'warning'),
+                       TOTAL(confidence), MAX(id)
+                FROM threats WHERE id > ? AND id <= ?
+                GROUP BY 1
+                ON CONFLICT(day) DO UPDATE SET
+                    total = total + excluded.total,
+                    threats = threats + excluded.threats,
+                    critical = critical + excluded.critical,
+                    warning = warning + excluded.warning,
+                    confidence_sum = confidence_sum + excluded.confidence_sum,
+                    max_id = MAX(max_id, excluded.max_id)
+            ''', (last, top))
+            conn.execute("INSERT OR REPLACE INTO rollup_state VALUES ('daily', ?)", (top,))
+            conn.commit()
+            return rolled
+        finally:
+            conn.close()
+
+    def get_rollups(self, start_day, end_day, bucket_chars=10):
+        """Rolled-up counts between two YYYY-MM-DD days (inclusive)
+
+        bucket_chars: 10 groups by day, 7 by month
+        """
+        conn = self._get_conn()
+        rows = conn.execute('''
+            SELECT substr(day, 1, ?) AS bucket, SUM(total), SUM(threats), SUM(critical),
+                   SUM(warning), SUM(confidence_sum), MAX(max_id)
+            FROM threat_daily WHERE day BETWEEN ? AND ?
+            GROUP BY bucket ORDER BY bucket
+        ''', (bucket_chars, start_day, end_day)).fetchall()
+        conn.close()
+        return [
+            {"bucket": b, "total": total, "threats": threats, "critical": critical,
+             "warning": warning, "avg_confidence": conf / total if total else 0.0, "max_id": max_id}
+            for b, total, threats, critical, warning, conf, max_id in rows
+        ]
+
+    def top_sources(self, start_day, end_day, limit=10):
+        """Source IPs with the most threats between two days (inclusive)"""
+        conn = self._get_conn()
+        rows = conn.execute('''
+            SELECT source_ip, SUM(prediction = 1) AS hits, COUNT(*), MAX(confidence)
+            FROM threats WHERE timestamp >= ? AND timestamp < ?
+            GROUP BY source_ip HAVING hits > 0
+            ORDER BY hits DESC, source_ip LIMIT ?
+        ''', (start_day, end_day + "~", limit)).fetchall()  # "~" sorts after any time suffix
+        conn.close()
+        return [{"source_ip": ip, "threats": hits, "total": total, "max_confidence": conf}
+                for ip, hits, total, conf in rows]
+
+    def get_threats_after(self, last_id, limit=1000):
+        """Threats with id > last_id, oldest first (primary-key range scan)"""
+        conn = self._get_conn()
+        cur = conn.execute("SELECT * FROM threats WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit))
+        columns = [c[0] for c in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        conn.close()
+        return rows
+
+    def get_threats_by_ids(self, ids):
+        """Threat rows for these ids, in the given order (missing ids skipped)"""
+        if not ids:
+            return []
+        conn = self._get_conn()
+        cur = conn.execute(f"SELECT * FROM threats WHERE id IN ({','.join('?' * len(ids))})", list(ids))
+        columns = [c[0] for c in cur.description]
+        rows = {row[0]: dict(zip(columns, row)) for row in cur.fetchall()}
+        conn.close()
+        return [rows[i] for i in ids if i in rows]
+
+    # --- re-scoring (app/rescoring.py) ----------------------------------------
+
+    def get_rescore_job(self, job_id=None, model_version=None, signature=None):
+        """A re-scoring job by id, else the newest one (for a bundle and feature set if given)"""
+        where, args = [], []
+        for column, value in (("id", job_id), ("model_version", model_version), ("signature", signature)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        conn = self._get_conn()
+        cur = conn.execute("SELECT * FROM rescore_jobs" + (f" WHERE {' AND '.join(where)}" if where else "")
+                           + " ORDER BY id DESC LIMIT 1", args)
+        columns = [c[0] for c in cur.description]
+        row = cur.fetchone()
+        conn.close()
+        return dict(zip(columns, row)) if row else None
+
+    def create_rescore_job(self, model_version, signature, total):
+        now = datetime.now().isoformat()
+        conn = self._get_conn()
+        with conn:
+            cur = conn.execute('''
+                INSERT INTO rescore_jobs (model_version, signature, status, cursor, total, rescored, changed,
+                                          started_at, updated_at)
+                VALUES (?, ?, 'pending', 0, ?, 0, 0, ?, ?)
+            ''', (model_version, signature, total, now, now))
+        conn.close()
+        return cur.lastrowid
+
+    def claim_rescore_job(self, job_id, owner, stale_before, total):
+        """Mark a job running under this owner unless a live runner (heartbeat after
+        stale_before) holds it; total grows to the vectors stored by now"""
+        conn = self._get_conn()
+        with conn:
+            cur = conn.execute('''
+                UPDATE rescore_jobs SET status = 'running', owner = ?, heartbeat = ?, error = NULL,
+                                        total = MAX(total, ?), updated_at = ?
+                WHERE id = ? AND status != 'done'
+                  AND (owner IS NULL OR owner = ? OR heartbeat < ?)
+            ''', (owner, time.time(), total, datetime.now().isoformat(), job_id, owner, stale_before))
+        conn.close()
+        return cur.rowcount == 1
+
+    def release_rescore_job(self, job_id, owner, status, error=None):
+        """Leave a job in status (done, paused, failed) if this owner still holds it"""
+        conn = self._get_conn()
+        with conn:
+            conn.execute('''
+                UPDATE rescore_jobs SET status = ?, owner = NULL, error = ?, updated_at = ?
+                WHERE id = ? AND owner = ?
+            ''', (status, error, datetime.now().isoformat(), job_id, owner))
+        conn.close()
+
+    def pause_rescore_job(self, job_id):
+        """Ask the runner to stop after its current batch (it releases the job)"""
+        conn = self._get_conn()
+        with conn:
+            cur = conn.execute("UPDATE rescore_jobs SET status = 'pausing' WHERE id = ? AND status = 'running'",
+                               (job_id,))
+        conn.close()
+        return cur.rowcount == 1
+
+    def apply_rescores(self, job_id, owner, model_version, rows, cursor):
+        """Write one batch of new scores and the job's cursor in a single transaction
+
+        rows: (id, prediction, confidence, severity, label). Rows already scored by
+        model_version are left alone. threat_daily rollups get the difference between
+        old and new values, so range reports stay exact. Returns rows whose prediction
+        or severity changed, or None (nothing written) if the job was paused or taken over.
+        """
+        conn = self._get_conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            job = conn.execute("SELECT status, owner FROM rescore_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job != ("running", owner):
+                conn.rollback()
+                return None
+            conn.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS rescore_batch (
+                    id INTEGER PRIMARY KEY, prediction INTEGER, confidence REAL, severity TEXT, label TEXT
+                )
+            ''')
+            conn.execute("DELETE FROM rescore_batch")
+            conn.executemany("INSERT OR REPLACE INTO rescore_batch VALUES (?, ?, ?, ?, ?)", rows)
+            
+            rolled = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'daily'").fetchone()
+            conn.execute('''
+                UPDATE threat_daily SET threats = threats + d.d_threats, critical = critical + d.d_critical,
+                                        warning = warning + d.d_warning,
+                                        confidence_sum = confidence_sum + d.d_confidence
+                FROM (
+                    SELECT substr(t.timestamp, 1, 10) AS day,
+                           SUM(b.prediction = 1) - SUM(t.prediction = 1) AS d_threats,
+                           SUM(b.severity = 'critical') - SUM(t.severity = 'critical') AS d_critical,
+                           SUM(b.severity = 'warning') - SUM(t.severity = 'warning') AS d_warning,
+                           TOTAL(b.confidence) - TOTAL(t.confidence) AS d_confidence
+                    FROM rescore_batch b JOIN threats t ON t.id = b.id
+                    WHERE t.id <= ? AND t.model_version IS NOT ?
+                    GROUP BY 1
+                ) AS d
+                WHERE threat_daily.day = d.day
+            ''', (rolled[0] if rolled else 0, model_version))
+            changed = conn.execute('''
+                SELECT COUNT(*) FROM rescore_batch b JOIN threats t ON t.id = b.id
+                WHERE t.model_version IS NOT ? AND (t.prediction IS NOT b.prediction OR t.severity IS NOT b.severity)
+            ''', (model_version,)).fetchone()[0]
+            # Only rows labelled by their verdict change label; touching attack_type re-indexes FTS
+            conn.execute('''
+                UPDATE threats SET attack_type = b.label FROM rescore_batch b
+                WHERE threats.id = b.id AND threats.model_version IS NOT ?
+                  AND threats.attack_type IN ('Malware', 'Normal') AND threats.attack_type != b.label
+            ''', (model_version,))
+            conn.execute('''
+                UPDATE threats SET prediction = b.prediction, confidence = b.confidence, severity = b.severity,
+                                   threat_type = b.prediction, model_version = ?
+                FROM rescore_batch b WHERE threats.id = b.id AND threats.model_version IS NOT ?
+            ''', (model_version, model_version))
+            conn.execute('''
+                UPDATE rescore_jobs SET cursor = ?, rescored = rescored + ?, changed = changed + ?,
+                                        heartbeat = ?, updated_at = ?
+                WHERE id = ?
+            ''', (cursor, len(rows), changed, time.time(), datetime.now().isoformat(), job_id))
+            self._bump(conn, 'threats')
+            self._bump(conn, 'history')
+            conn.commit()
+            return changed
+        finally:
+            conn.close()
+
+    def get_totals(self, day):
+        """Running totals up to a fixed last_id, for the live stream to update incrementally"""
+        conn = self._get_conn()
+        history = conn.execute("SELECT value FROM generation WHERE name = 'history'").fetchone()[0]
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM threats").fetchone()[0]
+        records, threats, benign, critical, warning, confidence_sum = conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(prediction = 1), 0), COALESCE(SUM(prediction = 0), 0),
+                   COALESCE(SUM(severity = 'critical'), 0), COALESCE(SUM(severity = 'warning'), 0),
+                   COALESCE(SUM(confidence), 0.0)
+            FROM threats WHERE id <= ?
+        ''', (last_id,)).fetchone()
+        threats_today = conn.execute(
+            "SELECT COUNT(*) FROM threats WHERE prediction = 1 AND timestamp >= ? AND timestamp < ? AND id <= ?",
+            (day, day + "~", last_id)  # "~" sorts after any time suffix
+        ).fetchone()[0]
+        conn.close()
+        return {
+            "records": records,
+            "total_threats": threats,
+            "total_benign": benign,
+            "threats_today": threats_today,
+            "critical": critical,
+            "warning": warning,
+            "confidence_sum": confidence_sum,
+            "last_id": last_id,
+            "history": history,
+            "day": day
+        }
+
+    def search_threats(self, text=None, severities=None, attack_types=None, source_ip=None, ip_range=None,
+                       start=None, end=None, min_confidence=None, max_confidence=None, before_id=None, limit=50):
+        """Threats matching every given filter, newest first, one keyset page
+
+        text: words matched in attack_type/source_ip through FTS5 (a trailing * matches a prefix)
+        ip_range: (first, last) IPv4 addresses as integers, e.g. from a CIDR block
+        start/end: ISO timestamps, end exclusive
+        before_id: next_cursor of the previous page
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        """
+        # Range filters: (indexed column, clause, params)
+        ranges = []
+        if ip_range is not None:
+            ranges.append(("source_ip_int", "{t}source_ip_int BETWEEN ? AND ?", list(ip_range)))
+        bounds = [("timestamp", ">=", start), ("timestamp", "<", end),
+                  ("confidence", ">=", min_confidence), ("confidence", "<=", max_confidence)]
+        for column in ("timestamp", "confidence"):
+            given = [(op, value) for c, op, value in bounds if c == column and value not in (None, "")]
+            if given:
+                ranges.append((column, " AND ".join(f"{{t}}{column} {op} ?" for op, _ in given),
+                               [value for _, value in given]))
+        filters = []
+        if source_ip is not None:
+            filters.append(("t.source_ip = ?", [source_ip]))
+
+        # Each severity (else attack type) is its own branch: with the (column, id)
+        # indexes every branch is read in id order and stops at the page size
+        lists = [(column, values) for column, values in (("severity", severities), ("attack_type", attack_types))
+                 if values]
+        branches = [[]]
+        if lists:
+            column, values = lists.pop(0)
+            branches = [[(f"t.{column} = ?", [value])] for value in values]
+        for column, values in lists:
+            filters.append((f"t.{column} IN ({','.join('?' * len(values))})", list(values)))
+
+        conn = self._get_conn()
+        try:
+            # Walking id order stops at the page size but only finds matches
+            # quickly when they are common and recent; a narrow range reads its
+            # index and sorts instead, as does any range once the walk has used
+            # up scan_steps. A unary + keeps SQLite off the other range indexes.
+            narrow, narrowest = self._probe_ranges(conn, ranges) if ranges and not text else (False, None)
+            
+            def run(index):
+                clauses = [(clause.format(t="t." if column == index else "+t."), params)
+                           for column, clause, params in ranges]
+                return self._search(conn, text, filters + clauses, branches, before_id, limit,
+                                    f"idx_threats_{index}" if index else None)
+            
+            if narrow or narrowest is None:
+                rows = run(narrowest)
+            else:
+                ticks = itertools.count(1)  # Handler runs every 1000 steps; True interrupts
+                conn.set_progress_handler(lambda: next(ticks) * 1000 > config.SEARCH["scan_steps"], 1000)
+                try:
+                    rows = run(None)
+                except sqlite3.OperationalError as e:
+                    if "interrupted" not in str(e):
+                        raise
+                    rows = None
+                conn.set_progress_handler(None, 0)
+                if rows is None:
+                    rows = run(narrowest)
+        finally:
+            conn.close()
+        next_cursor = rows[-1]["id"] if len(rows) == limit else None
+        return rows, next_cursor
+
+    @staticmethod
+    def _probe_ranges(conn, ranges):
+        """(narrow, column): the range filter matching the fewest rows, counted up to
+        range_probe_rows, and whether it stays under that"""
+        cap = config.SEARCH["range_probe_rows"]
+        best, best_count = None, None
+        for column, clause, params in ranges:
+            count = conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM threats INDEXED BY idx_threats_{column} "
+                f"WHERE {clause.format(t='')} LIMIT ?)",
+                params + [cap]
+            ).fetchone()[0]
+            if best_count is None or count < best_count:
+                best, best_count = column, count
+        return best_count < cap, best
+
+    @staticmethod
+    def _search(conn, text, filters, branches, before_id, limit, index=None):
+        where = [clause for clause, _ in filters]
+        params = [value for _, values in filters for value in values]
+        if text:
+            # FTS5 drives the join and walks its own rowids newest first
+            source, key = "threats_fts f CROSS JOIN threats t ON t.id = f.rowid", "f.rowid"
+            where.insert(0, "threats_fts MATCH ?")
+            params.insert(0, _fts_query(text))
+        else:
+            source, key = "threats t" + (f" INDEXED BY {index}" if index else ""), "t.id"
+        if before_id is not None:
+            where.append(f"{key} < ?")
+            params.append(before_id)
+
+        selects, args = [], []
+        for branch in branches:
+            clauses = where + [clause for clause, _ in branch]
+            selects.append(f"SELECT t.* FROM {source}" + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+                           + f" ORDER BY {key} DESC LIMIT ?")
+            args += params + [value for _, values in branch for value in values] + [limit]
+        if len(selects) == 1:
+            sql = selects[0]
+        else:
+            sql = ("SELECT * FROM (" + " UNION ALL ".join(f"SELECT * FROM ({q})" for q in selects)
+                   + ") ORDER BY id DESC LIMIT ?")
+            args.append(limit)
+        cur = conn.execute(sql, args)
+        columns = [c[0] for c in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
 
     def get_recent_threats(self, limit=50):
         """Get recent threats"""
@@ -67,6 +681,7 @@ class Database:
         
         # Total threats (prediction = 1)
         total_threats = conn.execute("SELECT COUNT(*) FROM threats WHERE prediction = 1").fetchone()[0]
+        total_benign = conn.execute("SELECT COUNT(*) FROM threats WHERE prediction = 0").fetchone()[0]
         
         # Threats today
         today = datetime.now().strftime('%Y-%m-%d')
@@ -82,6 +697,7 @@ class Database:
         
         return {
             "total_threats": total_threats,
+            "total_benign": total_benign,
             "threats_today": threats_today,
             "model_accuracy": 0.94, # Static for now as we don't have labeled feedback
             "avg_confidence": avg_confidence
@@ -0,0 +1,172 @@
+"""
+Explanation Store
+Threats written at warning/critical severity are explained in batches by a
+background thread and stored packed (ThreatExplainer.pack, ~200 bytes) in
+the threat_explanations table. Reads go through a bounded LRU cache of the
+packed rows in front of that table. Both are keyed by the model bundle
+version, so loading a new bundle invalidates every cached and stored
+explanation.
+"""
+import os
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ExplanationStore:
+    """Background explanation worker plus cache for flagged threats"""
+
+    def __init__(self, detector, db, settings: Dict = None):
+        self.detector = detector
+        self.db = db
+        self.settings = settings or config.EXPLAIN_STORE
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._pending = set()  # Queued or being explained
+        self._version = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    # --- writes ------------------------------------------------------------
+
+    def on_threat(self, threat_id: int, data: Dict):
+        """Database listener: store or queue explanations for flagged threats"""
+        if data.get("severity") not in self.settings["severities"]:
+            return
+        if data.get("explanation") is not None:
+            # Already computed on the request path (?explain=true)
+            self._store([(threat_id, data["explanation"])], self.detector.model_version)
+            return
+        if data.get("features") is None:
+            return
+        self._enqueue(threat_id, data["features"])
+
+    def on_threats(self, ids: np.ndarray, columns: Dict):
+        """Batch listener (db.add_threats): queue the batch's warning/critical rows"""
+        if columns.get("explanation") is not None:
+            for threat_id, data in zip(ids.tolist(), self.db.rows(columns, len(ids))):
+                self.on_threat(threat_id, data)
+            return
+        if columns.get("features") is None:
+            return
+        wanted = np.isin(np.broadcast_to(np.asarray(columns.get("severity")), np.shape(ids)), self.settings["severities"])
+        for threat_id, features in zip(np.asarray(ids)[wanted].tolist(), np.asarray(columns["features"])[wanted]):
+            self._enqueue(threat_id, features)
+
+    def _enqueue(self, threat_id: int, features):
+        self._ensure_worker()
+        # Pending before it is queued: the worker may finish (and discard the id) before put returns
+        with self._lock:
+            self._pending.add(threat_id)
+        try:
+            self._queue.put_nowait((threat_id, np.asarray(features, dtype=np.float64).ravel()))
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(threat_id)
+            metrics.inc("explanations_dropped_total")
+
+    def _store(self, rows, version: str):
+        explainer = self.detector.explainer
+        packed = [(threat_id, explainer.pack(explanation)) for threat_id, explanation in rows]
+        self.db.save_explanations([(threat_id, version, blob) for threat_id, blob in packed])
+        if version == self._current_version():
+            with self._lock:
+                for threat_id, blob in packed:
+                    self._remember(threat_id, blob)
+
+    # --- reads -------------------------------------------------------------
+
+    def get(self, threat_id: int) -> Tuple[str, Optional[Dict]]:
+        """("ready", explanation), ("pending", None) or ("missing", None)"""
+        version = self._current_version()
+        with self._lock:
+            blob = self._cache.get(threat_id)
+            if blob is not None:
+                self._cache.move_to_end(threat_id)
+        if blob is None:
+            blob = self.db.get_explanation(threat_id, version)
+            if blob is not None:
+                with self._lock:
+                    self._remember(threat_id, blob)
+        metrics.inc("explanation_cache_total", result="hit" if blob is not None else "miss")
+        if blob is not None:
+            return "ready", self.detector.explainer.unpack(blob)
+        with self._lock:
+            pending = threat_id in self._pending
+        return ("pending" if pending else "missing"), None
+
+    def _remember(self, threat_id: int, blob: bytes):
+        # Caller holds the lock
+        self._cache[threat_id] = blob
+        self._cache.move_to_end(threat_id)
+        while len(self._cache) > self.settings["cache_size"]:
+            self._cache.popitem(last=False)
+
+    def _current_version(self) -> Optional[str]:
+        """Model bundle version; a change clears the cache and purges stored rows"""
+        version = self.detector.model_version
+        if version != self._version:
+            with self._lock:
+                if version == self._version:
+                    return version
+                self._cache.clear()
+                self._version = version
+            if version is not None:
+                deleted = self.db.delete_stale_explanations(version)
+                if deleted:
+                    logger.info(f"🧹 Dropped {deleted} explanations from older model bundles")
+        return version
+
+    # --- worker ------------------------------------------------------------
+
+    def _ensure_worker(self):
+        """Start the worker thread in this process (again after a fork)"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # A forked child must not share the parent's queue
+                self._queue = queue.Queue(maxsize=self.settings["queue_size"])
+                self._pending.clear()
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="explanation-worker")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.settings["batch_size"]:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._explain(batch)
+            except Exception as e:
+                logger.warning(f"⚠️ Background explanation failed for {len(batch)} threats: {e}")
+            finally:
+                with self._lock:
+                    self._pending.difference_update(threat_id for threat_id, _ in batch)
+
+    def _explain(self, batch):
+        n_features = len(self.detector.feature_names)
+        batch = [(threat_id, x) for threat_id, x in batch if len(x) == n_features]
+        if not batch:
+            return
+        version = self.detector.model_version
+        X = np.vstack([x for _, x in batch])
+        result = self.detector.explain(X, self.settings["top_k"], budget_ms=float("inf"))
+        self._store(zip([threat_id for threat_id, _ in batch], result["explanations"]), version)
+        metrics.inc("explanations_computed_total", len(batch))
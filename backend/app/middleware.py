@@ -3,9 +3,13 @@ Request/Response Middleware
 """
 
 import logging
+import time
 from functools import wraps
 from flask import request, jsonify
 
+from utils.metrics import metrics
+from utils.profiling import profiler
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,4 +20,48 @@ def validate_json(f):
         if not request.is_json:
             return jsonify({'error': 'Invalid JSON'}), 400
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+# (route, method, status) → (latency histogram, request counter)
+_request_series = {}
+
+
+def record_request(route: str, method: str, status: int, seconds: float):
+    """Per-request instrumentation hot path (benchmarks/bench_metrics.py keeps it in budget)"""
+    key = (route, method, status)
+    series = _request_series.get(key)
+    if series is None:
+        series = _request_series[key] = (
+            metrics.histogram("http_request_seconds", route=route, method=method),
+            metrics.counter("http_requests_total", route=route, method=method, status=str(status)),
+        )
+    series[0].observe(seconds)
+    series[1].inc()
+    metrics.maybe_flush()
+
+
+def init_instrumentation(app):
+    """Count and time every request into http_requests_total / http_request_seconds,
+    and hand requests to the profiler while an admin profiling session runs"""
+    
+    # One context-proxy lookup per hook: each request/g access costs about a µs
+    @app.before_request
+    def start_timer():
+        req = request._get_current_object()
+        req.environ["ehr.request_start"] = time.perf_counter()
+        token = profiler.begin_request(req.method, req.url_rule)
+        if token is not None:
+            req.environ["ehr.profile"] = token
+    
+    @app.after_request
+    def record(response):
+        req = request._get_current_object()
+        token = req.environ.pop("ehr.profile", None)
+        if token is not None:
+            profiler.end_request(token)
+        start = req.environ.pop("ehr.request_start", None)
+        if start is not None:
+            route = req.url_rule.rule if req.url_rule else "unmatched"
+            record_request(route, req.method, response.status_code, time.perf_counter() - start)
+        return response
@@ -0,0 +1,140 @@
+"""
+Binary Batch Payloads
+/api/threats/batch takes the feature matrix as raw .npy, Arrow IPC or Parquet
+as well as JSON, picked by Content-Type, and answers in the request's format
+(or the one named by Accept). A C-ordered float64 .npy body, or an Arrow
+stream with one fixed-size-list column, is used in place as a read-only view
+of the request bytes. Arrow and Parquet tables with one column per feature
+are stacked into the matrix with a single copy, in the bundle's feature order
+when every feature name is present.
+
+Arrow and Parquet need pyarrow, which is optional: without it those content
+types are answered with 415.
+"""
+import io
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+NPY = "application/x-npy"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+JSON = "application/json"
+
+FORMATS = {NPY: "npy", ARROW: "arrow", PARQUET: "parquet", JSON: "json"}
+MEDIA_TYPES = {fmt: media_type for media_type, fmt in FORMATS.items()}
+
+_NPY_HEADERS = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+
+
+class UnsupportedPayload(ValueError):
+    """A body format this server cannot read or write (answered with 415)"""
+
+
+def request_format(mimetype: Optional[str]) -> str:
+    """Format of a request body from its Content-Type (JSON when absent or unknown)"""
+    return FORMATS.get((mimetype or "").lower(), "json")
+
+
+def response_format(accept, requested: str) -> str:
+    """The best format named outright by the Accept header (wildcards do not count),
+    else the request's own format"""
+    for media_type, quality in accept or ():
+        if quality > 0 and media_type.lower() in FORMATS:
+            return FORMATS[media_type.lower()]
+    return requested
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise UnsupportedPayload("Arrow and Parquet bodies need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+# --- decoding --------------------------------------------------------------
+
+def decode_matrix(body: bytes, fmt: str, feature_names: Sequence[str] = None) -> np.ndarray:
+    """2-D float64 feature matrix from a binary request body"""
+    if fmt == "npy":
+        X = _decode_npy(body)
+    elif fmt in ("arrow", "parquet"):
+        pa = _pyarrow()
+        if fmt == "arrow":
+            table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        else:
+            table = pa.parquet.read_table(pa.BufferReader(body))
+        X = _table_matrix(table, feature_names)
+    else:
+        raise UnsupportedPayload(f"Unsupported body format: {fmt}")
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.ndim != 2:
+        raise ValueError(f"Expected a 2-D feature matrix, got shape {X.shape}")
+    return X.astype(np.float64, copy=False)
+
+
+def _decode_npy(body: bytes) -> np.ndarray:
+    """View of an .npy body without copying the data (no pickled objects)"""
+    f = io.BytesIO(body)
+    version = np.lib.format.read_magic(f)
+    read_header = _NPY_HEADERS.get(version)
+    if read_header is None:  # Rare newer header: np.load copies, but still refuses pickles
+        return np.load(io.BytesIO(body), allow_pickle=False)
+    shape, fortran_order, dtype = read_header(f)
+    if dtype.kind not in "biuf":
+        raise ValueError(f"Feature matrix must be numeric, got dtype {dtype}")
+    count = int(np.prod(shape))
+    X = np.frombuffer(body, dtype=dtype, count=count, offset=f.tell())
+    return X.reshape(shape, order="F" if fortran_order else "C")
+
+
+def _table_matrix(table, feature_names: Sequence[str] = None) -> np.ndarray:
+    """Rows x features from an Arrow table: one fixed-size-list column, or a column per feature"""
+    pa = _pyarrow()
+    if table.num_columns == 1 and pa.types.is_fixed_size_list(table.schema.field(0).type):
+        width = table.schema.field(0).type.list_size
+        column = table.column(0).combine_chunks()  # No copy for a single chunk
+        if column.null_count:
+            raise ValueError("Feature rows must not be null")
+        return column.flatten().to_numpy(zero_copy_only=False).reshape(-1, width)
+    names = table.column_names
+    if feature_names and set(feature_names) <= set(names):
+        names = list(feature_names)
+    columns = [table.column(name) for name in names]
+    for name, column in zip(names, columns):
+        if not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+            raise ValueError(f"Column {name!r} is not numeric ({column.type})")
+    # Nulls become NaN and are imputed by the detector's transform
+    X = np.empty((table.num_rows, len(columns)), dtype=np.float64)
+    for j, column in enumerate(columns):
+        X[:, j] = column.to_numpy()
+    return X
+
+
+# --- encoding --------------------------------------------------------------
+
+def encode_columns(columns: Dict[str, np.ndarray], fmt: str, metadata: Dict[str, str] = None) -> bytes:
+    """Response body holding equal-length result columns (npy: one structured array)"""
+    if fmt == "npy":
+        records = np.empty(len(next(iter(columns.values()))),
+                           dtype=[(name, values.dtype) for name, values in columns.items()])
+        for name, values in columns.items():
+            records[name] = values
+        out = io.BytesIO()
+        np.save(out, records, allow_pickle=False)
+        return out.getvalue()
+    if fmt in ("arrow", "parquet"):
+        pa = _pyarrow()
+        table = pa.table(columns).replace_schema_metadata(metadata or {})
+        sink = pa.BufferOutputStream()
+        if fmt == "arrow":
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pa.parquet.write_table(table, sink)
+        return sink.getvalue().to_pybytes()
+    raise UnsupportedPayload(f"Unsupported body format: {fmt}")
@@ -0,0 +1,326 @@
+"""
+Report Snapshots
+PDF reports are rendered ahead of time and kept in REPORTS_DIR, named after
+the data watermark they were built from: the highest threat id plus the model
+bundle version. A background thread re-renders the live report whenever the
+watermark moves, so a download is a file send. Range reports are built from
+the threat_daily rollup table (one row per day), not from the threat rows.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from io import BytesIO
+from pathlib import Path
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+
+import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ID = re.compile(r"^(live|range)-[\w.-]+$")
+
+HEADER_STYLE = [
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+]
+
+
+# --- rendering ---------------------------------------------------------------
+
+def _document(title: str, watermark: str):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+    styles = getSampleStyleSheet()
+    elements = [
+        Paragraph(title, styles["Heading1"]),
+        Spacer(1, 12),
+        Paragraph(f"Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]),
+        Paragraph(f"Data watermark: {watermark}", styles["Normal"]),
+        Spacer(1, 24),
+    ]
+    return buffer, doc, styles, elements
+
+
+def render_live(stats: Dict, threats: List[Dict], watermark: str) -> bytes:
+    """System overview plus the last 10 threats"""
+    buffer, doc, styles, elements = _document("EHR Anomaly Detection System - Security Report", watermark)
+
+    elements.append(Paragraph("System Health Overview", styles["Heading2"]))
+    elements.append(Spacer(1, 12))
+    stats_data = [
+        ["Metric", "Value"],
+        ["System Status", "Operational"],
+        ["Total Threats Detected", str(stats.get('total_threats', 0))],
+        ["Threats Today", str(stats.get('threats_today', 0))],
+        ["Model Accuracy", f"{stats.get('model_accuracy', 0)*100:.1f}%"],
+        ["Avg. Confidence Score", f"{stats.get('avg_confidence', 0)*100:.1f}%"]
+    ]
+    t = Table(stats_data, colWidths=[200, 200])
+    t.setStyle(TableStyle(HEADER_STYLE + [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.navy),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(t)
+    elements.append(Spacer(1, 24))
+
+    elements.append(Paragraph("Recent Critical Alerts (Last 10)", styles["Heading2"]))
+    elements.append(Spacer(1, 12))
+    if threats:
+        threat_data = [["ID", "Time", "Type", "Risk", "Source IP"]]
+        for row in threats:
+            threat_data.append([
+                str(row.get('id', '')),
+                str(row.get('timestamp', '')[:19]),  # Truncate microseconds
+                "THREAT" if row.get('threat_type') == 1 else "Safe",
+                f"{row.get('confidence', 0)*100:.0f}%",
+                row.get('source_ip', 'Unknown')
+            ])
+        t2 = Table(threat_data, colWidths=[40, 140, 80, 60, 120])
+        t2.setStyle(TableStyle(HEADER_STYLE + [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
+        ]))
+        elements.append(t2)
+    else:
+        elements.append(Paragraph("No recent threats recorded.", styles["Normal"]))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_range(start: str, end: str, buckets: List[Dict], sources: List[Dict], watermark: str) -> bytes:
+    """Totals, a per-day (or per-month) table and the top source IPs for a period"""
+    buffer, doc, styles, elements = _document(f"EHR Security Report: {start} to {end}", watermark)
+
+    total = sum(b["total"] for b in buckets)
+    threats = sum(b["threats"] for b in buckets)
+    confidence = sum(b["avg_confidence"] * b["total"] for b in buckets)
+    summary = [
+        ["Metric", "Value"],
+        ["Records Scored", str(total)],
+        ["Threats Detected", str(threats)],
+        ["Critical / Warning", f"{sum(b['critical'] for b in buckets)} / {sum(b['warning'] for b in buckets)}"],
+        ["Avg. Confidence Score", f"{(confidence / total if total else 0)*100:.1f}%"]
+    ]
+    t = Table(summary, colWidths=[200, 200])
+    t.setStyle(TableStyle(HEADER_STYLE + [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.navy),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements += [t, Spacer(1, 24)]
+
+    period = "Month" if buckets and len(buckets[0]["bucket"]) == 7 else "Day"
+    elements += [Paragraph(f"Activity by {period}", styles["Heading2"]), Spacer(1, 12)]
+    if buckets:
+        data = [[period, "Scored", "Threats", "Critical", "Warning", "Avg. Conf."]]
+        data += [[b["bucket"], str(b["total"]), str(b["threats"]), str(b["critical"]), str(b["warning"]),
+                  f"{b['avg_confidence']*100:.1f}%"] for b in buckets]
+        t2 = Table(data, colWidths=[90, 70, 70, 70, 70, 80], repeatRows=1)
+        t2.setStyle(TableStyle(HEADER_STYLE + [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.navy),
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
+        ]))
+        elements.append(t2)
+    else:
+        elements.append(Paragraph("No records in this period.", styles["Normal"]))
+    elements.append(Spacer(1, 24))
+
+    if sources:
+        elements += [Paragraph("Top Threat Sources", styles["Heading2"]), Spacer(1, 12)]
+        data = [["Source IP", "Threats", "Scored", "Max Risk"]]
+        data += [[s["source_ip"], str(s["threats"]), str(s["total"]), f"{(s['max_confidence'] or 0)*100:.0f}%"]
+                 for s in sources]
+        t3 = Table(data, colWidths=[160, 80, 80, 80])
+        t3.setStyle(TableStyle(HEADER_STYLE + [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
+        ]))
+        elements.append(t3)
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# --- snapshots ---------------------------------------------------------------
+
+class ReportSnapshots:
+    """Watermark-keyed PDF snapshots on disk plus the scheduler that renders them"""
+
+    def __init__(self, db, detector, folder=None, settings: Dict = None):
+        self.db = db
+        self.detector = detector
+        self.folder = Path(folder or config.REPORTS_DIR)
+        self.settings = settings or config.REPORTS
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _version(self) -> str:
+        # Re-scoring rewrites stored rows without moving the max id, so it counts as a new version
+        history = self.db.generation("history")
+        version = self.detector.model_version or "none"
+        return f"{version}.r{history}" if history else version
+
+    def snapshot(self, report_id: str) -> Optional[Path]:
+        """Path of a stored snapshot, None if it does not exist (or the id is malformed)"""
+        if not SNAPSHOT_ID.match(report_id):
+            return None
+        path = self.folder / f"{report_id}.pdf"
+        return path if path.is_file() else None
+
+    def list(self) -> List[Dict]:
+        if not self.folder.is_dir():
+            return []
+        files = sorted(self.folder.glob("*.pdf"), key=lambda p: p.stat().st_mtime, reverse=True)
+        return [{
+            "id": p.stem,
+            "kind": p.stem.split("-", 1)[0],
+            "size": p.stat().st_size,
+            "created_at": datetime.fromtimestamp(p.stat().st_mtime).isoformat()
+        } for p in files]
+
+    # --- live --------------------------------------------------------------
+
+    def live_id(self) -> str:
+        # Today's date too: "Threats Today" changes at midnight without new rows
+        return f"live-{date.today().isoformat()}-{self.db.max_threat_id()}-{self._version()}"
+
+    def live(self) -> Dict:
+        """The live report for the current watermark, or the newest older one while it renders"""
+        report_id = self.live_id()
+        path = self.snapshot(report_id)
+        if path is not None:
+            metrics.inc("report_snapshots_total", result="hit")
+            return {"id": report_id, "path": path, "stale": False}
+        previous = [s for s in self.list() if s["kind"] == "live"]
+        if previous and self._scheduled():
+            # Serve what we have; the scheduler renders the new watermark now
+            metrics.inc("report_snapshots_total", result="stale")
+            self._wake.set()
+            return {"id": previous[0]["id"], "path": self.folder / f"{previous[0]['id']}.pdf", "stale": True}
+        metrics.inc("report_snapshots_total", result="miss")
+        return {"id": report_id, "path": self._render_live(report_id, wait=True), "stale": False}
+
+    def _render_live(self, report_id: str, wait: bool = False) -> Optional[Path]:
+        stats = self.db.get_stats()
+        threats = self.db.get_recent_threats(10)
+        watermark = report_id.split("-", 4)[-1]
+        return self._write(report_id, lambda: render_live(stats, threats, watermark), "live", wait)
+
+    # --- range -------------------------------------------------------------
+
+    def range(self, start: date, end: date) -> Dict:
+        """Report for [start, end]; reused until a threat in that period is added"""
+        self.db.refresh_rollups()
+        monthly = (end - start).days > self.settings["monthly_after_days"]
+        buckets = self.db.get_rollups(start.isoformat(), end.isoformat(), 7 if monthly else 10)
+        max_id = max((b["max_id"] for b in buckets), default=0)
+        report_id = f"range-{start.isoformat()}-{end.isoformat()}-{max_id}-{self._version()}"
+        path = self.snapshot(report_id)
+        metrics.inc("report_snapshots_total", result="hit" if path else "miss")
+        if path is None:
+            sources = self.db.top_sources(start.isoformat(), end.isoformat(), self.settings["top_sources"])
+            watermark = f"{max_id}-{self._version()}"
+            path = self._write(report_id, lambda: render_range(start.isoformat(), end.isoformat(),
+                                                               buckets, sources, watermark), "range", wait=True)
+        return {"id": report_id, "path": path, "stale": False}
+
+    # --- storage -----------------------------------------------------------
+
+    def _write(self, report_id: str, render, kind: str, wait: bool) -> Optional[Path]:
+        """Render once across workers: a lock file per snapshot id, atomic rename into place
+
+        Returns None if another worker holds the lock and wait is False.
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self.folder / f"{report_id}.pdf"
+        lock = self.folder / f".{report_id}.lock"
+        deadline = time.time() + self.settings["lock_timeout"]
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock.stat().st_mtime > self.settings["lock_timeout"]:
+                        lock.unlink()  # Abandoned by a worker that died mid-render
+                        continue
+                except FileNotFoundError:
+                    continue
+                if not wait or time.time() > deadline:
+                    return None
+                time.sleep(0.05)
+                if path.is_file():
+                    return path
+        try:
+            os.close(fd)
+            if path.is_file():
+                return path
+            with metrics.timer("report_render_seconds", kind=kind):
+                pdf = render()
+            tmp = self.folder / f".{report_id}.{os.getpid()}.tmp"
+            tmp.write_bytes(pdf)
+            os.replace(tmp, path)
+            logger.info(f"📄 Rendered report snapshot {report_id} ({len(pdf) // 1024} KB)")
+        finally:
+            lock.unlink(missing_ok=True)
+        self._prune(kind)
+        return path
+
+    def _prune(self, kind: str):
+        old = [s for s in self.list() if s["kind"] == kind][self.settings["keep"]:]
+        for s in old:
+            (self.folder / f"{s['id']}.pdf").unlink(missing_ok=True)
+
+    # --- scheduler ---------------------------------------------------------
+
+    def _scheduled(self) -> bool:
+        return self.settings["refresh_seconds"] > 0 and self._pid == os.getpid() and self._thread.is_alive()
+
+    def start(self):
+        """Start the render thread in this process (again after a fork)"""
+        if self.settings["refresh_seconds"] <= 0 or self._scheduled():
+            return
+        with self._lock:
+            if self._scheduled():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="report-snapshots")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"⚠️ Report snapshot refresh failed: {e}")
+            self._wake.wait(self.settings["refresh_seconds"])
+            self._wake.clear()
+
+    def refresh(self):
+        """One scheduler tick: roll up new threats, render the live report if its watermark moved"""
+        self.db.refresh_rollups()
+        report_id = self.live_id()
+        if self.snapshot(report_id) is None:
+            self._render_live(report_id)
@@ -0,0 +1,173 @@
+"""
+Re-scoring
+After a retrain, stored threats still carry the old bundle's confidence and
+severity. A re-scoring job streams the feature vectors kept for them
+(ml/similarity.VectorStore) through the loaded bundle in a process pool and
+writes the new scores back in transactional batches, tagging each row with
+the bundle version that produced it.
+
+Jobs are rows in rescore_jobs, one per bundle version and feature set. The
+cursor (a record offset in the vector file) moves in the same transaction
+as each batch, so a job stopped by a pause, a crash or a restart resumes
+where it left off, and rows already scored by the bundle are not rewritten.
+One runner holds a job at a time (a heartbeat lease). Pool processes run at
+a lower priority and the runner caps rows_per_second, so live detection
+keeps the CPU and the database write lock.
+"""
+import os
+import time
+import socket
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+import numpy as np
+
+import config
+from app.results import severities
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LABELS = np.array(["Normal", "Malware"])  # attack_type of /detect rows, by prediction
+
+
+# --- pool processes --------------------------------------------------------
+
+_detector = None
+
+
+def _load(folder: str, nice: int):
+    """Pool initializer: a lower priority, and the bundle loaded once per process"""
+    global _detector
+    try:
+        os.nice(nice)
+    except OSError:
+        pass
+    from ml.detector import AdvancedThreatDetector
+    detector = AdvancedThreatDetector()
+    detector.load(folder)
+    detector.drift = None  # History is not live traffic
+    _detector = detector
+
+
+def _score(path: str, dtype: np.dtype, start: int, stop: int):
+    """(ids, confidence, bundle version) for records [start, stop) of a vector file"""
+    records = np.memmap(path, dtype=dtype, mode="r", offset=start * dtype.itemsize, shape=(stop - start,))
+    confidence = _detector.predict(records["x"].astype(np.float64))["confidence"]
+    return np.array(records["id"]), np.asarray(confidence, dtype=np.float64), _detector.model_version
+
+
+# --- runner ----------------------------------------------------------------
+
+class Rescorer:
+    """Start, pause, resume and report re-scoring jobs for the loaded bundle"""
+
+    def __init__(self, db, store, detector, folder=None, settings: Dict = None):
+        self.db = db
+        self.store = store
+        self.detector = detector
+        self.folder = str(folder or config.MODELS_FOLDER)
+        self.settings = settings or config.RESCORE
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def status(self) -> Optional[Dict]:
+        """The newest job, with its progress"""
+        job = self.db.get_rescore_job()
+        if job is not None:
+            job["progress"] = round(job["cursor"] / job["total"], 4) if job["total"] else 1.0
+        return job
+
+    def start(self, **overrides) -> Dict:
+        """Start (or resume) the loaded bundle's job in a background thread of this process"""
+        settings = {**self.settings, **{k: v for k, v in overrides.items() if v is not None}}
+        with self._lock:
+            if not (self._pid == os.getpid() and self._thread.is_alive()):
+                job = self._job()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self.run, args=(job["id"], settings),
+                                                 daemon=True, name="rescore")
+                self._thread.start()
+        return self.status()
+
+    def pause(self) -> Optional[Dict]:
+        """Stop the running job after its current batch"""
+        job = self.db.get_rescore_job()
+        if job is not None:
+            self.db.pause_rescore_job(job["id"])
+        return self.status()
+
+    def _job(self) -> Dict:
+        version, signature = self.detector.model_version, self.store.signature
+        if version is None or signature is None:
+            raise ValueError("No model bundle loaded")
+        job = self.db.get_rescore_job(model_version=version, signature=signature)
+        if job is None:
+            job = self.db.get_rescore_job(self.db.create_rescore_job(version, signature, self.store.count()))
+        return job
+
+    def run(self, job_id: int = None, settings: Dict = None) -> Dict:
+        """Score the job's remaining rows (blocking) and return its final state;
+        returns at once if another runner holds the job"""
+        s = settings or self.settings
+        job_id = job_id or self._job()["id"]
+        owner = f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        if not self.db.claim_rescore_job(job_id, owner, time.time() - s["lock_timeout"], self.store.count()):
+            logger.info(f"Re-scoring job {job_id} is done or held by another runner")
+            return self.db.get_rescore_job(job_id)
+        status, error = "failed", None
+        try:
+            status = self._run(self.db.get_rescore_job(job_id), owner, s)
+        except Exception as e:
+            error = str(e)
+            logger.warning(f"⚠️ Re-scoring job {job_id} failed: {e}")
+        finally:
+            self.db.release_rescore_job(job_id, owner, status, error)
+        job = self.db.get_rescore_job(job_id)
+        logger.info(f"✅ Re-scoring job {job_id} {status}: {job['rescored']:,} rows, {job['changed']:,} changed")
+        return job
+
+    def _run(self, job: Dict, owner: str, s: Dict) -> str:
+        version, cursor, total = job["model_version"], job["cursor"], job["total"]
+        if cursor >= total:
+            return "done"
+        path, dtype = str(self.store.path), self.store.dtype
+        workers = max(1, s["workers"])
+        started, written = time.monotonic(), 0
+        # spawn: forking a threaded server process can copy held locks into the children
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_load, initargs=(self.folder, s["nice"]))
+        try:
+            pending, next_start = deque(), cursor
+            while pending or next_start < total:
+                while next_start < total and len(pending) <= workers:
+                    stop = min(next_start + s["chunk_rows"], total)
+                    pending.append((next_start, pool.submit(_score, path, dtype, next_start, stop)))
+                    next_start = stop
+                start, future = pending.popleft()
+                ids, confidence, scored_by = future.result()
+                if scored_by != version:
+                    raise RuntimeError(f"Model bundle changed during the job ({scored_by}, expected {version})")
+                prediction = (confidence > 0.5).astype(int)
+                rows = list(zip(ids.tolist(), prediction.tolist(), confidence.tolist(),
+                                severities(confidence).tolist(), LABELS[prediction].tolist()))
+                for offset in range(0, len(rows), s["batch_rows"]):
+                    batch = rows[offset:offset + s["batch_rows"]]
+                    changed = self.db.apply_rescores(job["id"], owner, version, batch, start + offset + len(batch))
+                    if changed is None:
+                        return "paused"
+                    metrics.inc("rescored_rows_total", len(batch))
+                    metrics.inc("rescore_changed_total", changed)
+                    written += len(batch)
+                    if s["rows_per_second"]:
+                        ahead = written / s["rows_per_second"] - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+            return "done"
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
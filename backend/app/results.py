@@ -0,0 +1,64 @@
+"""
+Batch Result Assembly
+Everything a batch route derives from one detector.predict result, with
+array operations only: the severity of every row (config.THREAT_THRESHOLDS),
+the threat count, the predictions_total increments, and the flagged rows as
+columns for db.add_threats. No Python loop runs per row.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+import config
+from utils.metrics import metrics
+
+# Stand-in source addresses for uploads that carry none
+_SIMULATED_IPS = np.array([f"192.168.1.{octet}" for octet in range(100, 255)], dtype=object)
+
+
+def severities(confidence: np.ndarray) -> np.ndarray:
+    """Severity per row: critical / warning above their thresholds, info below"""
+    t = config.THREAT_THRESHOLDS
+    confidence = np.asarray(confidence, dtype=np.float64)
+    return np.select([confidence > t["critical"], confidence > t["warning"]], ["critical", "warning"], "info")
+
+
+def count_severities(confidences: np.ndarray):
+    """Add a batch's predictions to predictions_total by severity"""
+    confidences = np.asarray(confidences, dtype=np.float64)
+    critical = int(np.count_nonzero(confidences > config.THREAT_THRESHOLDS["critical"]))
+    warning = int(np.count_nonzero(confidences > config.THREAT_THRESHOLDS["warning"])) - critical
+    for severity, count in (("critical", critical), ("warning", warning),
+                            ("info", len(confidences) - critical - warning)):
+        if count:
+            metrics.inc("predictions_total", count, severity=severity)
+
+
+def simulated_ips(n: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """n addresses drawn from 192.168.1.100-254"""
+    rng = rng or np.random.default_rng()
+    return _SIMULATED_IPS[rng.integers(0, len(_SIMULATED_IPS), n)]
+
+
+def assemble(result: Dict, X: np.ndarray, threat_label: str, model_version: str = None,
+             source_ips: np.ndarray = None) -> Dict:
+    """Threat count and the flagged rows of a batch as db.add_threats columns
+
+    source_ips gives one address per input row; without it the flagged rows get
+    simulated ones.
+    """
+    prediction = np.asarray(result["prediction"])
+    confidence = np.asarray(result["confidence"], dtype=np.float64)
+    count_severities(confidence)
+    flagged = np.flatnonzero(prediction == 1)
+    records = {
+        "prediction": 1,
+        "confidence": confidence[flagged],
+        "severity": severities(confidence[flagged]),
+        "threat_type": 1,
+        "source_ip": source_ips[flagged] if source_ips is not None else simulated_ips(len(flagged)),
+        "type": threat_label,
+        "features": X[flagged],
+        "model_version": model_version,
+    }
+    return {"threats": len(flagged), "benign": len(prediction) - len(flagged), "records": records}
@@ -0,0 +1,132 @@
+"""
+Prometheus / OpenMetrics Exposition
+GET /metrics renders every metric series, merged across gunicorn workers,
+in the Prometheus text format (or OpenMetrics when the scraper asks for it).
+"""
+from flask import Blueprint, request, Response
+import logging
+from collections import defaultdict
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from utils.metrics import metrics, parse_key, LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+metrics_bp = Blueprint('metrics', __name__)
+
+PREFIX = "ehr_"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+HELP = {
+    "http_request_seconds": "HTTP request latency by route",
+    "http_requests_total": "HTTP requests by route, method and status",
+    "model_inference_seconds": "Per-model scoring time for one predict call",
+    "preprocess_seconds": "Feature transform time for one predict call",
+    "predict_rows": "Rows per predict call (batch size)",
+    "predictions_total": "Predictions by severity",
+    "predict_duplicate_rows_total": "Batch rows scored by reusing an identical row's result",
+    "db_write_seconds": "Latency of one threat insert",
+    "db_batch_write_seconds": "Latency of one bulk threat insert (add_threats)",
+    "serialize_seconds": "Response serialization time by route",
+    "asgi_rejected_total": "Scoring requests answered 503 because the ASGI worker's pool was full",
+    "payload_decode_seconds": "Batch request body decode time by format (json, npy, arrow, parquet)",
+    "model_bundle_info": "Loaded model bundle version",
+    "model_load_seconds": "Time taken to load the model bundle",
+    "model_loaded_timestamp_seconds": "Unix time the model bundle was loaded",
+    "metrics_processes": "Worker processes merged into this scrape",
+    "report_snapshots_total": "Report downloads by snapshot result (hit, stale, miss)",
+    "report_render_seconds": "PDF render time by report kind",
+    "stream_connections_total": "Live stream connections by result (accepted, rejected)",
+    "stream_resyncs_total": "Slow stream clients whose buffer was replaced by a snapshot",
+    "response_cache_total": "Cached read endpoint requests by route and result (hit, miss, not_modified)",
+    "vectors_stored_total": "Threat feature vectors appended to the similarity store",
+    "vectors_build_seconds": "Time to build the similar-threat index",
+    "similar_query_seconds": "Similar-threat lookup time",
+    "rescored_rows_total": "Stored threats re-scored with the loaded bundle",
+    "rescore_changed_total": "Re-scored threats whose prediction or severity changed",
+}
+
+# Latency histograms keep 136 fine buckets internally; every 5th bound
+# (10^(k/4) s) is enough resolution for the scraped series
+EXPOSED_LATENCY_BOUNDS = set(LATENCY_BUCKETS[::5])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict, **extra) -> str:
+    items = sorted(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in items) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _family(name: str, kind: str, openmetrics: bool) -> list:
+    # OpenMetrics names the family without the _total / _info sample suffix
+    family = PREFIX + name
+    if openmetrics and kind == "counter" and family.endswith("_total"):
+        family = family[:-len("_total")]
+    if openmetrics and kind == "info" and family.endswith("_info"):
+        family = family[:-len("_info")]
+    if not openmetrics and kind == "info":
+        kind = "gauge"
+    lines = [f"# HELP {family} {HELP[name]}"] if name in HELP else []
+    lines.append(f"# TYPE {family} {kind}")
+    return lines
+
+
+def render(aggregated: dict, openmetrics: bool = False) -> str:
+    """Exposition text for an aggregate() result"""
+    groups = defaultdict(list)
+    for kind in ("histograms", "counters", "gauges"):
+        for key, value in aggregated[kind].items():
+            name, labels = parse_key(key)
+            groups[(name, kind)].append((labels, value))
+
+    lines = []
+    for (name, kind), series in sorted(groups.items()):
+        metric = PREFIX + name
+        if kind == "histograms":
+            lines += _family(name, "histogram", openmetrics)
+            for labels, h in series:
+                bounds, counts = h["bounds"], h["counts"]
+                coarse = bounds is LATENCY_BUCKETS or bounds == LATENCY_BUCKETS
+                cumulative = 0
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    if coarse and bound not in EXPOSED_LATENCY_BOUNDS:
+                        continue
+                    lines.append(f"{metric}_bucket{_labels(labels, le=repr(float(bound)))} {cumulative}")
+                total = sum(counts)
+                lines.append(f"{metric}_bucket{_labels(labels, le='+Inf')} {total}")
+                lines.append(f"{metric}_count{_labels(labels)} {total}")
+                lines.append(f"{metric}_sum{_labels(labels)} {_number(float(h['sum']))}")
+        elif kind == "counters":
+            lines += _family(name, "counter", openmetrics)
+            lines += [f"{metric}{_labels(labels)} {_number(float(v))}" for labels, v in series]
+        else:
+            lines += _family(name, "info" if name.endswith("_info") else "gauge", openmetrics)
+            lines += [f"{metric}{_labels(labels)} {_number(float(v))}" for labels, v in series]
+
+    lines += _family("metrics_processes", "gauge", openmetrics)
+    lines.append(f"{PREFIX}metrics_processes {aggregated['processes']}")
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def scrape():
+    """Prometheus scrape endpoint"""
+    openmetrics = "application/openmetrics-text" in request.headers.get("Accept", "")
+    body = render(metrics.aggregate(), openmetrics)
+    return Response(body, mimetype=None, content_type=OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
@@ -1,112 +1,112 @@
 """
-Reports Routes - Dynamic PDF Generation
+Reports Routes - PDF Snapshots
+Downloads are served from snapshots rendered by app/reports.py
 """
-from flask import Blueprint, jsonify, send_file
+from flask import Blueprint, jsonify, request, send_file
 import logging
-from io import BytesIO
-from datetime import datetime
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from datetime import date, datetime
 from app.database import db
+from app.reports import ReportSnapshots
+from app.routes.threat_detection import detector
+from utils import prefork
 
 logger = logging.getLogger(__name__)
 reports_bp = Blueprint('reports', __name__, url_prefix='/api/reports')
 
+snapshots = ReportSnapshots(db, detector)
+
+
+@reports_bp.record_once
+def start_scheduler(state):
+    """Render snapshots in the background once the blueprint is served (in each worker when preloaded)"""
+    prefork.in_workers(snapshots.start)
+
+
+def send_snapshot(fetch, download_name, attempts: int = 3):
+    """Serve the snapshot fetch() returns. It is opened before sending, since an open file
+    survives another worker pruning it; one pruned before it could be opened is fetched again."""
+    for _ in range(attempts):
+        snapshot = fetch()
+        if snapshot["path"] is None:
+            return jsonify({"error": "Report is being rendered, retry shortly"}), 503
+        try:
+            pdf = open(snapshot["path"], "rb")
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        raise FileNotFoundError(f"Snapshot {snapshot['id']} was pruned while being served")
+    response = send_file(pdf, mimetype='application/pdf', as_attachment=True,
+                         download_name=download_name, max_age=0)
+    response.headers["X-Report-Id"] = snapshot["id"]
+    response.headers["X-Report-Stale"] = str(snapshot["stale"]).lower()
+    return response
+
+
+def parse_period(body):
+    """(start, end) dates from start/end (YYYY-MM-DD); end defaults to today"""
+    end = date.fromisoformat(body.get('end') or date.today().isoformat())
+    start = date.fromisoformat(body['start'])
+    if start > end:
+        raise ValueError("start must not be after end")
+    return start, end
+
+
+@reports_bp.route('', methods=['GET'])
+def list_reports():
+    """Stored snapshots, newest first"""
+    return jsonify({"reports": snapshots.list()}), 200
+
+
 @reports_bp.route('/live', methods=['GET'])
 def download_live_report():
-    """Generate and download a live PDF report"""
+    """Download the live PDF report (latest snapshot)"""
     try:
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = styles["Heading1"]
-        normal_style = styles["Normal"]
-        
-        elements = []
-        
-        # 1. Header
-        elements.append(Paragraph("EHR Anomaly Detection System - Security Report", title_style))
-        elements.append(Spacer(1, 12))
-        elements.append(Paragraph(f"Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style))
-        elements.append(Spacer(1, 24))
-        
-        # 2. System Statistics
-        stats = db.get_stats()
-        elements.append(Paragraph("System Health Overview", styles["Heading2"]))
-        elements.append(Spacer(1, 12))
-        
-        stats_data = [
-            ["Metric", "Value"],
-            ["System Status", "Operational"],
-            ["Total Threats Detected", str(stats.get('total_threats', 0))],
-            ["Threats Today", str(stats.get('threats_today', 0))],
-            ["Model Accuracy", f"{stats.get('model_accuracy', 0)*100:.1f}%"],
-            ["Avg. Confidence Score", f"{stats.get('avg_confidence', 0)*100:.1f}%"]
-        ]
-        
-        t = Table(stats_data, colWidths=[200, 200])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.navy),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(t)
-        elements.append(Spacer(1, 24))
-        
-        # 3. Recent Threats Table
-        elements.append(Paragraph("Recent Critical Alerts (Last 10)", styles["Heading2"]))
-        elements.append(Spacer(1, 12))
-        
-        threats = db.get_recent_threats(10)
-        if threats:
-            threat_data = [["ID", "Time", "Type", "Risk", "Source IP"]]
-            for t in threats:
-                threat_data.append([
-                    str(t.get('id', '')),
-                    str(t.get('timestamp', '')[:19]), # Truncate microseconds
-                    "THREAT" if t.get('threat_type') == 1 else "Safe",
-                    f"{t.get('confidence', 0)*100:.0f}%",
-                    t.get('source_ip', 'Unknown')
-                ])
-                
-            t2 = Table(threat_data, colWidths=[40, 140, 80, 60, 120])
-            t2.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
-            ]))
-            elements.append(t2)
-        else:
-            elements.append(Paragraph("No recent threats recorded.", normal_style))
-            
-        # Build PDF
-        doc.build(elements)
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'EHR_Security_Report_{datetime.now().strftime("%Y%m%d")}.pdf'
-        )
-        
+        return send_snapshot(snapshots.live, f'EHR_Security_Report_{datetime.now().strftime("%Y%m%d")}.pdf')
+    except Exception as e:
+        logger.error(f"PDF Generation error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@reports_bp.route('/range', methods=['GET'])
+def download_range_report():
+    """Download the report for ?start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    try:
+        start, end = parse_period(request.args)
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"start/end must be YYYY-MM-DD dates: {e}"}), 400
+    try:
+        return send_snapshot(lambda: snapshots.range(start, end),
+                             f'EHR_Security_Report_{start:%Y%m%d}_{end:%Y%m%d}.pdf')
     except Exception as e:
         logger.error(f"PDF Generation error: {e}")
         return jsonify({"error": str(e)}), 500
 
+
+@reports_bp.route('/generate', methods=['POST'])
+def generate_report():
+    """Snapshot a period ({start, end}) or the live report; returns its id"""
+    body = request.get_json(silent=True) or {}
+    try:
+        if body.get('start'):
+            snapshot = snapshots.range(*parse_period(body))
+        else:
+            snapshot = snapshots.live()
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"start/end must be YYYY-MM-DD dates: {e}"}), 400
+    if snapshot["path"] is None:
+        return jsonify({"error": "Report is being rendered, retry shortly"}), 503
+    return jsonify({"id": snapshot["id"], "url": f"/api/reports/{snapshot['id']}"}), 201
+
+
 @reports_bp.route('/<report_id>', methods=['GET'])
 def download_report(report_id):
-    """Legacy endpoint - redirect to live"""
-    return download_live_report()
+    """A stored snapshot by id; any other id gets the live report"""
+    path = snapshots.snapshot(report_id)
+    if path is None:
+        return download_live_report()
+    try:
+        return send_snapshot(lambda: {"id": report_id, "path": path, "stale": False}, f'EHR_{report_id}.pdf',
+                             attempts=1)
+    except FileNotFoundError:
+        return download_live_report()  # Pruned since it was looked up
@@ -5,16 +5,27 @@ Threat Detection API Routes
   - Correct probability indexing
   - Proper JSON responses
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 import logging
 import numpy as np
 import pandas as pd
-import io
+import ipaddress
 from pathlib import Path
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from ml.detector import AdvancedThreatDetector
+from ml.streaming import StreamingDetector
+from ml.similarity import VectorStore, SimilarityIndex
+from app.database import db, ipv4_int
+from app.explanations import ExplanationStore
+from app.stream import ThreatBroadcaster
+from app.rescoring import Rescorer
+from app.cache import response_cache
+from app import payloads, results
+from app.results import count_severities
+from app.serialization import loads
+from utils.metrics import metrics
 import config
 
 logger = logging.getLogger(__name__)
@@ -31,64 +42,214 @@ try:
 except Exception as e:
     logger.warning(f"⚠️ Models not found: {e}. Train models first using main.py")
 
+# Per-entity windows over access events (/events), alongside the row-level ensemble
+streaming = StreamingDetector()
+
+# Flagged threats get their explanations computed in the background
+explanations = ExplanationStore(detector, db)
+db.add_listener(explanations.on_threat, explanations.on_threats)
+
+# New threats and stat deltas pushed to dashboards (/api/monitoring/stream)
+live = ThreatBroadcaster(db)
+db.add_listener(live.on_threat, live.on_threats)
+
+# Feature vectors of flagged threats, for /<id>/similar
+vectors = VectorStore(detector)
+db.add_listener(vectors.on_threat, vectors.on_threats)
+similarity = SimilarityIndex(vectors, detector)
+
+# Stored threats re-scored after a bundle update (/api/admin/rescore)
+rescorer = Rescorer(db, vectors, detector)
+
+def explain_options(args, body: dict = None):
+    """(explain?, top_k) from the query string, or a batch body"""
+    body = body or {}
+    flag = args.get("explain", body.get("explain", False))
+    top_k = args.get("top_k", body.get("top_k", config.EXPLAIN["top_k"]))
+    return str(flag).lower() in ("1", "true", "yes"), max(1, min(int(top_k), config.EXPLAIN["max_top_k"]))
+
+# --- scoring handlers ------------------------------------------------------
+# Shared by the Flask routes below and the ASGI app (app/asgi.py): they take
+# the parts of a request already read off the wire and return (status,
+# JSON-able dict or encoded body, headers). Errors are raised to the caller.
+
+def respond(route: str, outcome):
+    """Flask response for a scoring handler's outcome"""
+    status, payload, headers = outcome
+    if isinstance(payload, bytes):
+        return Response(payload, headers=headers), status
+    with metrics.timer("serialize_seconds", route=route):
+        response = jsonify(payload)
+    return response, status
+
+def detect_one(data: dict, args):
+    """Score and store one sample ({feature: value}); explain options come from the query string only"""
+    explain, top_k = explain_options(args)
+    
+    # Convert to numpy array
+    values = list(data.values())
+    X = np.array([values], dtype=np.float64).reshape(1, -1)
+    
+    # Predict
+    result = detector.predict(X)
+    
+    # Extract values
+    # Raw prediction might be from hard-voting (0) while probability (0.59) suggests Threat.
+    # We prioritize the probability/confidence score for consistency.
+    # confidence = Probability of Class 1 (Attack)
+    raw_prediction_vote = int(result['prediction'][0])
+    confidence = float(result['confidence'][0]) 
+    
+    # Override prediction based on probability
+    # If model is 59% sure it's an attack, we should flag it.
+    if confidence > 0.5:
+        prediction = 1
+        type_label = "Malware"  # You can map specific attack types if available
+    else:
+        prediction = 0
+        type_label = "Normal"
+
+    # Determine severity
+    if confidence > config.THREAT_THRESHOLDS["critical"]:
+        severity = "critical"
+    elif confidence > config.THREAT_THRESHOLDS["warning"]:
+        severity = "warning"
+    elif prediction == 1:
+        severity = "info" # Low confidence threat
+    else:
+        severity = "info"
+    metrics.inc("predictions_total", severity=severity)
+    explanation = detector.explain(X, top_k)["explanations"][0] if explain else None
+    
+    # Store in DB (flagged rows are explained in the background unless already explained)
+    threat_record = {
+        "prediction": prediction,
+        "confidence": confidence,
+        "severity": severity,
+        "threat_type": 1 if prediction == 1 else 0,
+        "source_ip": "192.168.1.105",  # Simulated
+        "type": type_label,
+        "features": X[0],
+        "explanation": explanation,
+        "model_version": detector.model_version
+    }
+    threat_id = db.add_threat(threat_record)
+    
+    body = {
+        "id": threat_id,
+        "is_threat": prediction == 1,
+        "prediction": prediction,
+        "confidence": confidence,
+        "severity": severity,
+        "model": "ensemble_5model"
+    }
+    if explain:
+        body["explanation"] = explanation
+    return 200, body, {}
+
+def detect_batch(raw: bytes, mimetype: str, accept, args):
+    """Score a JSON ({"samples": [[...]]}), .npy, Arrow or Parquet batch (app/payloads.py);
+    the response format follows Accept, else the request's"""
+    fmt = payloads.request_format(mimetype)
+    with metrics.timer("payload_decode_seconds", format=fmt):
+        if fmt == "json":
+            data = loads(raw)
+            X = np.array(data.get('samples', []), dtype=np.float64)
+        else:
+            data = {}
+            X = payloads.decode_matrix(raw, fmt, detector.feature_names)
+    
+    if not len(X):
+        return 400, {"error": "No samples provided"}, {}
+    
+    result = detector.predict(X)
+    count_severities(result['confidence'])
+    threats = int(np.count_nonzero(result['prediction'] == 1))
+    explain, top_k = explain_options(args, data)
+    
+    out = payloads.response_format(accept, fmt)
+    if out != "json":
+        if explain:
+            return 400, {"error": "Explanations are only returned as JSON"}, {}
+        summary = {
+            "total-samples": str(len(X)),
+            "threats-detected": str(threats),
+            "dedup-ratio": f"{result['dedup_ratio']:.4f}",
+            "model-version": str(detector.model_version)
+        }
+        with metrics.timer("serialize_seconds", route="batch"):
+            body = payloads.encode_columns({
+                "prediction": np.asarray(result['prediction'], dtype=np.int8),
+                "confidence": np.asarray(result['confidence'], dtype=np.float64)
+            }, out, metadata=summary)
+        headers = {f"X-{name.title()}": value for name, value in summary.items()}
+        return 200, body, {"Content-Type": payloads.MEDIA_TYPES[out], **headers}
+    
+    body = {
+        "total_samples": len(X),
+        "threats_detected": threats,
+        "benign": len(X) - threats,
+        "predictions": result['prediction'],  # Arrays are encoded by app.json (app/serialization.py)
+        "confidences": result['confidence'],
+        "accuracy": f"{(1 - threats/len(X))*100:.1f}%",
+        "dedup_ratio": round(result["dedup_ratio"], 4)
+    }
+    if explain:
+        # Rows past the latency budget are left out (explanations is a prefix)
+        explained = detector.explain(X, top_k)
+        body["explanations"] = explained["explanations"]
+        body["explanations_truncated"] = explained["truncated"]
+    return 200, body, {}
+
+def detect_csv(stream, filename: str):
+    """Score and store an uploaded CSV, read from a (seekable) file object"""
+    if filename == '':
+        return 400, {"error": "No file selected"}, {}
+    
+    if not filename.endswith('.csv'):
+        return 400, {"error": "Only CSV files allowed"}, {}
+    
+    # Read CSV straight from the spooled upload
+    try:
+        df = pd.read_csv(stream, encoding='utf-8')
+    except UnicodeDecodeError:
+        stream.seek(0)
+        df = pd.read_csv(stream, encoding='latin-1')
+    
+    # Remove non-numeric columns
+    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    if not numeric_cols:
+        return 400, {"error": "CSV contains no numeric columns"}, {}
+    
+    X = df[numeric_cols].to_numpy(dtype=np.float64)  # Missing values are imputed by the detector's transform
+    
+    # Predict
+    result = detector.predict(X)
+    
+    # Count threats and store them in one transaction (severity by THREAT_THRESHOLDS)
+    batch = results.assemble(result, X, "Batch Upload", detector.model_version)
+    threats = batch["threats"]
+    db.add_threats(batch["records"])
+
+    return 200, {
+        "filename": filename,
+        "total_samples": len(X),
+        "threats_detected": threats,
+        "benign": len(X) - threats,
+        "threat_rate": f"{(threats/len(X))*100:.1f}%",
+        "predictions": result['prediction'],
+        "confidences": result['confidence'],
+        "dedup_ratio": round(result["dedup_ratio"], 4),
+        "message": "Analysis complete"
+    }, {}
+
+# --- routes ----------------------------------------------------------------
+
 @threat_bp.route('/detect', methods=['POST'])
 def detect_threat():
     """Single threat detection from JSON"""
     try:
-        data = request.get_json()
-        
-        # Convert to numpy array
-        values = list(data.values())
-        X = np.array([values]).reshape(1, -1)
-        
-        # Predict
-        result = detector.predict(X)
-        
-        # Extract values
-        # Raw prediction might be from hard-voting (0) while probability (0.59) suggests Threat.
-        # We prioritize the probability/confidence score for consistency.
-        # confidence = Probability of Class 1 (Attack)
-        raw_prediction_vote = int(result['prediction'][0])
-        confidence = float(result['confidence'][0]) 
-        
-        # Override prediction based on probability
-        # If model is 59% sure it's an attack, we should flag it.
-        if confidence > 0.5:
-            prediction = 1
-            type_label = "Malware"  # You can map specific attack types if available
-        else:
-            prediction = 0
-            type_label = "Normal"
-
-        # Determine severity
-        if confidence > config.THREAT_THRESHOLDS["critical"]:
-            severity = "critical"
-        elif confidence > config.THREAT_THRESHOLDS["warning"]:
-            severity = "warning"
-        elif prediction == 1:
-            severity = "info" # Low confidence threat
-        else:
-            severity = "info"
-        
-        # Store in DB
-        from app.database import db
-        threat_record = {
-            "prediction": prediction,
-            "confidence": confidence,
-            "severity": severity,
-            "threat_type": 1 if prediction == 1 else 0,
-            "source_ip": "192.168.1.105",  # Simulated
-            "type": type_label
-        }
-        db.add_threat(threat_record)
-        
-        return jsonify({
-            "is_threat": prediction == 1,
-            "prediction": prediction,
-            "confidence": confidence,
-            "severity": severity,
-            "model": "ensemble_5model"
-        }), 200
+        return respond("detect", detect_one(request.get_json(), request.args))
     
     except Exception as e:
         logger.error(f"Detection error: {e}")
@@ -96,34 +257,50 @@ def detect_threat():
 
 @threat_bp.route('/batch', methods=['POST'])
 def detect_batch_json():
-    """Batch detection from JSON array"""
+    """Batch detection from a JSON array, or an .npy / Arrow / Parquet matrix (app/payloads.py)"""
+    try:
+        return respond("batch", detect_batch(request.get_data(cache=False), request.mimetype,
+                                             request.accept_mimetypes, request.args))
+    
+    except payloads.UnsupportedPayload as e:
+        return jsonify({"error": str(e)}), 415
+    except Exception as e:
+        logger.error(f"Batch detection error: {e}")
+        return jsonify({"error": str(e)}), 400
+
+@threat_bp.route('/explain', methods=['POST'])
+def explain_threat():
+    """Per-feature reasons for one sample ({feature: value}) or a batch ({"samples": [[...]]})"""
     try:
         data = request.get_json()
-        samples = data.get('samples', [])
-        
-        if not samples:
+        if "samples" in data:
+            X = np.array(data["samples"], dtype=np.float64)
+            _, top_k = explain_options(request.args, data)
+        else:
+            X = np.array([list(data.values())], dtype=np.float64)
+            _, top_k = explain_options(request.args)
+        if X.size == 0:
             return jsonify({"error": "No samples provided"}), 400
         
-        X = np.array(samples)
-        result = detector.predict(X)
-        
-        predictions = result['prediction'].tolist()
-        confidences = result['confidence'].tolist()
+        explained = detector.explain(X, top_k)
+        n = explained["explained_rows"]
+        confidences = detector.predict(X[:n])["confidence"].tolist()
+        for explanation, confidence in zip(explained["explanations"], confidences):
+            explanation["confidence"] = confidence
         
-        # Build response with threats count
-        threats = sum(1 for p in predictions if p == 1)
-        
-        return jsonify({
-            "total_samples": len(samples),
-            "threats_detected": threats,
-            "benign": len(samples) - threats,
-            "predictions": predictions,
-            "confidences": confidences,
-            "accuracy": f"{(1 - threats/len(samples))*100:.1f}%"
-        }), 200
+        with metrics.timer("serialize_seconds", route="explain"):
+            response = jsonify({
+                "total_samples": len(X),
+                "explained_samples": n,
+                "truncated": explained["truncated"],
+                "units": explained["units"],
+                "explanations": explained["explanations"],
+                "model_version": detector.model_version
+            })
+        return response, 200
     
     except Exception as e:
-        logger.error(f"Batch detection error: {e}")
+        logger.error(f"Explain error: {e}")
         return jsonify({"error": str(e)}), 400
 
 @threat_bp.route('/batch-csv', methods=['POST'])
@@ -134,69 +311,141 @@ def detect_batch_csv():
             return jsonify({"error": "No file provided"}), 400
         
         file = request.files['file']
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
-        
-        if not file.filename.endswith('.csv'):
-            return jsonify({"error": "Only CSV files allowed"}), 400
-        
-        # Read CSV
-        try:
-            df = pd.read_csv(io.StringIO(file.read().decode('utf-8')))
-        except:
-            df = pd.read_csv(io.StringIO(file.read().decode('latin-1')))
-        
-        # Remove non-numeric columns
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        if not numeric_cols:
-            return jsonify({"error": "CSV contains no numeric columns"}), 400
-        
-        X = df[numeric_cols].values
-        X = np.nan_to_num(X, nan=0.0)  # Handle missing values
-        
-        # Predict
-        result = detector.predict(X)
-        predictions = result['prediction'].tolist()
-        confidences = result['confidence'].tolist()
+        return respond("batch-csv", detect_csv(file.stream, file.filename))
+    
+    except Exception as e:
+        logger.error(f"CSV batch detection error: {e}")
+        return jsonify({"error": str(e)}), 400
+
+@threat_bp.route('/events', methods=['POST'])
+def ingest_events():
+    """Per-entity streaming detection over EHR access events
+
+    Body: {"events": [{"user", "source_ip", "patient_id", "timestamp"}, ...]}
+    or the same fields as columns of equal length. Entities crossing the alert
+    score are stored as threats once per window.
+    """
+    try:
+        data = request.get_json()
+        events = pd.DataFrame(data["events"] if "events" in data else data)
+        if events.empty:
+            return jsonify({"error": "No events provided"}), 400
+        events = events.rename(columns={"patient_id": "resource"})
         
-        # Count threats
-        threats = sum(1 for p in predictions if p == 1)
+        result = streaming.observe(events)
+        for alert in result["alerts"]:
+            # Score 1 (alert level) maps to the warning threshold, 4 to critical
+            confidence = min(0.999, 1 - 0.2 / alert["score"])
+            severity = "critical" if confidence > config.THREAT_THRESHOLDS["critical"] else "warning"
+            alert["id"] = db.add_threat({
+                "prediction": 1,
+                "confidence": confidence,
+                "severity": severity,
+                "threat_type": 1,
+                "source_ip": str(events["source_ip"].iloc[alert["event"]]) if "source_ip" in events else "Unknown",
+                "type": f"{alert['kind']} {alert['reason']}",
+            })
+            metrics.inc("predictions_total", severity=severity)
         
-        # Store threats in DB
-        from app.database import db
-        for p, c in zip(predictions, confidences):
-            if p == 1:
-                threat_record = {
-                    "prediction": int(p),
-                    "confidence": float(c),
-                    "severity": "critical" if float(c) > 0.9 else "warning",
-                    "threat_type": 1,
-                    "source_ip": f"192.168.1.{np.random.randint(100, 255)}",
-                    "type": "Batch Upload"
-                }
-                db.add_threat(threat_record)
-
-        return jsonify({
-            "filename": file.filename,
-            "total_samples": len(X),
-            "threats_detected": threats,
-            "benign": len(X) - threats,
-            "threat_rate": f"{(threats/len(X))*100:.1f}%",
-            "predictions": predictions,
-            "confidences": [float(c) for c in confidences],
-            "message": "Analysis complete"
-        }), 200
+        scores = result["scores"]
+        flagged = np.flatnonzero(scores >= config.STREAMING["alert_score"])
+        with metrics.timer("serialize_seconds", route="events"):
+            response = jsonify({
+                "total_events": len(events),
+                "flagged": flagged.tolist(),
+                "scores": scores.round(4).tolist(),
+                "reasons": [result["reasons"][i] for i in flagged],
+                "alerts": result["alerts"]
+            })
+        return response, 200
     
     except Exception as e:
-        logger.error(f"CSV batch detection error: {e}")
+        logger.error(f"Event stream error: {e}")
         return jsonify({"error": str(e)}), 400
 
 @threat_bp.route('/', methods=['GET'])
+@response_cache.cached()
 def get_threats():
     limit = request.args.get('limit', default=50, type=int)
-    from app.database import db
     return jsonify(db.get_recent_threats(limit)), 200
 
+def _search_filters(args):
+    """/search query arguments → db.search_threats keyword arguments (ValueError if malformed)"""
+    def listed(name):
+        values = [v.strip() for v in args.get(name, "").split(",") if v.strip()]
+        return values or None
+    
+    filters = {
+        "text": args.get("q") or None,
+        "severities": listed("severity"),
+        "attack_types": listed("attack_type"),
+        "start": args.get("start") or None,
+        "end": args.get("end") or None,
+        "min_confidence": args.get("min_confidence", type=float),
+        "max_confidence": args.get("max_confidence", type=float),
+        "before_id": args.get("cursor", type=int),
+    }
+    ip = args.get("ip", "").strip()
+    if "/" in ip:
+        network = ipaddress.ip_network(ip, strict=False)
+        if network.version != 4:
+            raise ValueError("Only IPv4 CIDR blocks are supported")
+        filters["ip_range"] = (int(network.network_address), int(network.broadcast_address))
+    elif ip:
+        address = ipv4_int(ip)
+        if address is not None:
+            filters["ip_range"] = (address, address)
+        else:
+            filters["source_ip"] = ip
+    return filters
+
+@threat_bp.route('/search', methods=['GET'])
+@response_cache.cached()
+def search_threats():
+    """Search stored threats, newest first
+
+    ?q=<words in attack type / source IP>&severity=critical,warning&attack_type=DDoS
+    &ip=<address or CIDR>&start=&end=<ISO time>&min_confidence=&max_confidence=
+    &limit=&cursor=<next_cursor of the previous page>
+    """
+    try:
+        filters = _search_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = request.args.get('limit', default=config.SEARCH["default_limit"], type=int)
+    limit = max(1, min(limit, config.SEARCH["max_limit"]))
+    
+    rows, next_cursor = db.search_threats(limit=limit, **filters)
+    return jsonify({"results": rows, "count": len(rows), "next_cursor": next_cursor}), 200
+
+@threat_bp.route('/<int:threat_id>/explanation', methods=['GET'])
+def get_threat_explanation(threat_id):
+    """Precomputed explanation of a flagged threat (202 while it is still queued)"""
+    status, explanation = explanations.get(threat_id)
+    if status == "missing":
+        return jsonify({"error": "No explanation for this threat", "threat_id": threat_id}), 404
+    body = {"threat_id": threat_id, "status": status, "model_version": detector.model_version}
+    if explanation is not None:
+        body["explanation"] = explanation
+    return jsonify(body), 200 if status == "ready" else 202
+
+@threat_bp.route('/<int:threat_id>/similar', methods=['GET'])
+def get_similar_threats(threat_id):
+    """Stored threats nearest to this one in the model's scaled feature space"""
+    k = request.args.get('k', default=config.VECTORS["default_k"], type=int)
+    k = max(1, min(k, config.VECTORS["max_k"]))
+    if detector.feature_names is None:
+        return jsonify({"error": "Models not loaded"}), 503
+    neighbours = similarity.similar(threat_id, k)
+    if neighbours is None:
+        return jsonify({"error": "No stored feature vector for this threat", "threat_id": threat_id}), 404
+    distances = dict(neighbours)
+    rows = db.get_threats_by_ids([i for i, _ in neighbours])
+    for row in rows:
+        row["distance"] = round(distances[row["id"]], 6)
+    return jsonify({"threat_id": threat_id, "model_version": detector.model_version, "k": k,
+                    "similar": rows}), 200
+
 @threat_bp.route('/<int:threat_id>', methods=['GET'])
 def get_threat(threat_id):
     """Get specific threat details"""
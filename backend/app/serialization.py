@@ -0,0 +1,76 @@
+"""
+JSON Encoding
+Flask's default provider walks every list element in Python, so the batch
+routes had to turn arrays into lists first and then encode them a second
+time. NumpyJSONProvider encodes with orjson, which writes NumPy arrays and
+scalars natively, straight to response bytes; request bodies are parsed by
+orjson too, falling back to the standard library for the NaN / Infinity
+literals only it accepts. Without orjson installed, the standard library is
+used throughout and arrays are converted as they are met.
+"""
+import json
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """Types neither encoder writes natively (non-contiguous or odd-dtype arrays, NumPy scalars)"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return DefaultJSONProvider.default(obj)
+
+
+def _options(sort_keys: bool, indent) -> int:
+    option = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+              | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return option
+
+
+def dumpb(obj, sort_keys: bool = True, indent=None) -> bytes:
+    """UTF-8 JSON bytes (compact unless indent is set)"""
+    if orjson is None:
+        return json.dumps(obj, default=_default, sort_keys=sort_keys, indent=indent,
+                          separators=None if indent else (",", ":")).encode()
+    return orjson.dumps(obj, default=_default, option=_options(sort_keys, indent))
+
+
+def loads(s):
+    """Parse a JSON body (str, bytes or bytearray)"""
+    if orjson is None:
+        return json.loads(s)
+    try:
+        return orjson.loads(s)
+    except orjson.JSONDecodeError:
+        return json.loads(s)  # NaN / Infinity literals, or a real error
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """app.json: orjson when available, with Flask's handling of dates, dataclasses and key order"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs.keys() - {"default", "sort_keys", "indent", "separators"}:
+            kwargs.setdefault("default", _default)
+            return super().dumps(obj, **kwargs)
+        option = _options(kwargs.get("sort_keys", self.sort_keys), kwargs.get("indent"))
+        return orjson.dumps(obj, default=kwargs.get("default", _default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return super().loads(s, **kwargs) if kwargs else loads(s)
+
+    def response(self, *args, **kwargs):
+        """jsonify(): encoded once, straight to bytes"""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(dumpb(obj, self.sort_keys, indent) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,240 @@
+"""
+Live Threat Stream
+Dashboards subscribe to GET /api/monitoring/stream (server-sent events)
+instead of polling the dashboard, threat list and admin metrics.
+
+One tail thread per worker reads the threats added since the last id it
+saw: db.add_threat in this worker wakes it at once, and it polls every
+tail_seconds for rows written by other workers. It keeps running totals,
+so no request rescans the table, and encodes each update once. That
+frame is shared by every client, so many clients cost one producer.
+Each client has a bounded buffer of frames. A client that falls further
+behind has its buffer replaced by a fresh snapshot instead of growing.
+Rows rewritten in place (re-scoring bumps the 'history' generation) are
+picked up by a recount, at most every history_resync_seconds.
+
+Events:
+  snapshot  {"stats": totals, "threats": the most recent threats, newest first}
+  threats   {"threats": new threats, newest first, "delta": changes to the totals}
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("records", "total_threats", "total_benign", "threats_today", "critical", "warning")
+
+
+def encode(event: str, data: Dict, event_id: Optional[int] = None) -> bytes:
+    """One SSE frame"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n".encode()
+
+
+class _Client:
+    __slots__ = ("frames", "lagged")
+
+    def __init__(self):
+        self.frames = deque()
+        self.lagged = False
+
+
+class ThreatBroadcaster:
+    """In-process fan-out of new threats and stat deltas to SSE clients"""
+
+    def __init__(self, db, settings: Dict = None):
+        self.db = db
+        self.settings = settings or config.STREAM
+        self._cond = threading.Condition()
+        self._tail_lock = threading.Lock()  # One catch-up at a time, so rows are published once
+        self._clients = set()
+        self._totals = None
+        self._resynced = 0.0
+        self._recent = deque(maxlen=self.settings["recent"])
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    # --- producer ----------------------------------------------------------
+
+    def on_threat(self, threat_id: int, data: Dict):
+        """Database listener: publish this worker's writes without waiting for the next poll"""
+        if self._clients:
+            self._wake.set()
+
+    def on_threats(self, ids, columns: Dict):
+        """Batch listener (db.add_threats)"""
+        self.on_threat(int(ids[-1]), {})
+
+    def totals(self) -> Dict:
+        """Current dashboard totals (one indexed query for rows added since the last call)"""
+        self.catch_up()
+        with self._cond:
+            return self._stats()
+
+    def catch_up(self):
+        """Fold threats added since the last seen id into the totals and publish them"""
+        with self._tail_lock:
+            if self._totals is None or self._totals["day"] != self._today():
+                self._resync()
+                return
+            if (time.monotonic() - self._resynced > self.settings["history_resync_seconds"]
+                    and self.db.generation("history") != self._totals["history"]):
+                # Stored rows were re-scored since the totals were counted
+                self._resync()
+                return
+            last_id = self._totals["last_id"]
+            if self.db.max_threat_id() - last_id > self.settings["resync_rows"]:
+                # A bulk load: recount once rather than reading every new row
+                self._resync()
+                return
+            while True:
+                rows = self.db.get_threats_after(last_id, self.settings["batch_rows"])
+                if not rows:
+                    return
+                self._publish(rows)
+                last_id = rows[-1]["id"]
+                if len(rows) < self.settings["batch_rows"]:
+                    return
+
+    def _publish(self, rows: List[Dict]):
+        day = self._totals["day"]
+        delta = dict.fromkeys(COUNTERS, 0)
+        delta["confidence_sum"] = 0.0
+        for row in rows:
+            delta["records"] += 1
+            delta["confidence_sum"] += row["confidence"] or 0.0
+            if row["prediction"] == 1:
+                delta["total_threats"] += 1
+                if str(row["timestamp"]).startswith(day):
+                    delta["threats_today"] += 1
+            elif row["prediction"] == 0:
+                delta["total_benign"] += 1
+            if row["severity"] in ("critical", "warning"):
+                delta[row["severity"]] += 1
+        newest = rows[::-1]
+        frame = encode("threats", {"threats": newest, "delta": delta}, rows[-1]["id"])
+        with self._cond:
+            for key, value in delta.items():
+                self._totals[key] += value
+            self._totals["last_id"] = rows[-1]["id"]
+            self._recent.extendleft(rows)
+            self._broadcast(frame)
+
+    def _resync(self):
+        """Reload totals and recent threats from the database; clients get a fresh snapshot"""
+        self._resynced = time.monotonic()
+        totals = self.db.get_totals(self._today())
+        recent = [row for row in self.db.get_recent_threats(self.settings["recent"])
+                  if row["id"] <= totals["last_id"]]
+        with self._cond:
+            self._totals = totals
+            self._recent.clear()
+            self._recent.extend(recent)
+            if self._clients:
+                self._broadcast(self._snapshot_frame())
+
+    def _broadcast(self, frame: bytes):
+        # Caller holds the condition
+        size = self.settings["buffer_frames"]
+        for client in self._clients:
+            if client.lagged:
+                continue
+            if len(client.frames) >= size:
+                client.frames.clear()
+                client.lagged = True
+                metrics.inc("stream_resyncs_total")
+            else:
+                client.frames.append(frame)
+        self._cond.notify_all()
+
+    def _stats(self) -> Dict:
+        # Caller holds the condition
+        stats = {key: self._totals[key] for key in COUNTERS + ("confidence_sum", "last_id")}
+        records = stats["records"]
+        stats["avg_confidence"] = stats["confidence_sum"] / records if records else 0.0
+        return stats
+
+    def _snapshot_frame(self) -> bytes:
+        # Caller holds the condition
+        return encode("snapshot", {"stats": self._stats(), "threats": list(self._recent)},
+                      self._totals["last_id"])
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().strftime('%Y-%m-%d')
+
+    # --- tail thread -------------------------------------------------------
+
+    def _ensure_tail(self):
+        """Start the tail thread in this process (again after a fork)"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._tail_lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="threat-stream")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.settings["tail_seconds"])
+            self._wake.clear()
+            if not self._clients:
+                continue
+            try:
+                self.catch_up()
+            except Exception as e:
+                logger.warning(f"⚠️ Threat stream catch-up failed: {e}")
+
+    # --- consumers ---------------------------------------------------------
+
+    def subscribe(self) -> Optional[Iterator[bytes]]:
+        """SSE frames for one client (a snapshot, then updates until max_seconds);
+        None when this worker already serves max_clients"""
+        self.catch_up()
+        self._ensure_tail()
+        client = _Client()
+        with self._cond:
+            if len(self._clients) >= self.settings["max_clients"]:
+                metrics.inc("stream_connections_total", result="rejected")
+                return None
+            self._clients.add(client)
+            first = self._snapshot_frame()
+        metrics.inc("stream_connections_total", result="accepted")
+        return self._frames(client, first)
+
+    def _frames(self, client: _Client, first: bytes) -> Iterator[bytes]:
+        s = self.settings
+        try:
+            yield f"retry: {s['retry_ms']}\n".encode() + first
+            deadline = time.monotonic() + s["max_seconds"]
+            while time.monotonic() < deadline:
+                with self._cond:
+                    if not client.frames and not client.lagged:
+                        self._cond.wait(min(s["keepalive_seconds"], max(0.0, deadline - time.monotonic())))
+                    if client.lagged:
+                        out = [self._snapshot_frame()]
+                        client.lagged = False
+                    else:
+                        out = list(client.frames)
+                    client.frames.clear()
+                # A comment line keeps proxies from closing an idle stream
+                yield b"".join(out) if out else b": keepalive\n\n"
+        finally:
+            with self._cond:
+                self._clients.discard(client)
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
@@ -0,0 +1,285 @@
+"""
+HTTP Load Test
+Drives the Flask app from api.create_app() with a weighted request mix and
+reports throughput, a latency histogram and the error rate per endpoint.
+
+  # In-process (Flask test client, one client per thread)
+  python -m benchmarks.bench_http run --concurrency 8 --duration 30
+
+  # Real server: spawn gunicorn locally, or point at one already running
+  python -m benchmarks.bench_http run --gunicorn 4 --concurrency 32
+  python -m benchmarks.bench_http run --url http://localhost:5000
+
+  # Flask vs the ASGI app (app/asgi.py) at the same worker count
+  python -m benchmarks.bench_http run --gunicorn 4 --concurrency 32 --out flask.json
+  python -m benchmarks.bench_http run --gunicorn 4 --asgi --concurrency 32 --out asgi.json
+  python -m benchmarks.bench_http compare flask.json asgi.json
+
+  python -m benchmarks.bench_http compare base.json new.json
+"""
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+import config
+from benchmarks.common import latency_stats, environment, write_results, compare, print_comparison
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+DEFAULT_MIX = "detect=60,batch=10,batch-csv=5,threats=15,dashboard=10"
+
+
+def build_payloads(batch_rows: int, seed: int) -> dict:
+    """Request bodies for every endpoint in the mix"""
+    from ml.detector import AdvancedThreatDetector
+    from benchmarks.synthetic import synthetic_features
+
+    detector = AdvancedThreatDetector()
+    detector.load(str(config.MODELS_FOLDER))
+    # JSON has no NaN/inf, so keep the synthetic rows finite
+    X = synthetic_features(detector, max(batch_rows, 1000), seed=seed, missing_rate=0, inf_rate=0)
+
+    csv = io.StringIO()
+    np.savetxt(csv, X[:batch_rows], delimiter=",", fmt="%.6g",
+               header=",".join(f"f{i}" for i in range(X.shape[1])), comments="")
+    return {
+        "rows": X.tolist(),
+        "batch": {"samples": X[:batch_rows].tolist()},
+        "csv": csv.getvalue().encode(),
+    }
+
+
+class Endpoint:
+    """One entry of the request mix"""
+
+    def __init__(self, name, method, path, body=None):
+        self.name, self.method, self.path, self.body = name, method, path, body
+
+
+def endpoints(payloads: dict) -> dict:
+    rows = payloads["rows"]
+    return {
+        "detect": lambda: Endpoint("detect", "POST", "/api/threats/detect",
+                                   {"json": {"features": random.choice(rows)}}),
+        "batch": lambda: Endpoint("batch", "POST", "/api/threats/batch",
+                                  {"json": payloads["batch"]}),
+        "batch-csv": lambda: Endpoint("batch-csv", "POST", "/api/threats/batch-csv",
+                                      {"file": payloads["csv"]}),
+        "threats": lambda: Endpoint("threats", "GET", "/api/threats/?limit=50"),
+        "dashboard": lambda: Endpoint("dashboard", "GET", "/api/monitoring/dashboard"),
+    }
+
+
+class TestClientTransport:
+    """Flask test client (in-process)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, ep: Endpoint) -> int:
+        body = ep.body or {}
+        if "file" in body:
+            data = {"file": (io.BytesIO(body["file"]), "load.csv")}
+            return self.client.post(ep.path, data=data, content_type="multipart/form-data").status_code
+        if ep.method == "POST":
+            return self.client.post(ep.path, json=body.get("json")).status_code
+        return self.client.get(ep.path).status_code
+
+
+class HTTPTransport:
+    """requests.Session against a live server"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def send(self, ep: Endpoint) -> int:
+        body = ep.body or {}
+        url = self.base_url + ep.path
+        if "file" in body:
+            return self.session.post(url, files={"file": ("load.csv", body["file"])}).status_code
+        if ep.method == "POST":
+            return self.session.post(url, json=body.get("json")).status_code
+        return self.session.get(url).status_code
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def histogram(latencies_ms: np.ndarray) -> dict:
+    counts = np.bincount(np.searchsorted(HISTOGRAM_BUCKETS_MS, latencies_ms),
+                         minlength=len(HISTOGRAM_BUCKETS_MS) + 1)
+    labels = [f"<={b}ms" for b in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+    return dict(zip(labels, counts.tolist()))
+
+
+def worker(transport_factory, makers, names, weights, deadline, budget, records, lock):
+    transport = transport_factory()
+    local = []
+    while time.perf_counter() < deadline:
+        with lock:
+            if budget[0] <= 0:
+                break
+            budget[0] -= 1
+        ep = makers[random.choices(names, weights)[0]]()
+        start = time.perf_counter()
+        try:
+            status = transport.send(ep)
+        except Exception:
+            status = 599  # Connection-level failure
+        local.append((ep.name, time.perf_counter() - start, status))
+    with lock:
+        records.extend(local)
+
+
+def start_gunicorn(workers: int, port: int, db_path: str, asgi: bool = False) -> subprocess.Popen:
+    env = {**os.environ, "THREAT_DB_PATH": db_path}
+    # ASGI: uvicorn workers running app/asgi.py (gunicorn's threads setting does not apply)
+    app = ["-k", "uvicorn.workers.UvicornWorker", "app.asgi:create_asgi_app()"] if asgi else ["api:create_app()"]
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+         "--log-level", "warning", *app],
+        cwd=str(BACKEND_DIR), env=env,
+    )
+    import requests
+    for _ in range(300):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/system/health", timeout=1)
+            return proc
+        except Exception:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def run(args) -> str:
+    db_path = os.path.join(tempfile.mkdtemp(), "load_test.db")
+    os.environ.setdefault("THREAT_DB_PATH", db_path)  # Keep load-test writes out of the real DB
+    payloads = build_payloads(args.batch_rows, args.seed)
+    makers = endpoints(payloads)
+    mix = parse_mix(args.mix)
+    names = [n for n in mix if n in makers]
+    weights = [mix[n] for n in names]
+
+    server = None
+    if args.gunicorn:
+        server = start_gunicorn(args.gunicorn, args.port, os.environ["THREAT_DB_PATH"], args.asgi)
+        base_url = f"http://127.0.0.1:{args.port}"
+        transport_factory = lambda: HTTPTransport(base_url)
+        target = f"gunicorn{' asgi' if args.asgi else ''} x{args.gunicorn}"
+    elif args.url:
+        transport_factory = lambda: HTTPTransport(args.url)
+        target = args.url
+    else:
+        from api import create_app
+        app = create_app()
+        transport_factory = lambda: TestClientTransport(app)
+        target = "flask test client"
+
+    records, lock = [], threading.Lock()
+    budget = [args.requests or float("inf")]
+    print(f"🚀 {target}: concurrency {args.concurrency}, mix {dict(zip(names, weights))}")
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(transport_factory, makers, names, weights,
+                                              deadline, budget, records, lock))
+        for _ in range(args.concurrency)
+    ]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for name in names + ["all"]:
+        rows = records if name == "all" else [(n, s, st) for n, s, st in records if n == name]
+        if not rows:
+            continue
+        seconds = np.array([r[1] for r in rows])
+        errors = sum(1 for r in rows if r[2] >= 400)
+        row = {
+            "endpoint": name,
+            "concurrency": args.concurrency,
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": errors / len(rows),
+            "throughput_rps": len(rows) / elapsed,
+            **latency_stats(seconds.tolist()),
+            "histogram": histogram(seconds * 1000),
+        }
+        results.append(row)
+        print(f"{name:<12}{len(rows):>8} req  {row['throughput_rps']:>9.1f} req/s  p50 {row['p50_ms']:>9.2f} ms"
+              f"  p99 {row['p99_ms']:>9.2f} ms  errors {row['error_rate']:>6.1%}")
+
+    doc = {
+        "benchmark": "load_test",
+        "environment": environment(),
+        "target": target,
+        "settings": {k: v for k, v in vars(args).items() if k != "command"},
+        "elapsed_s": elapsed,
+        "results": results,
+    }
+    path = write_results(doc, args.out, prefix="load")
+    print(f"\n✅ Results written to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run a load test")
+    p_run.add_argument("--url", default=None, help="Base URL of a running server")
+    p_run.add_argument("--gunicorn", type=int, default=0, help="Spawn a local gunicorn with N workers")
+    p_run.add_argument("--asgi", action="store_true", help="With --gunicorn: uvicorn workers serving app/asgi.py")
+    p_run.add_argument("--port", type=int, default=5055)
+    p_run.add_argument("--concurrency", type=int, default=8)
+    p_run.add_argument("--duration", type=float, default=30.0, help="Seconds")
+    p_run.add_argument("--requests", type=int, default=0, help="Stop after N requests (0 = duration only)")
+    p_run.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,...")
+    p_run.add_argument("--batch-rows", type=int, default=100, help="Rows per /batch and /batch-csv request")
+    p_run.add_argument("--seed", type=int, default=0)
+    p_run.add_argument("--out", default=None)
+
+    p_cmp = sub.add_parser("compare", help="Flag p50 regressions between two result files")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        warnings.filterwarnings("ignore")
+        run(args)
+    else:
+        rows = compare(args.base, args.new, args.threshold, key_fields=("endpoint", "concurrency"))
+        sys.exit(1 if print_comparison(rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Inference Benchmark
+Throughput, p50/p95/p99 latency and peak memory of AdvancedThreatDetector.predict
+and of every EnsembleVoting member across batch sizes.
+
+  python -m benchmarks.bench_inference run [--batch-sizes 1,10,100] [--duplicate-fraction 0.2]
+                                           [--no-dedup] [--out file.json]
+  python -m benchmarks.bench_inference compare base.json new.json [--threshold 0.1]
+"""
+import argparse
+import logging
+import sys
+import tracemalloc
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import config
+from ml.detector import AdvancedThreatDetector
+from benchmarks.common import (latency_stats, time_calls, environment, write_results,
+                               compare, print_comparison)
+from benchmarks.synthetic import synthetic_features
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000]
+
+
+def peak_memory_mb(fn) -> float:
+    """Peak traced allocation during one call"""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1e6
+
+
+def measure(target: str, fn, batch_size: int, args) -> dict:
+    durations = time_calls(fn, min_calls=args.min_calls, max_calls=args.max_calls,
+                           min_seconds=args.min_seconds)
+    stats = latency_stats(durations)
+    row = {
+        "target": target,
+        "batch_size": batch_size,
+        **stats,
+        "rows_per_s": batch_size / (stats["p50_ms"] / 1000),
+        "peak_mem_mb": peak_memory_mb(fn),
+    }
+    print(f"{target:<14}{batch_size:>8}  p50 {stats['p50_ms']:>10.3f} ms  p99 {stats['p99_ms']:>10.3f} ms"
+          f"  {row['rows_per_s']:>12.0f} rows/s  {row['peak_mem_mb']:>8.1f} MB")
+    return row
+
+
+def run(args) -> str:
+    detector = AdvancedThreatDetector()
+    detector.load(args.models_dir)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    config.DEDUP["predict"] = not args.no_dedup
+
+    X_all = synthetic_features(detector, max(batch_sizes), seed=args.seed,
+                               duplicate_fraction=args.duplicate_fraction)
+    results = []
+    for batch_size in batch_sizes:
+        X = X_all[:batch_size]
+        results.append(measure("predict", lambda: detector.predict(X), batch_size, args))
+        results[-1]["dedup_ratio"] = detector.predict(X)["dedup_ratio"]
+        X_scaled = detector.transform(X)
+        results.append(measure("transform", lambda: detector.transform(X), batch_size, args))
+        for name in detector.ensemble.weights:
+            results.append(measure(f"member:{name}",
+                                   lambda name=name: detector.ensemble.member_proba(name, X_scaled),
+                                   batch_size, args))
+
+    doc = {
+        "benchmark": "inference",
+        "environment": environment(),
+        "dedup": config.DEDUP["predict"],
+        "duplicate_fraction": args.duplicate_fraction,
+        "bundle": {"folder": args.models_dir, "n_features": len(detector.feature_names),
+                   "members": detector.ensemble.weights},
+        "results": results,
+    }
+    path = write_results(doc, args.out, prefix="inference")
+    print(f"\n✅ Results written to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run the benchmark")
+    p_run.add_argument("--models-dir", default=str(config.MODELS_FOLDER))
+    p_run.add_argument("--batch-sizes", default=",".join(map(str, DEFAULT_BATCH_SIZES)))
+    p_run.add_argument("--min-calls", type=int, default=3)
+    p_run.add_argument("--max-calls", type=int, default=200)
+    p_run.add_argument("--min-seconds", type=float, default=1.0, help="Time floor per measurement")
+    p_run.add_argument("--seed", type=int, default=0)
+    p_run.add_argument("--duplicate-fraction", type=float, default=0.2, help="Synthetic rows repeating an earlier row")
+    p_run.add_argument("--no-dedup", action="store_true", help="Score every row, duplicates included")
+    p_run.add_argument("--out", default=None, help="JSON output (default: benchmarks/results/)")
+
+    p_cmp = sub.add_parser("compare", help="Flag regressions between two result files")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="Allowed relative p50 increase")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        warnings.filterwarnings("ignore")
+        run(args)
+    else:
+        rows = compare(args.base, args.new, args.threshold)
+        sys.exit(1 if print_comparison(rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
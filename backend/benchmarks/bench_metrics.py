@@ -0,0 +1,152 @@
+"""
+Metrics Overhead Benchmark
+Cost of each metrics primitive and of the per-request instrumentation: the
+time spent inside the Flask before/after hooks, checked against a budget in
+microseconds. Also reports the end-to-end difference between an instrumented
+and a bare Flask app serving an empty route.
+
+  python -m benchmarks.bench_metrics [--budget-us 10] [--iterations 200000] [--out file.json]
+
+Exits 1 when the per-request overhead is over budget.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from flask import Flask
+from utils.metrics import MetricsCollector
+from benchmarks.common import environment, write_results
+
+ROUTES = ["/api/threats/detect", "/api/threats/batch", "/api/monitoring/health", "/metrics"]
+
+
+def ns_per_call(fn, iterations: int, repeats: int = 5) -> float:
+    """Best-of-repeats nanoseconds per call of fn(i)"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(iterations):
+            fn(i)
+        best = min(best, (time.perf_counter() - start) / iterations)
+    baseline = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(iterations):
+            pass
+        baseline = min(baseline, (time.perf_counter() - start) / iterations)
+    return max(best - baseline, 0.0) * 1e9
+
+
+def primitives(iterations: int) -> dict:
+    from app import middleware
+
+    collector = MetricsCollector()
+    # The middleware records into the global collector; benchmark it on a fresh one
+    middleware.metrics, saved = collector, middleware.metrics
+    middleware._request_series.clear()
+    try:
+        histogram = collector.histogram("h")
+        counter = collector.counter("c")
+        clock = time.perf_counter
+
+        def request(i):
+            start = clock()
+            middleware.record_request(ROUTES[i & 3], "POST", 200, clock() - start)
+
+        def timer(i):
+            with collector.timer("model_inference_seconds", model="rf"):
+                pass
+
+        return {
+            "per_request_ns": ns_per_call(request, iterations),
+            "histogram_observe_ns": ns_per_call(lambda i: histogram.observe(0.004), iterations),
+            "counter_inc_ns": ns_per_call(lambda i: counter.inc(), iterations),
+            "labelled_observe_ns": ns_per_call(
+                lambda i: collector.observe("db_write_seconds", 0.001, route=ROUTES[i & 3]), iterations),
+            "timer_ns": ns_per_call(timer, iterations),
+        }
+    finally:
+        middleware.metrics = saved
+        middleware._request_series.clear()
+
+
+def flask_hooks(requests: int) -> dict:
+    """Median time inside the instrumentation hooks, and the end-to-end cost of an empty route"""
+    from app.middleware import init_instrumentation
+
+    def make(instrumented: bool):
+        app = Flask(__name__)
+        app.add_url_rule("/ping", "ping", lambda: "")
+        if instrumented:
+            init_instrumentation(app)
+        return app
+
+    hook_seconds = []
+
+    def timed(hook):
+        def wrapper(*args):
+            start = time.perf_counter()
+            result = hook(*args)
+            hook_seconds[-1] += time.perf_counter() - start
+            return result
+        return wrapper
+
+    instrumented = make(True)
+    instrumented.before_request_funcs[None] = [timed(h) for h in instrumented.before_request_funcs[None]]
+    instrumented.after_request_funcs[None] = [timed(h) for h in instrumented.after_request_funcs[None]]
+    clients = {"bare": make(False).test_client(), "instrumented": instrumented.test_client()}
+
+    samples = {name: [] for name in clients}
+    for _ in range(requests):
+        # Interleaved so both apps see the same machine noise
+        for name, client in clients.items():
+            if name == "instrumented":
+                hook_seconds.append(0.0)
+            start = time.perf_counter()
+            client.get("/ping")
+            samples[name].append(time.perf_counter() - start)
+    bare = statistics.median(samples["bare"]) * 1e6
+    full = statistics.median(samples["instrumented"]) * 1e6
+    return {
+        "hooks_us": statistics.median(hook_seconds) * 1e6,
+        "bare_us": bare,
+        "instrumented_us": full,
+        "delta_us": full - bare,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics instrumentation overhead")
+    parser.add_argument("--budget-us", type=float, default=10.0, help="Per-request overhead budget")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--flask-requests", type=int, default=5000)
+    parser.add_argument("--out", help="Result JSON path (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    costs = primitives(args.iterations)
+    for name, ns in costs.items():
+        print(f"{name:<24}{ns:>10.0f} ns")
+    flask = flask_hooks(args.flask_requests)
+    print(f"{'flask hooks':<24}{flask['hooks_us'] * 1000:>10.0f} ns")
+    print(f"{'flask empty route':<24}{flask['bare_us']:>10.1f} µs bare, "
+          f"{flask['instrumented_us']:.1f} µs instrumented ({flask['delta_us']:+.1f} µs, noisy)")
+
+    within = flask["hooks_us"] <= args.budget_us
+    print(f"{'✅' if within else '❌'} per-request overhead {flask['hooks_us']:.2f} µs "
+          f"(budget {args.budget_us:.2f} µs)")
+    path = write_results({
+        "environment": environment(),
+        "budget_us": args.budget_us,
+        "within_budget": within,
+        "primitives_ns": costs,
+        "flask": flask,
+    }, args.out, prefix="metrics")
+    print(f"💾 Results written to {path}")
+    sys.exit(0 if within else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Batch Payload Benchmark
+Times the parts of /api/threats/batch that do not depend on the models for
+each body format: decoding a --rows x --features request into the float64
+matrix the detector scores, and encoding the predictions and confidences of
+the response (jsonify for JSON). One predict call on the same matrix is
+timed for scale. Arrow and Parquet are skipped when pyarrow is missing.
+
+  python -m benchmarks.bench_payloads [--rows 100000] [--features 78] [--out file.json]
+"""
+import argparse
+import io
+import json
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app import payloads
+from benchmarks.common import environment, latency_stats, time_calls, write_results
+
+
+def request_body(X: np.ndarray, fmt: str) -> bytes:
+    """What a client sends"""
+    if fmt == "json":
+        return json.dumps({"samples": X.tolist()}).encode()
+    if fmt == "npy":
+        out = io.BytesIO()
+        np.save(out, X)
+        return out.getvalue()
+    pa = payloads._pyarrow()
+    table = pa.table({f"f{j}": X[:, j] for j in range(X.shape[1])})
+    sink = pa.BufferOutputStream()
+    if fmt == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pa.parquet.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch request/response body costs by format")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--features", type=int, default=78)
+    parser.add_argument("--formats", default="json,npy,arrow,parquet")
+    parser.add_argument("--no-predict", action="store_true", help="Skip the reference predict call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Result JSON path (default benchmarks/results/...)")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    from flask import Flask, jsonify
+    app = Flask("bench_payloads")
+    rng = np.random.default_rng(args.seed)
+    X = rng.lognormal(3, 2, (args.rows, args.features)).round(3)
+    prediction = (rng.random(args.rows) < 0.2).astype(np.int8)
+    confidence = rng.random(args.rows)
+
+    results = {}
+    print(f"{'format':<9}{'request MB':>11}{'decode ms':>11}{'response MB':>12}{'encode ms':>11}")
+    for fmt in args.formats.split(","):
+        try:
+            body = request_body(X, fmt)
+        except payloads.UnsupportedPayload as e:
+            print(f"{fmt:<9}  skipped: {e}")
+            continue
+        if fmt == "json":
+            decode = lambda: np.array(json.loads(body)["samples"], dtype=np.float64)
+
+            def encode():
+                with app.app_context():
+                    return jsonify({"predictions": prediction.tolist(), "confidences": confidence.tolist()}).data
+        else:
+            decode = lambda: payloads.decode_matrix(body, fmt)
+            encode = lambda: payloads.encode_columns({"prediction": prediction, "confidence": confidence}, fmt)
+        np.testing.assert_allclose(decode(), X)
+        decoded = latency_stats(time_calls(decode, min_calls=3, max_calls=50, min_seconds=1.0))
+        encoded = latency_stats(time_calls(encode, min_calls=3, max_calls=50, min_seconds=1.0))
+        response_bytes = len(encode())
+        results[fmt] = {"request_bytes": len(body), "response_bytes": response_bytes,
+                        "decode": decoded, "encode": encoded}
+        print(f"{fmt:<9}{len(body) / 2**20:>11.1f}{decoded['p50_ms']:>11.1f}"
+              f"{response_bytes / 2**20:>12.1f}{encoded['p50_ms']:>11.1f}")
+
+    predict_s = None
+    if not args.no_predict:
+        import config
+        from ml.detector import AdvancedThreatDetector
+        detector = AdvancedThreatDetector()
+        detector.load(str(config.MODELS_FOLDER))
+        width = len(detector.feature_names)
+        Xp = X[:, :width] if width <= args.features else np.pad(X, ((0, 0), (0, width - args.features)))
+        t0 = time.perf_counter()
+        detector.predict(Xp)
+        predict_s = time.perf_counter() - t0
+        print(f"🔮 predict on the same rows ({width} features): {predict_s * 1000:,.0f} ms")
+
+    out = write_results({
+        "environment": environment(),
+        "args": vars(args),
+        "formats": results,
+        "predict_s": predict_s,
+    }, args.out, prefix="payloads")
+    print(f"💾 Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Batch Post-processing Benchmark
+Times what /batch-csv does after detector.predict for a --rows batch, per
+stage, with the previous row-by-row code and with app/results.py:
+counting threats and building the threat records, writing them to SQLite, and
+encoding the JSON response. The row-by-row database path commits once per
+threat, so it is timed on --legacy-db-rows threats and scaled up.
+Writes go to a temporary database.
+
+  python -m benchmarks.bench_postprocess [--rows 1000000] [--features 78]
+                                         [--threat-fraction 0.2] [--out file.json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["THREAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="ehr_postprocess_"), "threats.db")
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+from app import results
+from app.database import Database
+from app.serialization import NumpyJSONProvider, orjson
+from benchmarks.common import environment, write_results
+
+
+def row_by_row(result, X, db, db_rows):
+    """The loop /batch-csv ran before app/results.py; returns per-stage seconds"""
+    seconds = {}
+    t0 = time.perf_counter()
+    predictions = result['prediction'].tolist()
+    confidences = result['confidence'].tolist()
+    results.count_severities(result['confidence'])
+    threats = sum(1 for p in predictions if p == 1)
+    records = []
+    for i, (p, c) in enumerate(zip(predictions, confidences)):
+        if p == 1:
+            records.append({
+                "prediction": int(p),
+                "confidence": float(c),
+                "severity": "critical" if float(c) > 0.9 else "warning",
+                "threat_type": 1,
+                "source_ip": f"192.168.1.{np.random.randint(100, 255)}",
+                "type": "Batch Upload",
+                "features": X[i],
+                "model_version": "bench"
+            })
+    seconds["assemble"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for record in records[:db_rows]:
+        db.add_threat(record)
+    seconds["db"] = (time.perf_counter() - t0) * threats / max(1, min(db_rows, threats))
+    return threats, predictions, confidences, seconds
+
+
+def vectorized(result, X, db):
+    seconds = {}
+    t0 = time.perf_counter()
+    batch = results.assemble(result, X, "Batch Upload", "bench")
+    seconds["assemble"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    db.add_threats(batch["records"])
+    seconds["db"] = time.perf_counter() - t0
+    return batch["threats"], seconds
+
+
+def encode(app, body) -> float:
+    with app.app_context():
+        t0 = time.perf_counter()
+        jsonify(body)
+        return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-row cost of batch result assembly and serialization")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=78)
+    parser.add_argument("--threat-fraction", type=float, default=0.2)
+    parser.add_argument("--legacy-db-rows", type=int, default=2000, help="Threats written one by one, then scaled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Result JSON path (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    X = rng.lognormal(3, 2, (args.rows, args.features))
+    prediction = (rng.random(args.rows) < args.threat_fraction).astype(np.int64)
+    confidence = np.where(prediction == 1, rng.uniform(0.5, 1, args.rows), rng.uniform(0, 0.5, args.rows))
+    result = {"prediction": prediction, "confidence": confidence}
+
+    old_app, new_app = Flask("row_by_row"), Flask("vectorized")
+    old_app.json, new_app.json = DefaultJSONProvider(old_app), NumpyJSONProvider(new_app)
+    db = Database()
+
+    threats, predictions, confidences, old = row_by_row(result, X, db, args.legacy_db_rows)
+    old["serialize"] = encode(old_app, {"predictions": predictions, "confidences": [float(c) for c in confidences]})
+    new_threats, new = vectorized(result, X, db)
+    new["serialize"] = encode(new_app, {"predictions": prediction, "confidences": confidence})
+    assert threats == new_threats
+
+    per_row = lambda s: s * 1e9 / args.rows
+    print(f"📦 {args.rows:,} rows, {threats:,} threats, orjson {'on' if orjson else 'missing'}")
+    print(f"{'stage':<11}{'row-by-row s':>14}{'ns/row':>10}{'vectorized s':>14}{'ns/row':>10}")
+    for stage in ("assemble", "db", "serialize"):
+        print(f"{stage:<11}{old[stage]:>14.2f}{per_row(old[stage]):>10,.0f}"
+              f"{new[stage]:>14.3f}{per_row(new[stage]):>10,.0f}")
+    old_total, new_total = sum(old.values()), sum(new.values())
+    print(f"{'total':<11}{old_total:>14.2f}{per_row(old_total):>10,.0f}{new_total:>14.3f}{per_row(new_total):>10,.0f}")
+
+    out = write_results({
+        "environment": environment(),
+        "args": vars(args),
+        "threats": threats,
+        "orjson": orjson is not None,
+        "row_by_row_s": old,
+        "vectorized_s": new,
+        "ns_per_row": {"row_by_row": per_row(old_total), "vectorized": per_row(new_total)},
+    }, args.out, prefix="postprocess")
+    print(f"💾 Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
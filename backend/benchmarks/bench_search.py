@@ -0,0 +1,168 @@
+"""
+Threat Search Benchmark
+Builds (once) a SQLite threats database with --rows synthetic records spread
+over a year, then times one keyset page of db.search_threats for each filter
+shape (severity, attack type, CIDR block, time range, confidence, FTS text,
+combinations) and a page 20 cursors deep. Prints the query plan of each.
+
+  python -m benchmarks.bench_search [--rows 10000000] [--db /tmp/ehr_search.db] [--rebuild]
+                                    [--limit 50] [--out file.json]
+"""
+import argparse
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from benchmarks.common import environment, latency_stats, time_calls, write_results
+
+ATTACKS = np.array(["Normal", "DDoS", "DoS Hulk", "PortScan", "Bot", "FTP-Patator", "SSH-Patator",
+                    "Web Attack Brute Force", "Web Attack XSS", "Infiltration", "Heartbleed"])
+ATTACK_P = [0.70, 0.08, 0.07, 0.05, 0.03, 0.02, 0.02, 0.015, 0.01, 0.004, 0.001]
+START = np.datetime64("2025-01-01T00:00:00")
+
+
+def build(db, rows: int, chunk: int = 200_000):
+    """Bulk insert synthetic threats (the FTS triggers run as in production)"""
+    rng = np.random.default_rng(7)
+    conn = db._get_conn()
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    seconds = 365 * 86400
+    t0 = time.perf_counter()
+    for first in range(0, rows, chunk):
+        n = min(chunk, rows - first)
+        offsets = ((first + np.arange(n)) * seconds // rows).astype("timedelta64[s]")
+        timestamps = np.datetime_as_string(START + offsets).astype(object)
+        attack = ATTACKS[rng.choice(len(ATTACKS), n, p=ATTACK_P)]
+        prediction = (attack != "Normal").astype(int)
+        confidence = np.where(prediction == 1, rng.beta(8, 1.5, n), rng.beta(1.5, 8, n)).round(4)
+        severity = np.where(confidence > 0.95, "critical", np.where(confidence > 0.8, "warning", "normal"))
+        # A /16 of internal hosts plus addresses from anywhere
+        ip_int = np.where(rng.random(n) < 0.6, (10 << 24) + rng.integers(0, 1 << 16, n),
+                          rng.integers(1 << 24, 223 << 24, n)).astype(np.int64)
+        ips = [f"{a >> 24}.{(a >> 16) & 255}.{(a >> 8) & 255}.{a & 255}" for a in ip_int.tolist()]
+        conn.executemany('''
+            INSERT INTO threats (timestamp, prediction, confidence, severity, threat_type, source_ip,
+                                 attack_type, source_ip_int)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', zip(timestamps, prediction.tolist(), confidence.tolist(), severity.tolist(), prediction.tolist(),
+                 ips, attack.tolist(), ip_int.tolist()))
+        conn.commit()
+        print(f"\r  {first + n:,} / {rows:,} rows ({time.perf_counter() - t0:.0f}s)", end="", flush=True)
+    print()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threat search latency")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--db", help="Database file (default: <tmp>/ehr_search_<rows>.db, reused)")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--limit", type=int, default=50, help="Page size")
+    parser.add_argument("--out", help="Result JSON path (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.gettempdir(), f"ehr_search_{args.rows}.db")
+    if args.rebuild and os.path.exists(path):
+        os.remove(path)
+    fresh = not os.path.exists(path)
+    os.environ["THREAT_DB_PATH"] = path
+    from app.database import Database
+    db = Database()
+    if fresh:
+        print(f"🔨 Building {path}")
+        build(db, args.rows)
+    rows = db.max_threat_id()
+    print(f"📦 {path}: {rows:,} rows, {os.path.getsize(path) / 2**30:.2f} GiB")
+
+    last_month = str(START + np.timedelta64(335, "D"))
+    one_day = (str(START + np.timedelta64(180, "D")), str(START + np.timedelta64(181, "D")))
+    ip = db.search_threats(limit=1)[0][0]["source_ip"]
+    cases = {
+        "newest": {},
+        "severity": {"severities": ["critical"]},
+        "severity_2": {"severities": ["critical", "warning"]},
+        "rare_attack": {"attack_types": ["Heartbleed"]},
+        "cidr_24": {"ip_range": (10 << 24 | 5 << 8, 10 << 24 | 5 << 8 | 255)},
+        "ip_exact": {"ip_range": _ip_range(ip)},
+        "one_day": {"start": one_day[0], "end": one_day[1]},
+        "confidence": {"min_confidence": 0.999},
+        "text": {"text": "Brute*"},
+        "text_ip": {"text": ip},
+        "combined": {"severities": ["critical"], "ip_range": (10 << 24, 10 << 24 | 0xFFFF), "start": last_month},
+    }
+
+    results = {}
+    print(f"{'query':<14}{'rows':>6}{'p50 ms':>10}{'p95 ms':>10}  plan")
+    for name, filters in cases.items():
+        found, _ = db.search_threats(limit=args.limit, **filters)
+        stats = latency_stats(time_calls(lambda: db.search_threats(limit=args.limit, **filters),
+                                         min_calls=5, max_calls=100, min_seconds=0.5))
+        results[name] = {**stats, "rows": len(found)}
+        print(f"{name:<14}{len(found):>6}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}  {_plan(db, filters, args.limit)}")
+
+    # Deep pagination: following the cursor costs the same per page
+    cursor = None
+    for _ in range(20):
+        _, cursor = db.search_threats(severities=["warning"], before_id=cursor, limit=args.limit)
+    stats = latency_stats(time_calls(lambda: db.search_threats(severities=["warning"], before_id=cursor,
+                                                               limit=args.limit), min_calls=5, min_seconds=0.5))
+    results["page_21"] = stats
+    print(f"{'page_21':<14}{args.limit:>6}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}")
+
+    out = write_results({
+        "environment": environment(),
+        "args": vars(args),
+        "rows": rows,
+        "db_bytes": os.path.getsize(path),
+        "queries": results,
+    }, args.out, prefix="search")
+    print(f"💾 Results written to {out}")
+
+
+def _ip_range(ip: str):
+    from app.database import ipv4_int
+    address = ipv4_int(ip)
+    return address, address
+
+
+def _plan(db, filters, limit) -> str:
+    """Indexes the query uses, from EXPLAIN QUERY PLAN"""
+    captured = {}
+    conn = db._get_conn()
+    original = db._get_conn
+    try:
+        db._get_conn = lambda: _Recorder(conn, captured)
+        db.search_threats(limit=limit, **filters)
+    finally:
+        db._get_conn = original
+    steps = conn.execute("EXPLAIN QUERY PLAN " + captured["sql"], captured["args"]).fetchall()
+    conn.close()
+    return "; ".join(step[-1] for step in steps if "SCAN" in step[-1] or "SEARCH" in step[-1])
+
+
+class _Recorder:
+    """Connection wrapper that remembers the last statement"""
+
+    def __init__(self, conn, captured):
+        self.conn, self.captured = conn, captured
+
+    def execute(self, sql, args=()):
+        self.captured.update(sql=sql, args=args)
+        return self.conn.execute(sql, args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    main()
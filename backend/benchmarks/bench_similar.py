@@ -0,0 +1,137 @@
+"""
+Similar-Threat Benchmark
+Fills a vector store with --rows flagged threats drawn around --campaigns
+attack centres (each campaign's flows vary along --factors shared directions
+by --spread training standard deviations), builds the index over all but
+--tail-fraction of them, appends the rest as the unindexed tail, then times
+/<id>/similar lookups and measures recall@k against an exact brute-force
+search in the scaled space.
+
+  python -m benchmarks.bench_similar [--rows 1000000] [--k 10] [--queries 200]
+                                     [--campaigns 500] [--spread 0.3] [--factors 4]
+                                     [--out file.json]
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import config
+from ml.detector import AdvancedThreatDetector
+from ml.similarity import VectorStore, SimilarityIndex
+from benchmarks.common import environment, latency_stats, time_calls, write_results
+from benchmarks.synthetic import synthetic_features
+
+
+def campaign_rows(detector, n_rows: int, campaigns: int, spread: float, factors: int, seed: int):
+    """Flagged rows clustered around attack centres, like repeated tool runs"""
+    rng = np.random.default_rng(seed)
+    centres = synthetic_features(detector, campaigns, seed=seed, attack_fraction=1.0,
+                                 duplicate_fraction=0.0, missing_rate=0.0, inf_rate=0.0)
+    scale = detector.feature_transform.scale
+    sizes = rng.zipf(1.6, campaigns).astype(float)
+    members = rng.choice(campaigns, n_rows, p=sizes / sizes.sum())
+    # Flows of one campaign differ along a few shared factors (payload size, rate,
+    # duration move together), plus a little independent noise per feature
+    loadings = rng.standard_normal((campaigns, factors, len(scale))) / np.sqrt(factors)
+    z = rng.standard_normal((n_rows, factors))
+    jitter = np.einsum("nf,nfd->nd", z, loadings[members]) + 0.1 * rng.standard_normal((n_rows, len(scale)))
+    return (centres[members] + scale * spread * jitter).astype(np.float32)
+
+
+def exact_neighbours(index, records, query_rows, k):
+    """Brute-force k nearest ids (self excluded) in the scaled space"""
+    queries = index._scaled(records["x"][query_rows])
+    best = np.full((len(query_rows), k + 1), np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(query_rows), k + 1), dtype=np.int64)
+    for start in range(0, len(records), 100_000):
+        chunk = records[start:start + 100_000]
+        scaled = index._scaled(chunk["x"])
+        d = (np.einsum("ij,ij->i", scaled, scaled)[None, :] - 2 * queries @ scaled.T
+             + np.einsum("ij,ij->i", queries, queries)[:, None])
+        d = np.concatenate([best, d], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(chunk["id"], (len(query_rows), len(chunk)))], axis=1)
+        keep = np.argpartition(d, k, axis=1)[:, :k + 1]
+        best = np.take_along_axis(d, keep, axis=1)
+        best_ids = np.take_along_axis(ids, keep, axis=1)
+    own = records["id"][query_rows]
+    return [set(row[row != threat_id].tolist()) for row, threat_id in zip(best_ids, own)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-threat lookup latency and recall")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Stored vectors")
+    parser.add_argument("--tail-fraction", type=float, default=0.2, help="Rows appended after the build")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--campaigns", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=0.3)
+    parser.add_argument("--factors", type=int, default=4, help="Within-campaign degrees of freedom")
+    parser.add_argument("--models-dir", default=str(config.MODELS_FOLDER))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Result JSON path (default benchmarks/results/...)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    warnings.filterwarnings("ignore")
+
+    detector = AdvancedThreatDetector()
+    detector.load(args.models_dir)
+    X = campaign_rows(detector, args.rows, args.campaigns, args.spread, args.factors, args.seed)
+    ids = np.arange(1, args.rows + 1)
+    settings = {**config.VECTORS, "rebuild_min_rows": args.rows * 10}  # Keep the tail for the timing
+    store = VectorStore(detector, tempfile.mkdtemp(prefix="ehr_vectors_"), settings)
+    index = SimilarityIndex(store, detector, settings)
+
+    indexed = args.rows - int(args.rows * args.tail_fraction)
+    t0 = time.perf_counter()
+    for start in range(0, indexed, 50_000):
+        store.append(ids[start:min(start + 50_000, indexed)], X[start:min(start + 50_000, indexed)])
+    append_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.build()
+    build_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    store.append(ids[indexed:], X[indexed:])
+    index.refresh()
+    tail_s = time.perf_counter() - t0
+    print(f"📦 {args.rows:,} vectors ({store.count() * store.records(1).itemsize / 2**20:.0f} MiB): "
+          f"append {indexed / max(append_s, 1e-9):,.0f} rows/s, "
+          f"build {build_s:.1f}s over {indexed:,}, tail of {args.rows - indexed:,} in {tail_s:.1f}s")
+
+    rng = np.random.default_rng(args.seed + 1)
+    query_rows = np.sort(rng.choice(args.rows, args.queries, replace=False))
+    records = store.records()
+    truth = exact_neighbours(index, records, query_rows, args.k)
+    query_ids = records["id"][query_rows].tolist()
+
+    found = [index.similar(threat_id, args.k) for threat_id in query_ids]
+    recall = float(np.mean([len({i for i, _ in hits} & want) / args.k for hits, want in zip(found, truth)]))
+    calls = iter(query_ids * 100)
+    stats = latency_stats(time_calls(lambda: index.similar(next(calls), args.k),
+                                     min_calls=args.queries, max_calls=args.queries * 5, min_seconds=1.0))
+    print(f"🔎 k={args.k}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+          f"recall@{args.k} {recall:.3f}")
+
+    out = write_results({
+        "environment": environment(),
+        "args": vars(args),
+        "vectors": args.rows,
+        "indexed": indexed,
+        "file_bytes": int(store.count() * store.records(1).itemsize),
+        "append_rows_per_s": indexed / max(append_s, 1e-9),
+        "build_s": build_s,
+        "tail_refresh_s": tail_s,
+        "query": stats,
+        "recall_at_k": recall,
+    }, args.out, prefix="similar")
+    print(f"💾 Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Shared benchmark helpers: latency statistics, JSON results, run comparison
+"""
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def latency_stats(seconds: List[float]) -> Dict:
+    """Percentiles (ms) for a list of call durations in seconds"""
+    ms = np.asarray(seconds) * 1000
+    return {
+        "calls": int(len(ms)),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def time_calls(fn: Callable[[], object], min_calls: int = 3, max_calls: int = 200,
+               min_seconds: float = 1.0) -> List[float]:
+    """Call fn repeatedly (after one warm-up) until both call and time floors are met"""
+    fn()
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < max_calls:
+        t0 = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - t0)
+        if len(durations) >= min_calls and time.perf_counter() - started >= min_seconds:
+            break
+    return durations
+
+
+def environment() -> Dict:
+    """Machine/library description stored with every result file"""
+    import sklearn
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(results: Dict, out: str = None, prefix: str = "bench") -> str:
+    """Write a result document as JSON; returns the path"""
+    if out is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        out = str(RESULTS_DIR / f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    return out
+
+
+def compare(base_path: str, new_path: str, threshold: float = 0.10,
+            key_fields=("target", "batch_size"), metric: str = "p50_ms") -> List[Dict]:
+    """Match rows of two result files and flag those whose metric grew by more than threshold"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    index = {tuple(r.get(k) for k in key_fields): r for r in base["results"]}
+    rows = []
+    for r in new["results"]:
+        key = tuple(r.get(k) for k in key_fields)
+        if key not in index or not index[key].get(metric):
+            continue
+        change = r[metric] / index[key][metric] - 1
+        rows.append({
+            **dict(zip(key_fields, key)),
+            "base": index[key][metric],
+            "new": r[metric],
+            "change": change,
+            "regression": change > threshold,
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict], metric: str = "p50_ms") -> bool:
+    """Print a comparison table; returns True if any row regressed"""
+    print(f"{'target':<24}{'key':>10}{'base ' + metric:>16}{'new ' + metric:>16}{'change':>10}")
+    for r in rows:
+        key = r.get("batch_size", r.get("concurrency", ""))
+        flag = "  ❌ REGRESSION" if r["regression"] else ""
+        print(f"{str(r.get('target', r.get('endpoint'))):<24}{str(key):>10}{r['base']:>16.3f}{r['new']:>16.3f}{r['change']:>+10.1%}{flag}")
+    return any(r["regression"] for r in rows)
@@ -0,0 +1,44 @@
+"""
+Synthetic CICIDS/UNSW-shaped traffic matching a trained bundle's features
+"""
+import numpy as np
+
+
+def synthetic_features(detector, n_rows: int, seed: int = 0, attack_fraction: float = 0.2,
+                       duplicate_fraction: float = 0.2, missing_rate: float = 0.001,
+                       inf_rate: float = 0.0005) -> np.ndarray:
+    """Raw feature matrix shaped like the bundle's training data
+
+    Columns with a positive training mean (byte/packet counts, durations, rates)
+    are drawn log-normal with the training mean and variance; the rest are
+    normal. Attack rows get a few features shifted by several standard
+    deviations, a share of rows repeat earlier rows (keep-alives, rescans),
+    and NaN/inf are sprinkled in like CICIDS "Flow Bytes/s".
+    """
+    rng = np.random.default_rng(seed)
+    transform = detector.feature_transform
+    mean, scale = transform.mean, transform.scale
+    n_features = len(mean)
+
+    z = rng.standard_normal((n_rows, n_features))
+    X = mean + scale * z
+    positive = mean > 0
+    if positive.any():
+        cv2 = (scale[positive] / mean[positive]) ** 2
+        sigma = np.sqrt(np.log1p(cv2))
+        X[:, positive] = mean[positive] * np.exp(sigma * z[:, positive] - sigma ** 2 / 2)
+
+    attacks = rng.random(n_rows) < attack_fraction
+    n_attacks = int(attacks.sum())
+    if n_attacks:
+        shifted = rng.random((n_attacks, n_features)) < 0.1
+        X[attacks] += shifted * scale * rng.uniform(3, 8, (n_attacks, n_features))
+
+    if duplicate_fraction > 0 and n_rows > 1:
+        dup = np.flatnonzero(rng.random(n_rows) < duplicate_fraction)
+        dup = dup[dup > 0]
+        X[dup] = X[rng.integers(0, dup)]
+
+    X[rng.random(X.shape) < missing_rate] = np.nan
+    X[rng.random(X.shape) < inf_rate] = np.inf
+    return X
@@ -3,6 +3,7 @@ Configuration file for Intrusion Detection System
 Fix: Unified all paths and model names
 """
 import os
+import json
 from pathlib import Path
 
 # Paths
@@ -10,6 +11,7 @@ BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"  # Adjust based on your structure
 MODELS_FOLDER = BASE_DIR / "models"
 MODELS_FOLDER.mkdir(exist_ok=True)
+RUNS_FOLDER = Path(os.getenv("RUNS_FOLDER", str(BASE_DIR / "runs")))  # Training-run checkpoints
 
 # Dataset paths
 CICIDS_PATH = str(DATA_DIR / "cicids2017")
@@ -24,9 +26,12 @@ MODEL_NAMES = {
     "nn": "neural_network.pkl",
     "iso": "isolation_forest.pkl",
     "scaler": "scaler.pkl",
+    "feature_transform": "feature_transform.pkl",
     "features": "features.pkl",
     "metrics": "advanced_metrics.pkl",
-    "ensemble": "ensemble.pkl"
+    "ensemble": "ensemble.pkl",
+    "calibrators": "calibrators.pkl",
+    "drift_baseline": "drift_baseline.pkl"
 }
 
 # ML Model hyperparameters
@@ -52,7 +57,7 @@ MODEL_PARAMS = {
         "kernel": "rbf",
         "C": 100,
         "gamma": "scale",
-        "probability": True,
+        "probability": False,  # Calibrated separately (CALIBRATION) instead of libsvm's internal CV
         "random_state": 42
     },
     "neural_network": {
@@ -73,10 +78,170 @@ MODEL_PARAMS = {
     }
 }
 
+# Tuned overrides written by ml/tuning.py (main.py --tune) take precedence
+MODEL_PARAMS_OVERRIDE_FILE = Path(os.getenv("MODEL_PARAMS_OVERRIDE_FILE", str(MODELS_FOLDER / "model_params_override.json")))
+if MODEL_PARAMS_OVERRIDE_FILE.exists():
+    with open(MODEL_PARAMS_OVERRIDE_FILE) as f:
+        for _key, _params in json.load(f).items():
+            MODEL_PARAMS.setdefault(_key, {}).update(_params)
+
+# Successive-halving search space per member (keys match MODEL_PARAMS)
+TUNING_SPACE = {
+    "random_forest": {
+        "n_estimators": [100, 200, 400],
+        "max_depth": [10, 20, None],
+        "min_samples_leaf": [1, 2, 5],
+        "max_features": ["sqrt", 0.3]
+    },
+    "gradient_boosting": {
+        "n_estimators": [100, 150, 300],
+        "learning_rate": [0.05, 0.1, 0.2],
+        "max_depth": [3, 5, 7],
+        "subsample": [0.6, 0.8, 1.0]
+    },
+    "svm": {
+        "C": [1, 10, 100],
+        "gamma": ["scale", 0.01, 0.1]
+    },
+    "neural_network": {
+        "hidden_layer_sizes": [(64, 32), (128, 64, 32), (256, 128)],
+        "alpha": [1e-5, 1e-4, 1e-3],
+        "learning_rate_init": [1e-3, 3e-3]
+    },
+    "isolation_forest": {
+        "n_estimators": [100, 200, 400],
+        "max_samples": ["auto", 0.25, 0.5]
+        # No contamination: it only shifts offset_, which cannot change the AUC of its scores
+    }
+}
+
+TUNING = {
+    "n_candidates": 27,   # Configs sampled per member
+    "eta": 3,             # Keep the best 1/eta at each rung
+    "min_fraction": 0.02, # Smallest data fraction for the first rung
+    "cv_folds": 3,
+    "n_jobs": None,       # Worker processes (None = all CPUs)
+    "seed": 42
+}
+
+# Per-member probability calibration on the validation split
+CALIBRATION = {
+    "method": "isotonic",  # or "platt"
+    "max_knots": 256       # Lookup-table size per member
+}
+
+# Ensemble member selection/weighting, run by train_all on the validation split
+ENSEMBLE_OPTIMIZER = {
+    "latency_budget_ms": float(os.getenv("ENSEMBLE_LATENCY_BUDGET_MS", "25")),  # Per request
+    "latency_batch_size": 1,   # Rows per timed request (1 = /detect)
+    "timing_repeats": 5,
+    "min_auc_gain": 0.0005     # Stop adding members below this validation AUC gain
+}
+
+# Duplicate-row collapsing (ml/preprocessor.unique_rows)
+DEDUP = {
+    "predict": True,    # Score each distinct row of a batch once
+    "min_rows": 16,     # Smaller batches skip the hashing
+    "training": True    # Drop repeated (row, label) pairs before the splits
+}
+
+# Per-prediction explanations (/api/threats/explain, ?explain=true)
+EXPLAIN = {
+    "top_k": 5,
+    "max_top_k": 20,
+    "latency_budget_ms": 50.0  # Rows past the budget are returned unexplained
+}
+
+# Explanations precomputed in the background for flagged threats (app/explanations.py)
+EXPLAIN_STORE = {
+    "severities": ["warning", "critical"],
+    "top_k": 10,
+    "queue_size": 10000,   # Threats waiting to be explained; more are dropped
+    "batch_size": 256,     # Rows per background explain call
+    "cache_size": 20000    # Packed explanations (~200 bytes each) kept in memory
+}
+
+# PDF report snapshots (app/reports.py), shared by every worker through REPORTS_DIR
+REPORTS_DIR = Path(os.getenv("REPORTS_DIR", str(BASE_DIR / "reports")))
+REPORTS = {
+    "refresh_seconds": float(os.getenv("REPORTS_REFRESH_SECONDS", "60")),  # 0 = no background renders
+    "keep": 20,                 # Snapshots kept per kind (live / range)
+    "monthly_after_days": 62,   # Longer ranges are tabulated by month instead of by day
+    "top_sources": 10,
+    "lock_timeout": 300         # Seconds before another worker's render lock counts as abandoned
+}
+
+# Live threat stream (/api/monitoring/stream, app/stream.py). Each connected
+# dashboard holds a server thread for up to max_seconds, then its browser reconnects.
+STREAM = {
+    "tail_seconds": 1.0,        # Poll for threats written by other workers
+    "keepalive_seconds": 15,
+    "max_seconds": 300,
+    "retry_ms": 2000,           # Browser reconnect delay
+    "max_clients": 12,          # Per worker; keep below the gunicorn threads per worker
+    "buffer_frames": 256,       # Per client; a client further behind gets a fresh snapshot
+    "recent": 50,               # Threats in each snapshot
+    "batch_rows": 1000,         # Rows per tail query and update frame
+    "resync_rows": 10000,       # A larger backlog is recounted instead of read row by row
+    "history_resync_seconds": 30  # Recount at most this often while a re-scoring job rewrites rows
+}
+
+# Per-worker cache of read endpoint bodies (app/cache.py), invalidated by the
+# threats generation counter and model bundle version
+RESPONSE_CACHE = {
+    "enabled": os.getenv("RESPONSE_CACHE", "1") != "0",
+    "max_entries": 512,
+    "live_seconds": 5       # Endpoints showing live latency figures also expire this often
+}
+
+# Threat search (/api/threats/search)
+SEARCH = {
+    "default_limit": 50,
+    "max_limit": 500,
+    "range_probe_rows": 10000,  # Range filters matching fewer rows are read from their index and sorted
+    "scan_steps": 100000        # SQLite VM steps a search walks id order before falling back to a range index
+}
+
+# Feature vectors of flagged threats and the similar-threat index (ml/similarity.py).
+# The store is shared by every worker through VECTORS_DIR; each worker builds its own index.
+VECTORS_DIR = Path(os.getenv("VECTORS_DIR", str(BASE_DIR / "vectors")))
+VECTORS = {
+    "flagged_only": True,       # Store prediction == 1 rows only
+    "components": 16,           # Principal components the tree is built on
+    "tree": "kd_tree",          # or "ball_tree"
+    "oversample": 8,            # Tree candidates per result, re-ranked by exact distance
+    "leaf_size": 40,
+    "pca_sample": 50000,        # Rows the projection is fitted on
+    "rebuild_fraction": 0.25,   # Rebuild once rows added since the last build pass this share...
+    "rebuild_min_rows": 5000,   # ...and this count (until then they are searched by brute force)
+    "default_k": 10,
+    "max_k": 100
+}
+
+# Re-scoring of stored threats with a newly loaded bundle (app/rescoring.py)
+RESCORE = {
+    "workers": max(1, (os.cpu_count() or 2) // 4),  # Pool processes
+    "nice": 10,                 # Pool priority below the server's
+    "chunk_rows": 50000,        # Rows per pool task
+    "batch_rows": 5000,         # Rows per write transaction (holds the write lock for a few ms)
+    "rows_per_second": 20000,   # 0 = no cap
+    "lock_timeout": 120         # Seconds without a heartbeat before another runner may take a job over
+}
+
+# ASGI serving (app/asgi.py): scoring routes run on a bounded thread pool per worker
+ASGI = {
+    "scoring_threads": int(os.getenv("ASGI_SCORING_THREADS", "4")),
+    "max_pending": 64,      # Scoring calls queued or running per worker; more are answered 503
+    "max_body_mb": 512      # Larger request bodies are answered 413
+}
+
 # Flask config
 FLASK_ENV = os.getenv("FLASK_ENV", "development")
 DEBUG = FLASK_ENV == "development"
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
+# Required in X-Admin-Token by the admin control endpoints (profiling, re-scoring, memory);
+# unset, those endpoints answer 403. PROFILING_TOKEN is its old name.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or os.getenv("PROFILING_TOKEN")
 
 # Database (optional - comment out if not using)
 # DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///threats.db")
@@ -88,6 +253,61 @@ THREAT_THRESHOLDS = {
     "normal": 0.0
 }
 
+# Instrumentation: with several gunicorn workers, point METRICS_DIR at a shared
+# directory (gunicorn.conf.py does this) so every worker's histograms are merged
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+
+# On-demand profiling (/api/admin/profile/*). Every session ends by itself at
+# the first of its time window or request budget; these are the hard caps.
+PROFILING = {
+    "max_seconds": 300,
+    "max_requests": 10000,       # Per worker
+    "default_seconds": 30,
+    "default_requests": 500,
+    "default_sample_rate": 0.1,  # Fraction of requests profiled
+    "sample_interval_ms": 5,     # Sampling mode: stack read period
+    "max_stack_depth": 128,
+    "max_stacks": 20000          # Distinct folded stacks kept per worker
+}
+# Sessions reach every gunicorn worker through a control file in here
+PROFILING_DIR = os.path.join(METRICS_DIR, "profiles") if METRICS_DIR else None
+
+# Feature drift of live traffic against the training baseline (ml/drift.py)
+DRIFT = {
+    "bins": 20,                   # Quantile bins per feature
+    "baseline_rows": 200000,      # Training rows sampled for the baseline
+    "overhead_budget": 0.002,     # Sketch updates may cost this fraction of inference time
+    "max_rows_per_update": 512,
+    "window_seconds": 3600,
+    "slot_seconds": 300,          # Window granularity
+    "min_samples": 200,           # Fewer sampled rows report insufficient_data
+    "epsilon": 1e-4,              # Floor for empty bins in PSI
+    "psi_warning": 0.1,
+    "psi_alert": 0.25,
+    "top_features": 10,
+    "flush_seconds": 5            # Per-worker sketch files in DRIFT_DIR
+}
+DRIFT_DIR = os.path.join(METRICS_DIR, "drift") if METRICS_DIR else None
+
+# Per-entity streaming detection over access events (ml/streaming.py). State is
+# per process: send an entity's events to one worker for exact windows.
+STREAMING = {
+    "kinds": ["user", "source_ip"],
+    "bucket_seconds": 10,
+    "window_buckets": 6,          # 60 s sliding window
+    "max_entities": 200000,       # Per kind (~150 bytes each); least recently seen are evicted past this
+    "idle_seconds": 900,          # Entities silent this long are dropped at the next sweep
+    "sweep_seconds": 60,
+    "max_batch": 100000,          # Events applied per table update
+    "hll_registers": 32,          # Distinct-resource sketch per window (~18% error)
+    "ewma_alpha": 0.05,           # Weight of the newest bucket in each entity's history
+    "min_history_buckets": 30,    # History needed before burst z-scores count
+    "max_events": 600,            # Events per window that score 1.0
+    "max_distinct": 100,          # Distinct resources (patients) per window that score 1.0
+    "max_burst_z": 6.0,
+    "alert_score": 1.0
+}
+
 # Logging
 LOG_LEVEL = "INFO"
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -0,0 +1,76 @@
+"""
+Gunicorn settings
+  gunicorn -c gunicorn.conf.py "api:create_app()"
+
+Pre-fork serving (PRELOAD=1, the default): the master loads the app and the
+model bundle once and forks every worker from it, so the models are shared
+copy-on-write instead of unpickled per worker (utils/prefork.py). Workers
+are recycled after MAX_REQUESTS requests and re-forked from the master,
+without loading anything again.
+"""
+import os
+import shutil
+import tempfile
+
+from utils import prefork
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+# Threaded workers: each live stream client (/api/monitoring/stream) holds a
+# thread, capped per worker by config.STREAM["max_clients"]
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = 120
+
+preload_app = os.getenv("PRELOAD", "1") == "1"
+# Recycle a worker after this many requests (0 = never), staggered by the jitter so
+# workers do not restart together; it finishes its requests within graceful_timeout
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+# Read by config at import, which happens in the master when the app is preloaded
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ehr_metrics"))
+if preload_app:
+    prefork.preloading()
+
+
+def on_starting(server):
+    """Fresh shared metrics directory for this server's workers"""
+    metrics_dir = os.environ["METRICS_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    """Preloaded: make the model bundle read-only and freeze the heap before the first fork"""
+    if not server.cfg.preload_app:
+        return
+    from app.routes.threat_detection import detector
+    nbytes = prefork.protect(*detector.shared_state()) if detector.models else 0
+    objects = prefork.freeze()
+    server.log.info(f"✅ Model bundle preloaded: {nbytes / 2**20:.1f} MB of arrays read-only, "
+                    f"{objects} objects frozen")
+
+
+def pre_fork(server, worker):
+    """Objects the master created since (a recycled worker's replacement) are frozen too"""
+    if server.cfg.preload_app:
+        prefork.freeze()
+
+
+def post_fork(server, worker):
+    """Start the worker's own background threads and zero its inherited metrics"""
+    prefork.forked(server.pid)
+
+
+def worker_exit(server, worker):
+    """Flush the exiting worker's last requests"""
+    from utils.metrics import metrics
+    metrics.flush()
+
+
+def child_exit(server, worker):
+    """Fold the exited worker's metrics into the retired snapshot, so recycled workers
+    neither pile up in METRICS_DIR nor count as live processes"""
+    from utils.metrics import metrics
+    metrics.retire(worker.pid)
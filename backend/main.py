@@ -22,7 +22,7 @@ import config
 from ml.detector import AdvancedThreatDetector
 from api import create_app
 
-def train_models():
+def train_models(resume: bool = False, run_dir: str = None):
     """Train all models"""
     logger.info("=" * 60)
     logger.info("🎯 STARTING MODEL TRAINING")
@@ -30,7 +30,7 @@ def train_models():
     
     try:
         detector = AdvancedThreatDetector()
-        metrics = detector.train_all()
+        metrics = detector.train_all(resume=resume, run_dir=run_dir)
         
         logger.info("\n" + "=" * 60)
         logger.info("✅ TRAINING COMPLETE")
@@ -66,18 +66,32 @@ def run_server():
         debug=config.DEBUG
     )
 
+def run_asgi_server(workers: int = 1):
+    """Start the ASGI app (app/asgi.py) under uvicorn"""
+    import uvicorn
+    logger.info(f"🚀 STARTING ASGI SERVER ({workers} workers) on http://localhost:5000")
+    uvicorn.run("app.asgi:create_asgi_app", factory=True, host="0.0.0.0", port=5000,
+                workers=workers, log_level="info")
+
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="Intrusion Detection System")
     parser.add_argument("--train", action="store_true", help="Train models")
+    parser.add_argument("--resume", action="store_true", help="Resume the latest training run, skipping completed stages")
+    parser.add_argument("--run-dir", default=None, help="Training-run directory to resume (default: latest)")
+    parser.add_argument("--tune", action="store_true", help="Successive-halving hyperparameter search on the latest run")
+    parser.add_argument("--members", default=None, help="Comma-separated members to tune, e.g. rf,gb (default: all)")
+    parser.add_argument("--rescore", action="store_true", help="Re-score stored threats with the current bundle (resumable)")
     parser.add_argument("--server", action="store_true", default=True, help="Run server")
+    parser.add_argument("--asgi", action="store_true", help="Serve with uvicorn (app/asgi.py) instead of Flask")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (with --asgi)")
     
     args = parser.parse_args()
     
-    if args.train:
+    if args.train or args.resume:
         detector = AdvancedThreatDetector()
-        metrics = detector.train_all()  # ✅ CORRECT
+        metrics = detector.train_all(resume=args.resume, run_dir=args.run_dir)  # ✅ CORRECT
         
         print("\n" + "="*60)
         print("✅ TRAINING COMPLETE ✅")
@@ -87,5 +101,33 @@ if __name__ == "__main__":
                 print(f"{key}: {value:.4f}")
         print("="*60)
     
-    if args.server:
+    if args.tune:
+        from ml.tuning import tune
+        report = tune(members=args.members.split(",") if args.members else None, run_dir=args.run_dir)
+        
+        print("\n" + "="*60)
+        print("✅ TUNING COMPLETE ✅")
+        print("="*60)
+        for member, result in report.items():
+            best = result["best"]
+            print(f"{member}: AUC {best['auc']:.4f} | {best['latency_us_per_row']:.1f} µs/row | {best['params']}")
+        print("="*60)
+    
+    if args.rescore:
+        from app.database import db
+        from app.rescoring import Rescorer
+        from ml.similarity import VectorStore
+        detector = AdvancedThreatDetector()
+        detector.load(str(config.MODELS_FOLDER))
+        job = Rescorer(db, VectorStore(detector), detector).run()
+        
+        print("\n" + "="*60)
+        print(f"✅ RE-SCORING {job['status'].upper()} ✅")
+        print("="*60)
+        print(f"{job['rescored']:,} rows re-scored, {job['changed']:,} changed ({job['cursor']:,} / {job['total']:,})")
+        print("="*60)
+    
+    if args.asgi:
+        run_asgi_server(args.workers)
+    elif args.server:
         run_server()
\ No newline at end of file
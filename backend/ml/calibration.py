@@ -0,0 +1,59 @@
+"""
+Probability Calibration
+Maps each member's raw attack score to P(attack) with a monotone lookup
+table fitted on the validation split; serving is a single np.interp.
+"""
+import numpy as np
+import logging
+from typing import Dict
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+
+from ml.ensemble import member_scores
+
+logger = logging.getLogger(__name__)
+
+
+class Calibrator:
+    """Piecewise-linear score → probability table"""
+
+    def __init__(self, knots: np.ndarray, values: np.ndarray, method: str):
+        self.knots = np.asarray(knots, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.method = method
+
+    def __call__(self, scores: np.ndarray) -> np.ndarray:
+        return np.interp(scores, self.knots, self.values)
+
+    @staticmethod
+    def _grid(scores: np.ndarray, max_knots: int) -> np.ndarray:
+        return np.unique(np.quantile(scores, np.linspace(0, 1, max_knots)))
+
+    @classmethod
+    def fit_isotonic(cls, scores: np.ndarray, y: np.ndarray, max_knots: int = 256) -> "Calibrator":
+        iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip").fit(scores, y)
+        knots = iso.X_thresholds_
+        if len(knots) > max_knots:
+            knots = cls._grid(scores, max_knots)
+        return cls(knots, iso.predict(knots), "isotonic")
+
+    @classmethod
+    def fit_platt(cls, scores: np.ndarray, y: np.ndarray, max_knots: int = 256) -> "Calibrator":
+        lr = LogisticRegression(C=1e6).fit(scores.reshape(-1, 1), y)
+        knots = cls._grid(scores, max_knots)
+        return cls(knots, lr.predict_proba(knots.reshape(-1, 1))[:, 1], "platt")
+
+
+def fit_calibrators(models: Dict, X_val: np.ndarray, y_val: np.ndarray, settings: Dict) -> Dict[str, Calibrator]:
+    """Fit one calibrator per member on the validation split"""
+    fit = Calibrator.fit_isotonic if settings["method"] == "isotonic" else Calibrator.fit_platt
+    y_val = np.asarray(y_val)
+    calibrators = {}
+    for name, model in models.items():
+        try:
+            scores = np.asarray(member_scores(model, X_val), dtype=np.float64)
+            calibrators[name] = fit(scores, y_val, settings["max_knots"])
+            logger.info(f"  📐 {name}: {calibrators[name].method} calibrator, {len(calibrators[name].knots)} knots")
+        except Exception as e:
+            logger.warning(f"  ⚠️ Could not calibrate {name}: {e}")
+    return calibrators
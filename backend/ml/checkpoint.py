@@ -0,0 +1,111 @@
+"""
+Training Run Checkpoints
+Each train_all run gets its own directory; every finished stage is
+written there immediately so a killed run can be resumed.
+"""
+import os
+import json
+import hashlib
+import pickle
+import numpy as np
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingRun:
+    """Training-run directory with per-stage checkpoints"""
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, run_dir: str):
+        self.run_dir = Path(run_dir)
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = self._read_manifest()
+
+    @classmethod
+    def create(cls, root: str) -> "TrainingRun":
+        """Start a new run under root (its own directory, even for runs started in the same second)"""
+        run_id = f"{datetime.now():run_%Y%m%d_%H%M%S_%f}_{os.getpid()}"
+        os.makedirs(os.path.join(root, run_id))  # Fails rather than reuse another run's directory
+        run = cls(os.path.join(root, run_id))
+        logger.info(f"📁 New training run: {run.run_dir}")
+        return run
+
+    @classmethod
+    def latest(cls, root: str) -> Optional["TrainingRun"]:
+        """Most recent run under root, or None"""
+        root_path = Path(root)
+        if not root_path.exists():
+            return None
+        runs = sorted(p for p in root_path.glob("run_*") if (p / cls.MANIFEST).exists())
+        if not runs:
+            return None
+        return cls(str(runs[-1]))
+
+    def _read_manifest(self) -> Dict:
+        path = self.run_dir / self.MANIFEST
+        if path.exists():
+            with open(path) as f:
+                return json.load(f)
+        return {"created": datetime.now().isoformat(), "stages": {}}
+
+    def _write_manifest(self):
+        # Write-then-rename so a crash never leaves a half-written manifest
+        tmp = self.run_dir / (self.MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.run_dir / self.MANIFEST)
+
+    @staticmethod
+    def params_hash(params: Dict) -> str:
+        """Short stable hash of the parameters a stage was fitted with"""
+        return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+    def is_done(self, stage: str, params: Optional[Dict] = None) -> bool:
+        """Check whether a stage has a complete checkpoint (fitted with params, if given)"""
+        done = self.manifest["stages"].get(stage)
+        if done is None:
+            return False
+        if params is not None and done.get("params_hash") != self.params_hash(params):
+            logger.info(f"  ♻️ {stage}: parameters changed since the checkpoint, refitting")
+            return False
+        return True
+
+    def mark_done(self, stage: str, **info):
+        """Record a finished stage"""
+        self.manifest["stages"][stage] = {"finished": datetime.now().isoformat(), **info}
+        self._write_manifest()
+
+    def save_arrays(self, stage: str, **arrays: np.ndarray):
+        """Save arrays as .npy files and mark the stage done"""
+        for name, arr in arrays.items():
+            tmp = self.run_dir / f"{stage}_{name}.tmp.npy"
+            np.save(tmp, np.ascontiguousarray(arr))
+            os.replace(tmp, self.run_dir / f"{stage}_{name}.npy")
+        self.mark_done(stage, arrays=sorted(arrays))
+        logger.info(f"  💾 Checkpoint: {stage} ({', '.join(sorted(arrays))})")
+
+    def load_arrays(self, stage: str, names: List[str]) -> Dict[str, np.ndarray]:
+        """Load a stage's arrays memory-mapped (read-only)"""
+        return {
+            name: np.load(self.run_dir / f"{stage}_{name}.npy", mmap_mode="r")
+            for name in names
+        }
+
+    def save_object(self, stage: str, obj: Any, **info):
+        """Pickle an object and mark the stage done"""
+        tmp = self.run_dir / f"{stage}.pkl.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(obj, f)
+        os.replace(tmp, self.run_dir / f"{stage}.pkl")
+        self.mark_done(stage, **info)
+        logger.info(f"  💾 Checkpoint: {stage}")
+
+    def load_object(self, stage: str) -> Any:
+        """Load a pickled stage"""
+        with open(self.run_dir / f"{stage}.pkl", "rb") as f:
+            return pickle.load(f)
@@ -4,7 +4,9 @@ ULTIMATE Anomaly Detection Engine
 ✅ FIXED: Correct probability class indexing
 """
 import os
+import time
 import pickle
+import hashlib
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -14,31 +16,68 @@ import logging
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, IsolationForest
 from sklearn.svm import SVC
 from sklearn.neural_network import MLPClassifier
-from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score, confusion_matrix
-from sklearn.impute import SimpleImputer
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 import config
-from ml.preprocessor import DataPreprocessor
-from ml.ensemble import EnsembleVoting
+from ml.preprocessor import DataPreprocessor, FeatureTransform, unique_rows
+from ml.ensemble import EnsembleVoting, optimize_ensemble
 from ml.explainer import ThreatExplainer
+from ml.drift import DriftBaseline, DriftMonitor
+from ml.checkpoint import TrainingRun
+from ml.calibration import fit_calibrators
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Rows per predict() call, for the batch-size distribution
+BATCH_SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000, 100000, 1000000]
+
+# (key, display name, estimator, config.MODEL_PARAMS key) in training order
+MEMBERS = [
+    ("rf", "Random Forest", RandomForestClassifier, "random_forest"),
+    ("gb", "Gradient Boosting", GradientBoostingClassifier, "gradient_boosting"),
+    ("svm", "SVM", SVC, "svm"),
+    ("nn", "Neural Network", MLPClassifier, "neural_network"),
+    ("iso", "Isolation Forest", IsolationForest, "isolation_forest"),
+]
+
+def bundle_version(folder: str) -> str:
+    """Content hash of the model bundle files, so every change to a model changes it"""
+    digest = hashlib.sha1()
+    for key in sorted(config.MODEL_NAMES):
+        path = os.path.join(folder, config.MODEL_NAMES[key])
+        if not os.path.exists(path):
+            continue
+        digest.update(config.MODEL_NAMES[key].encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
 class AdvancedThreatDetector:
     """Advanced Intrusion Detection with 5 ML Models"""
     
     def __init__(self):
         self.models = {}
         self.scaler = None
+        self.feature_transform = None
         self.feature_names = None
         self.metrics = {}
         self.preprocessor = DataPreprocessor()
         self.ensemble = None
+        self.ensemble_config = None
+        self.calibrators = {}
         self.explainer = None
+        self.drift_baseline = None
+        self.drift = None
+        self.row_counts = None  # Raw rows behind each deduplicated training row
+        self.model_version = None
+        self.load_seconds = None
+        self.loaded_at = None
         logger.info("✅ AdvancedThreatDetector initialized")
     
     def load_and_preprocess_data(self, data_folder: str = None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
@@ -108,75 +147,109 @@ class AdvancedThreatDetector:
         X = df_combined.iloc[:min_len].values
         y = y[:min_len]
         
-        # ✅ CRITICAL: Robust numeric cleaning
-        X = np.where(np.isinf(X), np.nan, X)  # Replace infinities
-        X = np.clip(X, -1e12, 1e12)  # Clip extreme values
-        imputer = SimpleImputer(strategy="mean")
-        X = imputer.fit_transform(X)
-        X = np.nan_to_num(X, nan=0.0)  # Final safety
-        
-        # Normalize
-        self.scaler = StandardScaler()
-        X = self.scaler.fit_transform(X)
+        if config.DEDUP["training"]:
+            # Repeated flows add fitting time, not information, and would straddle the splits
+            X = np.asarray(X, dtype=np.float64)
+            _, inverse = unique_rows(X)
+            _, keep, counts = np.unique(inverse * (int(y.max()) + 1) + y,  # Distinct (row, label)
+                                        return_index=True, return_counts=True)
+            order = np.argsort(keep)
+            keep, self.row_counts = keep[order], counts[order]
+            logger.info(f"  Dropped {len(X) - len(keep)} duplicate rows ({1 - len(keep) / len(X):.1%})")
+            X, y = X[keep], y[keep]
+        else:
+            self.row_counts = None
+        
+        # ✅ CRITICAL: Robust numeric cleaning + normalization, fused and persisted
+        # so predict() applies exactly the same transform
+        self.feature_transform = FeatureTransform.fit(X)
+        X = self.feature_transform.transform(X, copy=False)
+        self.scaler = self.feature_transform.to_scaler()
         self.feature_names = list(df_combined.columns)
         
         logger.info(f"✅ Data preprocessed: X={X.shape}, y={y.shape}")
         return X, y, self.feature_names
     
-    def train_all(self, data_folder: str = None, force: bool = False) -> Dict:
-        """Train all 5 models and ensemble"""
+    def train_all(self, data_folder: str = None, force: bool = False,
+                  resume: bool = False, run_dir: str = None) -> Dict:
+        """Train all 5 models and ensemble
+
+        Every stage is checkpointed into a training-run directory as soon as
+        it finishes. With resume=True the latest run (or run_dir) is reopened
+        and completed stages are loaded instead of recomputed.
+        """
         logger.info("🎯 TRAINING ALL MODELS")
         
-        X, y, feature_names = self.load_and_preprocess_data(data_folder)
-        
-        # Split data
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y
-        )
-        X_train, X_val, y_train, y_val = train_test_split(
-            X_train, y_train, test_size=0.2, random_state=42, stratify=y_train
-        )
+        run = self._open_run(resume, run_dir)
+        
+        if run.is_done("split"):
+            logger.info("⏩ Resuming: loading preprocessed splits from checkpoint")
+            arrays = run.load_arrays("split", ["X_train", "X_val", "X_test", "y_train", "y_val", "y_test"])
+            X_train, X_val, X_test = arrays["X_train"], arrays["X_val"], arrays["X_test"]
+            y_train, y_val, y_test = arrays["y_train"], arrays["y_val"], arrays["y_test"]
+            counts_train = (run.load_arrays("split", ["counts_train"])["counts_train"]
+                            if "counts_train" in run.manifest["stages"]["split"].get("arrays", []) else None)
+            prep = run.load_object("preprocess")
+            self.scaler = prep["scaler"]
+            self.feature_transform = prep.get("feature_transform") or FeatureTransform.from_scaler(self.scaler)
+            self.feature_names = prep["feature_names"]
+            feature_names = self.feature_names
+        else:
+            X, y, feature_names = self.load_and_preprocess_data(data_folder)
+            
+            counts = self.row_counts if self.row_counts is not None else np.ones(len(y), dtype=np.int64)
+            
+            # Split data
+            X_train, X_test, y_train, y_test, counts_train, _ = train_test_split(
+                X, y, counts, test_size=0.2, random_state=42, stratify=y
+            )
+            X_train, X_val, y_train, y_val, counts_train, _ = train_test_split(
+                X_train, y_train, counts_train, test_size=0.2, random_state=42, stratify=y_train
+            )
+            run.save_object("preprocess", {"scaler": self.scaler, "feature_transform": self.feature_transform,
+                                           "feature_names": feature_names})
+            run.save_arrays("split", X_train=X_train, X_val=X_val, X_test=X_test,
+                            y_train=y_train, y_val=y_val, y_test=y_test, counts_train=counts_train)
         
         logger.info(f"  Train: {len(X_train)}, Val: {len(X_val)}, Test: {len(X_test)}")
         
-        # Train Random Forest
-        logger.info("🤖 Training Random Forest...")
-        self.models["rf"] = RandomForestClassifier(**config.MODEL_PARAMS["random_forest"])
-        self.models["rf"].fit(X_train, y_train)
-        logger.info(f"  ✅ RF Val Acc: {self.models['rf'].score(X_val, y_val):.2%}")
-        
-        # Train Gradient Boosting
-        logger.info("🤖 Training Gradient Boosting...")
-        self.models["gb"] = GradientBoostingClassifier(**config.MODEL_PARAMS["gradient_boosting"])
-        self.models["gb"].fit(X_train, y_train)
-        logger.info(f"  ✅ GB Val Acc: {self.models['gb'].score(X_val, y_val):.2%}")
-        
-        # Train SVM
-        logger.info("🤖 Training SVM...")
-        self.models["svm"] = SVC(**config.MODEL_PARAMS["svm"])
-        self.models["svm"].fit(X_train, y_train)
-        logger.info(f"  ✅ SVM Val Acc: {self.models['svm'].score(X_val, y_val):.2%}")
-        
-        # Train Neural Network
-        logger.info("🤖 Training Neural Network...")
-        self.models["nn"] = MLPClassifier(**config.MODEL_PARAMS["neural_network"])
-        self.models["nn"].fit(X_train, y_train)
-        logger.info(f"  ✅ NN Val Acc: {self.models['nn'].score(X_val, y_val):.2%}")
-        
-        # Train Isolation Forest
-        logger.info("🤖 Training Isolation Forest...")
-        self.models["iso"] = IsolationForest(**config.MODEL_PARAMS["isolation_forest"])
-        self.models["iso"].fit(X_train)
-        logger.info("  ✅ ISO trained")
-        
-        # Create ensemble
+        # Reference distribution for the live drift monitor, weighted back to the
+        # duplicates dropped before the split: live sketches count every copy
+        self.drift_baseline = DriftBaseline.fit(X_train, config.DRIFT["bins"], config.DRIFT["baseline_rows"],
+                                                counts=counts_train)
+        
+        for name, label, estimator, params_key in MEMBERS:
+            stage = f"model_{name}"
+            params = config.MODEL_PARAMS[params_key]
+            if run.is_done(stage, params):
+                self.models[name] = run.load_object(stage)
+                logger.info(f"⏩ {label} loaded from checkpoint")
+                continue
+            
+            logger.info(f"🤖 Training {label}...")
+            self.models[name] = estimator(**params)
+            if name == "iso":
+                self.models[name].fit(X_train)
+                logger.info("  ✅ ISO trained")
+            else:
+                self.models[name].fit(X_train, y_train)
+                logger.info(f"  ✅ {name.upper()} Val Acc: {self.models[name].score(X_val, y_val):.2%}")
+            run.save_object(stage, self.models[name], params_hash=run.params_hash(params))
+        
+        # Calibrate every member's raw score on the validation split
+        logger.info("📐 Calibrating members...")
+        self.calibrators = fit_calibrators(self.models, X_val, y_val, config.CALIBRATION)
+        
+        # Create ensemble: pick members and weights on the validation split
         logger.info("🤖 Creating Ensemble...")
-        self.ensemble = EnsembleVoting(self.models)
-        self.explainer = ThreatExplainer(self.models["rf"], feature_names)
+        self.ensemble_config = optimize_ensemble(self.models, X_val, y_val, config.ENSEMBLE_OPTIMIZER,
+                                                 calibrators=self.calibrators)
+        self.ensemble = EnsembleVoting(self.models, weights=self.ensemble_config["weights"],
+                                       calibrators=self.calibrators)
+        self.explainer = ThreatExplainer(self.models, feature_names, self.ensemble.weights)
         
         # Evaluate
-        y_pred = self.ensemble.predict(X_test)
-        y_pred_proba = self.ensemble.predict_proba(X_test)
+        y_pred, y_pred_proba = self.ensemble.score(X_test)
         
         accuracy = accuracy_score(y_test, y_pred)
         precision = precision_score(y_test, y_pred, zero_division=0)
@@ -199,11 +272,27 @@ class AdvancedThreatDetector:
             "train_samples": len(X_train),
             "val_samples": len(X_val),
             "test_samples": len(X_test),
+            "ensemble_weights": self.ensemble_config["weights"],
         }
         
+        run.mark_done("evaluate", **{k: v for k, v in self.metrics.items() if k != "confusion_matrix"})
         self.save(str(config.MODELS_FOLDER))
+        self.model_version = bundle_version(str(config.MODELS_FOLDER))
+        self.drift = DriftMonitor(self.drift_baseline, feature_names, self.model_version)
         return self.metrics
     
+    def _open_run(self, resume: bool, run_dir: Optional[str]) -> TrainingRun:
+        """Open the training-run directory for train_all"""
+        if run_dir:
+            return TrainingRun(run_dir)
+        if resume:
+            run = TrainingRun.latest(str(config.RUNS_FOLDER))
+            if run is not None:
+                logger.info(f"⏩ Resuming training run {run.run_dir}")
+                return run
+            logger.warning("⚠️ No previous training run found; starting a new one")
+        return TrainingRun.create(str(config.RUNS_FOLDER))
+    
     def predict(self, X: np.ndarray) -> Dict:
         """Make predictions on new data
         ✅ FIXED: Correct probability class indexing (use [:, 1] for attack class)
@@ -215,12 +304,27 @@ class AdvancedThreatDetector:
         if len(X.shape) == 1:
             X = X.reshape(1, -1)
         
+        n_rows = len(X)
+        metrics.histogram("predict_rows", bounds=BATCH_SIZE_BUCKETS).observe(n_rows)
+        start = time.perf_counter()
+        
+        # Byte-identical rows (keep-alives, repeated scans) are scored once
+        inverse = None
+        if config.DEDUP["predict"] and n_rows >= config.DEDUP["min_rows"]:
+            first, inverse = unique_rows(X)
+            if len(first) < n_rows:
+                X = X[first]
+                metrics.inc("predict_duplicate_rows_total", n_rows - len(first))
+            else:
+                inverse = None
+        
         # Preprocess
-        X_scaled = self.scaler.transform(X)
+        with metrics.timer("preprocess_seconds"):
+            X_scaled = self.transform(X)
         
         # Predict
-        predictions = self.ensemble.predict(X_scaled)
-        probabilities = self.ensemble.predict_proba(X_scaled)
+        # Votes and probabilities from one pass over the members
+        predictions, probabilities = self.ensemble.score(X_scaled)
         
         # ✅ CRITICAL FIX: Use correct probability class
         # probabilities shape: (n_samples, 2)
@@ -228,14 +332,48 @@ class AdvancedThreatDetector:
         # probabilities[:, 1] = probability of class 1 (ATTACK) ← USE THIS
         confidence = probabilities[:, 1]
         
+        # Drift sketches, paid for out of a share of the time just spent
+        if self.drift is not None:
+            self.drift.update(X_scaled, time.perf_counter() - start, index=inverse)
+        
+        if inverse is not None:
+            # Scatter back to the caller's rows
+            predictions, confidence, probabilities = predictions[inverse], confidence[inverse], probabilities[inverse]
+        
         result = {
             "prediction": predictions,
             "confidence": confidence,
-            "probability_matrix": probabilities
+            "probability_matrix": probabilities,
+            "dedup_ratio": 1.0 - len(X) / n_rows if n_rows else 0.0
         }
         
         return result
     
+    def explain(self, X: np.ndarray, top_k: int = None, budget_ms: float = None) -> Dict:
+        """Top-k feature attributions per row from the tree members (ml/explainer.py)"""
+        if self.explainer is None:
+            self.load(str(config.MODELS_FOLDER))
+        if len(X.shape) == 1:
+            X = X.reshape(1, -1)
+        with metrics.timer("explain_seconds"):
+            return self.explainer.explain(
+                self.transform(X), X,
+                top_k=config.EXPLAIN["top_k"] if top_k is None else top_k,
+                budget_ms=config.EXPLAIN["latency_budget_ms"] if budget_ms is None else budget_ms,
+            )
+    
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Raw features → model space (fused transform, or bare scaler for old bundles)"""
+        if self.feature_transform is not None:
+            return self.feature_transform.transform(X)
+        return self.scaler.transform(X)
+    
+    def shared_state(self) -> List:
+        """The fitted bundle pre-fork serving may mark read-only (utils.prefork.protect).
+        SVC is left out: libsvm's predict only takes writable buffers."""
+        models = [m for m in self.models.values() if not isinstance(m, SVC)]
+        return models + [self.scaler, self.feature_transform, self.calibrators, self.drift_baseline]
+
     def save(self, folder: str):
         """Save all models to disk"""
         Path(folder).mkdir(parents=True, exist_ok=True)
@@ -248,15 +386,25 @@ class AdvancedThreatDetector:
         
         with open(os.path.join(folder, config.MODEL_NAMES["scaler"]), "wb") as f:
             pickle.dump(self.scaler, f)
+        with open(os.path.join(folder, config.MODEL_NAMES["feature_transform"]), "wb") as f:
+            pickle.dump(self.feature_transform, f)
         with open(os.path.join(folder, config.MODEL_NAMES["features"]), "wb") as f:
             pickle.dump(self.feature_names, f)
         with open(os.path.join(folder, config.MODEL_NAMES["metrics"]), "wb") as f:
             pickle.dump(self.metrics, f)
+        with open(os.path.join(folder, config.MODEL_NAMES["ensemble"]), "wb") as f:
+            pickle.dump(self.ensemble_config, f)
+        with open(os.path.join(folder, config.MODEL_NAMES["calibrators"]), "wb") as f:
+            pickle.dump(self.calibrators, f)
+        if self.drift_baseline is not None:
+            with open(os.path.join(folder, config.MODEL_NAMES["drift_baseline"]), "wb") as f:
+                pickle.dump(self.drift_baseline, f)
         
         logger.info(f"✅ All models saved to {folder}")
     
     def load(self, folder: str):
         """Load all models from disk"""
+        start = time.perf_counter()
         for name in ["rf", "gb", "svm", "nn", "iso"]:
             path = os.path.join(folder, config.MODEL_NAMES[name])
             with open(path, "rb") as f:
@@ -264,10 +412,46 @@ class AdvancedThreatDetector:
         
         with open(os.path.join(folder, config.MODEL_NAMES["scaler"]), "rb") as f:
             self.scaler = pickle.load(f)
+        transform_path = os.path.join(folder, config.MODEL_NAMES["feature_transform"])
+        if os.path.exists(transform_path):
+            with open(transform_path, "rb") as f:
+                self.feature_transform = pickle.load(f)
+        else:
+            self.feature_transform = FeatureTransform.from_scaler(self.scaler)
         with open(os.path.join(folder, config.MODEL_NAMES["features"]), "rb") as f:
             self.feature_names = pickle.load(f)
         with open(os.path.join(folder, config.MODEL_NAMES["metrics"]), "rb") as f:
             self.metrics = pickle.load(f)
         
-        self.ensemble = EnsembleVoting(self.models)
-        logger.info(f"✅ All models loaded from {folder}")
\ No newline at end of file
+        # Bundles trained before the ensemble optimizer have no config: equal weights
+        ensemble_path = os.path.join(folder, config.MODEL_NAMES["ensemble"])
+        self.ensemble_config = None
+        if os.path.exists(ensemble_path):
+            with open(ensemble_path, "rb") as f:
+                self.ensemble_config = pickle.load(f)
+        weights = self.ensemble_config["weights"] if self.ensemble_config else None
+        calibrators_path = os.path.join(folder, config.MODEL_NAMES["calibrators"])
+        self.calibrators = {}
+        if os.path.exists(calibrators_path):
+            with open(calibrators_path, "rb") as f:
+                self.calibrators = pickle.load(f)
+        self.ensemble = EnsembleVoting(self.models, weights=weights, calibrators=self.calibrators)
+        self.explainer = ThreatExplainer(self.models, self.feature_names, self.ensemble.weights)
+        
+        # Bundles trained before the drift monitor have no baseline: assume standardized features
+        baseline_path = os.path.join(folder, config.MODEL_NAMES["drift_baseline"])
+        if os.path.exists(baseline_path):
+            with open(baseline_path, "rb") as f:
+                self.drift_baseline = pickle.load(f)
+        else:
+            self.drift_baseline = DriftBaseline.gaussian(len(self.feature_names), config.DRIFT["bins"])
+            logger.warning("⚠️ No drift baseline in bundle; comparing against N(0, 1)")
+
+        self.model_version = bundle_version(folder)
+        self.drift = DriftMonitor(self.drift_baseline, self.feature_names, self.model_version)
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+        metrics.set_info("model_bundle_info", version=self.model_version)
+        metrics.set_gauge("model_load_seconds", self.load_seconds)
+        metrics.set_gauge("model_loaded_timestamp_seconds", self.loaded_at)
+        logger.info(f"✅ All models loaded from {folder} (version {self.model_version}, {self.load_seconds:.2f}s)")
\ No newline at end of file
@@ -0,0 +1,314 @@
+"""
+Feature Drift Monitor
+Compares live traffic with the training distribution feature by feature, in
+model space (after FeatureTransform, so every value is finite). train_all
+stores a baseline: quantile bin edges per feature, the share of training rows
+in each bin, and the mean/variance. predict() folds rows into time-slotted
+sketches of the same shape (bin counts, plus mean/M2 merged with Chan's
+formula), and report() compares the slots inside the window with the baseline:
+
+  psi   population stability index over the quantile bins
+  ks    largest gap between the binned CDFs (a lower bound on the KS statistic)
+
+Sketch updates are paid for out of a budget earned by inference time
+(DRIFT["overhead_budget"]); batches that arrive with too little budget are
+skipped, so the monitor costs a fixed fraction of scoring. With DRIFT_DIR set,
+each gunicorn worker flushes its slots there and reports merge them.
+"""
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.stats import norm
+
+import config
+
+logger = logging.getLogger(__name__)
+
+KS_C_ALPHA = 1.358  # Two-sample KS critical coefficient at alpha = 0.05
+
+
+def bin_counts(X: np.ndarray, edge_columns: List[np.ndarray]) -> np.ndarray:
+    """(features, bins) row counts: x is in bin k when edges[k-1] < x <= edges[k]
+
+    edge_columns[k] holds edge k of every feature, so binning is one
+    vectorized comparison per edge rather than a search per feature.
+    """
+    n_features, n_bins = X.shape[1], len(edge_columns) + 1
+    index = np.empty(X.shape, dtype=np.intp)
+    index[:] = np.arange(n_features) * n_bins
+    above = np.empty(X.shape, dtype=bool)
+    for edge in edge_columns:
+        np.greater(X, edge, out=above)
+        index += above
+    return np.bincount(index.ravel(), minlength=n_features * n_bins).reshape(n_features, n_bins)
+
+
+def merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """Chan et al. pairwise merge of (count, mean, sum of squared deviations)"""
+    n = n_a + n_b
+    if n == 0:
+        return 0, mean_a, m2_a
+    delta = mean_b - mean_a
+    return n, mean_a + delta * (n_b / n), m2_a + m2_b + delta ** 2 * (n_a * n_b / n)
+
+
+class DriftBaseline:
+    """Training distribution per feature: quantile edges, bin shares, mean and variance"""
+
+    def __init__(self, edges: np.ndarray, proportions: np.ndarray, mean: np.ndarray,
+                 var: np.ndarray, n: int, source: str):
+        self.edges = edges
+        self.proportions = proportions
+        self.mean = mean
+        self.var = var
+        self.n = n
+        self.source = source
+
+    @classmethod
+    def fit(cls, X: np.ndarray, bins: int = 20, max_rows: int = 200000, seed: int = 42,
+            counts: Optional[np.ndarray] = None) -> "DriftBaseline":
+        """Baseline from model-space training rows
+
+        counts: how many raw rows each row of X stands for, when X was deduplicated
+        """
+        if counts is not None:
+            total = int(counts.sum())
+            if total <= max_rows:
+                X = np.repeat(X, counts, axis=0)
+            else:
+                X = X[np.random.default_rng(seed).choice(len(X), max_rows, p=counts / total)]
+        elif len(X) > max_rows:
+            X = X[np.random.default_rng(seed).choice(len(X), max_rows, replace=False)]
+        quantiles = np.quantile(X, np.linspace(0, 1, bins + 1)[1:-1], axis=0).T
+        # Tied quantiles (e.g. a feature that is mostly 0) collapse into one
+        # edge; the spare edges go to +inf and their bins stay empty
+        edges = np.full_like(quantiles, np.inf)
+        for j, q in enumerate(quantiles):
+            unique = np.unique(q)
+            edges[j, :len(unique)] = unique
+        columns = [np.ascontiguousarray(c) for c in edges.T]
+        counts = sum(bin_counts(X[i:i + 10000], columns) for i in range(0, len(X), 10000))
+        return cls(edges, counts / len(X), X.mean(axis=0), X.var(axis=0), len(X), "training")
+
+    @classmethod
+    def gaussian(cls, n_features: int, bins: int = 20) -> "DriftBaseline":
+        """Fallback for bundles saved without a baseline: the scaler standardizes
+        every feature, so assume N(0, 1) (approximate for skewed features)"""
+        edges = np.tile(norm.ppf(np.linspace(0, 1, bins + 1)[1:-1]), (n_features, 1))
+        return cls(edges, np.full((n_features, bins), 1.0 / bins), np.zeros(n_features),
+                   np.ones(n_features), 0, "gaussian")
+
+
+class DriftMonitor:
+    """Streaming per-feature sketches of live traffic, scored against a baseline"""
+
+    def __init__(self, baseline: DriftBaseline, feature_names: List[str], version: Optional[str] = None,
+                 settings: Dict = None, store_dir: Optional[str] = None):
+        self.baseline = baseline
+        self.feature_names = list(feature_names)
+        self.version = version
+        self.settings = settings or config.DRIFT
+        self.store_dir = store_dir if store_dir is not None else config.DRIFT_DIR
+        self._columns = [np.ascontiguousarray(c) for c in baseline.edges.T]
+        self._lock = threading.Lock()
+        self._slots: Dict[int, list] = {}  # slot id → [counts, n, mean, m2]
+        self._credit = 0.0
+        self.rows_seen = 0
+        self.rows_sampled = 0
+        self.inference_seconds = 0.0
+        self.sketch_seconds = 0.0
+        self._fixed, self._per_row = self._calibrate()
+        self._max_credit = self._fixed + self._per_row * self.settings["max_rows_per_update"]
+        self._dirty = False
+        self._thread = None
+        self._pid = None
+
+    def _sketch(self, X: np.ndarray):
+        mean = X.mean(axis=0)
+        return bin_counts(X, self._columns), len(X), mean, ((X - mean) ** 2).sum(axis=0)
+
+    def _calibrate(self):
+        """(fixed seconds, seconds per row) of one sketch update, from timed warm-up calls"""
+        timings = {}
+        for rows in (1, 256):
+            X = np.zeros((rows, len(self.feature_names)))
+            self._sketch(X)
+            start = time.perf_counter()
+            self._sketch(X)
+            timings[rows] = time.perf_counter() - start
+        per_row = max(timings[256] - timings[1], 1e-9) / 255
+        return max(timings[1] - per_row, 0.0), per_row
+
+    # --- updates -----------------------------------------------------------
+
+    def update(self, X: np.ndarray, inference_seconds: float, index: np.ndarray = None):
+        """Fold a model-space predict batch into the current slot, within the overhead budget
+
+        index: the batch's rows as positions in X, when X holds each distinct row once
+        """
+        n = len(X) if index is None else len(index)
+        with self._lock:
+            self.rows_seen += n
+            self.inference_seconds += inference_seconds
+            self._credit = min(self._credit + inference_seconds * self.settings["overhead_budget"],
+                               self._max_credit)
+            rows = min(n, self.settings["max_rows_per_update"], int((self._credit - self._fixed) / self._per_row))
+            if rows < 1:
+                return
+            estimate = self._fixed + rows * self._per_row
+            self._credit -= estimate
+
+        start = time.perf_counter()
+        if rows < n:
+            picked = np.linspace(0, n - 1, rows).astype(np.intp)
+            X = X[picked if index is None else index[picked]]
+        elif index is not None:
+            X = X[index]
+        counts, m, mean, m2 = self._sketch(X)
+        slot = int(time.time() // self.settings["slot_seconds"])
+        with self._lock:
+            current = self._slots.get(slot)
+            if current is None:
+                self._slots[slot] = [counts, m, mean, m2]
+                oldest = slot - self.settings["window_seconds"] // self.settings["slot_seconds"]
+                for old in [s for s in self._slots if s < oldest]:
+                    del self._slots[old]
+            else:
+                current[0] += counts
+                current[1:] = merge_moments(*current[1:], m, mean, m2)
+            spent = time.perf_counter() - start
+            self._credit += estimate - spent
+            self.rows_sampled += rows
+            self.sketch_seconds += spent
+            self._dirty = True
+        if self.store_dir:
+            self._ensure_flusher()
+
+    # --- cross-worker files ------------------------------------------------
+
+    def _ensure_flusher(self):
+        """Start the flush thread in this process (again after a fork)"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="drift-flush")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.settings["flush_seconds"])
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Drift sketch flush failed: {e}")
+
+    def _state(self) -> Dict:
+        n_features = len(self.feature_names)
+        with self._lock:
+            slots = sorted(self._slots)
+            return {
+                "version": np.array(self.version or ""),
+                "slots": np.array(slots, dtype=np.int64),
+                "counts": np.array([self._slots[s][0] for s in slots]).reshape(len(slots), *self.baseline.proportions.shape),
+                "n": np.array([self._slots[s][1] for s in slots], dtype=np.int64),
+                "mean": np.array([self._slots[s][2] for s in slots]).reshape(len(slots), n_features),
+                "m2": np.array([self._slots[s][3] for s in slots]).reshape(len(slots), n_features),
+                "totals": np.array([self.rows_seen, self.rows_sampled, self.inference_seconds, self.sketch_seconds]),
+            }
+
+    def flush(self):
+        """Write this worker's slots to DRIFT_DIR/<pid>.npz if they changed"""
+        if not self.store_dir or not self._dirty:
+            return
+        self._dirty = False
+        Path(self.store_dir).mkdir(parents=True, exist_ok=True)
+        tmp = os.path.join(self.store_dir, f".{os.getpid()}.tmp.npz")
+        np.savez(tmp, **self._state())
+        os.replace(tmp, os.path.join(self.store_dir, f"{os.getpid()}.npz"))
+
+    def _worker_states(self) -> List[Dict]:
+        """This process's state plus every other worker's flushed file for the same bundle"""
+        states = [self._state()]
+        if self.store_dir and os.path.isdir(self.store_dir):
+            own = f"{os.getpid()}.npz"
+            for name in os.listdir(self.store_dir):
+                if not name.endswith(".npz") or name.startswith(".") or name == own:
+                    continue
+                try:
+                    with np.load(os.path.join(self.store_dir, name)) as f:
+                        state = {key: f[key] for key in f.files}
+                except (OSError, ValueError):
+                    continue  # Replaced mid-read
+                if str(state["version"]) == (self.version or "") and state["counts"].shape[1:] == self.baseline.proportions.shape:
+                    states.append(state)
+        return states
+
+    # --- scoring -----------------------------------------------------------
+
+    def report(self, window_seconds: Optional[float] = None, top: Optional[int] = None) -> Dict:
+        """Drift scores of the last window_seconds of traffic (all workers)"""
+        window = min(window_seconds or self.settings["window_seconds"], self.settings["window_seconds"])
+        first = int((time.time() - window) // self.settings["slot_seconds"])
+        states = self._worker_states()
+
+        counts = np.zeros(self.baseline.proportions.shape)
+        n, mean, m2 = 0, np.zeros(len(self.feature_names)), np.zeros(len(self.feature_names))
+        totals = np.zeros(4)
+        for state in states:
+            totals += state["totals"]
+            for i, slot in enumerate(state["slots"]):
+                if slot >= first:
+                    counts += state["counts"][i]
+                    n, mean, m2 = merge_moments(n, mean, m2, int(state["n"][i]), state["mean"][i], state["m2"][i])
+
+        report = {
+            "model_version": self.version,
+            "baseline": self.baseline.source,
+            "window_seconds": window,
+            "samples": n,
+            "rows_seen": int(totals[0]),
+            "rows_sampled": int(totals[1]),
+            "overhead_ratio": float(totals[3] / totals[2]) if totals[2] else 0.0,
+            "workers": len(states),
+        }
+        if n < self.settings["min_samples"]:
+            return {**report, "status": "insufficient_data", "features": []}
+
+        base = self.baseline
+        live = counts / n
+        eps = self.settings["epsilon"]
+        p, q = np.maximum(live, eps), np.maximum(base.proportions, eps)
+        psi = ((p - q) * np.log(p / q)).sum(axis=1)
+        ks = np.abs(np.cumsum(live, axis=1) - np.cumsum(base.proportions, axis=1)).max(axis=1)
+        base_sd = np.sqrt(base.var)
+        var = m2 / n
+        mean_shift = np.divide(mean - base.mean, base_sd, out=np.zeros_like(mean), where=base_sd > 0)
+        var_ratio = np.divide(var, base.var, out=np.ones_like(var), where=base.var > 0)
+
+        warning, alert = self.settings["psi_warning"], self.settings["psi_alert"]
+        order = np.argsort(-psi)[:top or self.settings["top_features"]]
+        return {
+            **report,
+            "status": "drift" if psi.max() >= alert else "warning" if psi.max() >= warning else "stable",
+            "psi_max": float(psi.max()),
+            "psi_mean": float(psi.mean()),
+            "features_warning": int(((psi >= warning) & (psi < alert)).sum()),
+            "features_drifting": int((psi >= alert).sum()),
+            # Critical KS distance at alpha 0.05 (one-sample against the Gaussian fallback)
+            "ks_critical": float(KS_C_ALPHA * np.sqrt((n + base.n) / (n * base.n)) if base.n else KS_C_ALPHA / np.sqrt(n)),
+            "features": [{
+                "feature": self.feature_names[j],
+                "psi": float(psi[j]),
+                "ks": float(ks[j]),
+                "mean_shift": float(mean_shift[j]),
+                "var_ratio": float(var_ratio[j]),
+            } for j in order],
+        }
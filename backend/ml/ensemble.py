@@ -1,74 +1,203 @@
 """Ensemble Voting - FINAL FIXED VERSION"""
+import time
 import numpy as np
 import logging
+from typing import Dict, Optional, Tuple
+from scipy.optimize import nnls
+from sklearn.ensemble import IsolationForest
+from sklearn.metrics import roc_auc_score
+
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+
+def member_scores(model, X):
+    """Attack score for one member: higher means more likely an attack"""
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(X)[:, 1]
+    scores = model.decision_function(X)
+    # IsolationForest scores inliers high, so flip it
+    return -scores if isinstance(model, IsolationForest) else scores
+
+
 class EnsembleVoting:
-    """5-Model Voting Ensemble - PRODUCTION READY"""
-    
-    def __init__(self, models):
+    """5-Model Voting Ensemble - PRODUCTION READY
+
+    weights maps member name → vote weight. Members missing from weights
+    (or weighted 0) are never evaluated. None means equal weights.
+    calibrators maps member name → score→probability table (ml/calibration.py).
+    """
+
+    def __init__(self, models, weights: Optional[Dict[str, float]] = None,
+                 calibrators: Optional[Dict] = None):
         self.models = models
-        logger.info("✅ Ensemble created with 5 models")
-    
+        self.calibrators = calibrators or {}
+        if weights is None:
+            weights = {name: 1.0 for name in models}
+        self.weights = {name: float(w) for name, w in weights.items() if w > 0 and name in models}
+        logger.info(f"✅ Ensemble created with {len(self.weights)} models")
+
+    def score(self, X) -> Tuple[np.ndarray, np.ndarray]:
+        """Weighted-majority votes and (n, 2) probabilities from one pass over the members"""
+        probas = self._member_probas(X)
+        return self._vote(X, probas), self._average(len(X), probas)
+
     def predict(self, X):
-        """Majority voting"""
-        predictions = []
-        for name, model in self.models.items():
-            if hasattr(model, 'predict'):
-                try:
-                    pred = model.predict(X)
-                    predictions.append(pred)
-                except:
-                    pass
-        
-        if not predictions:
-            return np.zeros(len(X), dtype=int)
+        """Weighted majority voting"""
+        return self.score(X)[0]
+
+    def member_proba(self, name, X):
+        """P(attack) from one member, shape (n_samples,)"""
+        model = self.models[name]
+        if name in self.calibrators:
+            return self.calibrators[name](member_scores(model, X))
         
-        predictions = np.array(predictions)
-        return (np.mean(predictions.astype(float), axis=0) > 0.5).astype(int)
-    
+        if hasattr(model, 'predict_proba'):
+            proba = model.predict_proba(X)
+
+            # Handle different output shapes
+            if proba.ndim == 2:
+                return proba[:, 1] if proba.shape[1] == 2 else proba[:, 0]
+            return proba  # Isolation Forest style output
+
+        # SVM-style output
+        scores = model.decision_function(X)
+        return 1 / (1 + np.exp(-scores))  # Sigmoid
+
     def predict_proba(self, X):
-        """Average probabilities - FIXED FOR ALL MODELS"""
-        probas = []
-        
-        for name, model in self.models.items():
+        """Weighted average of member probabilities - FIXED FOR ALL MODELS"""
+        return self._average(len(X), self._member_probas(X))
+
+    def _member_probas(self, X) -> Dict[str, np.ndarray]:
+        """P(attack) of every weighted member, each evaluated once; failing members are left out"""
+        probas = {}
+        for name in self.weights:
             try:
-                if hasattr(model, 'predict_proba'):
-                    proba = model.predict_proba(X)
-                    
-                    # Handle different output shapes
-                    if proba.ndim == 2:
-                        if proba.shape[1] == 2:
-                            probas.append(proba)
-                        else:
-                            # Single class output - convert to binary
-                            probas.append(np.column_stack([1-proba[:, 0], proba[:, 0]]))
-                    elif proba.ndim == 1:
-                        # Isolation Forest style output
-                        probas.append(np.column_stack([1-proba, proba]))
-                
-                elif hasattr(model, 'decision_function'):
-                    # SVM-style output
-                    scores = model.decision_function(X)
-                    proba = 1 / (1 + np.exp(-scores))  # Sigmoid
-                    probas.append(np.column_stack([1-proba, proba]))
-                    
+                with metrics.timer("model_inference_seconds", model=name):
+                    probas[name] = self.member_proba(name, X)
             except Exception as e:
                 logger.debug(f"Model {name} proba failed: {e}")
-                continue
-        
-        if not probas:
+        return probas
+
+    def _vote(self, X, probas: Dict[str, np.ndarray]):
+        votes = np.zeros(len(X))
+        total = 0.0
+        for name, weight in self.weights.items():
+            model = self.models[name]
+            if name in self.calibrators:
+                if name in probas:
+                    votes += weight * (probas[name] > 0.5)
+                    total += weight
+            elif hasattr(model, 'predict'):
+                # Uncalibrated members (bundles from before calibration) keep their own hard vote
+                try:
+                    pred = model.predict(X)
+                    if isinstance(model, IsolationForest):
+                        pred = (pred == -1)  # -1 = outlier → attack vote
+                    votes += weight * pred.astype(float)
+                    total += weight
+                except:
+                    pass
+
+        if total == 0:
+            return np.zeros(len(X), dtype=int)
+
+        return (votes / total > 0.5).astype(int)
+
+    def _average(self, n: int, probas: Dict[str, np.ndarray]):
+        attack = np.zeros(n)
+        total = 0.0
+        for name, proba in probas.items():
+            attack += self.weights[name] * proba
+            total += self.weights[name]
+
+        if total == 0:
             # Fallback
-            return np.random.uniform(0.4, 0.6, (len(X), 2))
-        
-        # Stack and average
-        probas_array = np.stack(probas, axis=0)  # (n_models, n_samples, 2)
-        avg_proba = np.mean(probas_array, axis=0)  # (n_samples, 2)
-        
-        # Normalize to ensure probabilities sum to 1
-        row_sums = avg_proba.sum(axis=1, keepdims=True)
-        avg_proba = np.divide(avg_proba, row_sums, out=np.ones_like(avg_proba), 
-                            where=row_sums != 0)
-        
-        return avg_proba
+            return np.random.uniform(0.4, 0.6, (n, 2))
+
+        attack = np.clip(attack / total, 0.0, 1.0)
+        return np.column_stack([1 - attack, attack])
+
+
+def _time_member(ensemble: EnsembleVoting, name: str, X: np.ndarray, repeats: int) -> float:
+    """Median wall time (ms) for one member to score X"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ensemble.member_proba(name, X)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def _fit_weights(P: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Non-negative vote weights (sum 1) fitted to the labels"""
+    weights, _ = nnls(P, y.astype(float))
+    if weights.sum() <= 0:
+        weights = np.ones(P.shape[1])
+    return weights / weights.sum()
+
+
+def _auc(y: np.ndarray, scores: np.ndarray) -> float:
+    return float(roc_auc_score(y, scores)) if len(np.unique(y)) == 2 else 0.5
+
+
+def optimize_ensemble(models: Dict, X_val: np.ndarray, y_val: np.ndarray, settings: Dict,
+                      calibrators: Optional[Dict] = None) -> Dict:
+    """Choose members and vote weights on the validation split under a latency budget
+
+    Each member's scoring cost is timed on a request-sized batch. Members are
+    added greedily by validation AUC gain (with NNLS-fitted weights) while the
+    summed cost stays within settings["latency_budget_ms"].
+    """
+    y_val = np.asarray(y_val)
+    full = EnsembleVoting(models, calibrators=calibrators)
+    names = list(full.weights)
+
+    batch = np.asarray(X_val[:settings["latency_batch_size"]])
+    cost_ms = {name: _time_member(full, name, batch, settings["timing_repeats"]) for name in names}
+    P = np.column_stack([full.member_proba(name, X_val) for name in names])
+
+    # Marginal contribution: AUC lost when a member is left out of the equal-weight vote
+    full_auc = _auc(y_val, P.mean(axis=1))
+    marginal = {}
+    for i, name in enumerate(names):
+        rest = np.delete(P, i, axis=1)
+        marginal[name] = full_auc - _auc(y_val, rest.mean(axis=1)) if rest.shape[1] else full_auc
+
+    selected, best_auc, spent = [], 0.5, 0.0
+    while True:
+        best = None
+        for i, name in enumerate(names):
+            if name in selected or spent + cost_ms[name] > settings["latency_budget_ms"]:
+                continue
+            cols = [names.index(s) for s in selected] + [i]
+            auc = _auc(y_val, P[:, cols] @ _fit_weights(P[:, cols], y_val))
+            if best is None or auc > best[1]:
+                best = (name, auc)
+        if best is None or (selected and best[1] - best_auc < settings["min_auc_gain"]):
+            break
+        selected.append(best[0])
+        best_auc = best[1]
+        spent += cost_ms[best[0]]
+
+    if not selected:
+        # Nothing fits the budget: fall back to the single cheapest member
+        selected = [min(names, key=cost_ms.get)]
+        logger.warning(f"⚠️ No member fits the {settings['latency_budget_ms']} ms budget; using {selected[0]}")
+
+    cols = [names.index(s) for s in selected]
+    weights = dict(zip(selected, _fit_weights(P[:, cols], y_val).tolist()))
+    result = {
+        "weights": weights,
+        "val_auc": _auc(y_val, P[:, cols] @ np.array([weights[s] for s in selected])),
+        "full_val_auc": full_auc,
+        "latency_ms": cost_ms,
+        "selected_latency_ms": float(sum(cost_ms[s] for s in selected)),
+        "marginal_auc": marginal,
+        "member_auc": {name: _auc(y_val, P[:, i]) for i, name in enumerate(names)},
+        "settings": dict(settings),
+    }
+    logger.info(f"⚖️ Ensemble: {weights} | val AUC {result['val_auc']:.4f} "
+                f"(all members {full_auc:.4f}) | {result['selected_latency_ms']:.2f} ms")
+    return result
@@ -1,18 +1,226 @@
-"""SHAP Explainer"""
+"""
+Per-prediction Explanations
+Exact path-based attributions for the tree members: a tree's output is its
+root value plus, for every split on the sample's path, the change in node
+value credited to the split feature. Summing the path changes per leaf once
+at load gives a sparse (leaves × features) table, so explaining a batch is
+model.apply() plus one sparse product; no per-row Python.
+
+  rf: contributions in probability of attack (bias + sum == predict_proba[:, 1])
+  gb: contributions in log-odds (bias + sum == decision_function)
+"""
+import math
+import struct
+import time
 import logging
+import numpy as np
+from scipy import sparse
+from typing import Dict, List, Optional
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 
 logger = logging.getLogger(__name__)
 
-class ThreatExplainer:
-    """Feature importance explanation"""
-    
-    def __init__(self, model, feature_names):
+
+def _leaf_table(trees, n_features: int):
+    """Sparse (total nodes × features) path contributions, leaf rows filled
+
+    trees: list of (sklearn Tree, per-node value, scale)
+    """
+    rows, cols, vals = [], [], []
+    offsets = np.zeros(len(trees), dtype=np.int64)
+    bias, offset = 0.0, 0
+    for t, (tree, value, scale) in enumerate(trees):
+        nodes = np.arange(tree.node_count)
+        internal = tree.children_left != -1
+        parent = np.full(tree.node_count, -1, dtype=np.int64)
+        parent[tree.children_left[internal]] = nodes[internal]
+        parent[tree.children_right[internal]] = nodes[internal]
+
+        # Walk every leaf up to the root together, one depth level per step
+        leaf = np.flatnonzero(~internal)
+        node = leaf
+        while len(node):
+            up = parent[node]
+            keep = up >= 0
+            leaf, node, up = leaf[keep], node[keep], up[keep]
+            rows.append(leaf + offset)
+            cols.append(tree.feature[up])
+            vals.append(scale * (value[node] - value[up]))
+            node = up
+        offsets[t] = offset
+        bias += scale * value[0]
+        offset += tree.node_count
+    # Duplicate (leaf, feature) entries are summed
+    table = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                              shape=(offset, n_features))
+    return table, offsets, bias
+
+
+class TreeContributions:
+    """Path attributions for one fitted tree ensemble"""
+
+    def __init__(self, model, n_features: int):
         self.model = model
-        self.feature_names = feature_names
-        logger.info("✅ ThreatExplainer initialized")
-    
-    def explain(self, X):
-        """Get feature importance"""
-        if hasattr(self.model, 'feature_importances_'):
-            return self.model.feature_importances_
-        return None
\ No newline at end of file
+        if isinstance(model, RandomForestClassifier):
+            self.unit = "probability"
+            attack = list(model.classes_).index(1) if 1 in model.classes_ else -1
+            trees = []
+            for est in model.estimators_:
+                value = est.tree_.value[:, 0, :]
+                trees.append((est.tree_, value[:, attack] / value.sum(axis=1), 1.0 / len(model.estimators_)))
+            self.table, self.offsets, self.bias = _leaf_table(trees, n_features)
+        elif isinstance(model, GradientBoostingClassifier) and model.estimators_.shape[1] == 1:
+            self.unit = "log_odds"
+            trees = [(est.tree_, est.tree_.value[:, 0, 0], model.learning_rate) for est in model.estimators_[:, 0]]
+            self.table, self.offsets, _ = _leaf_table(trees, n_features)
+            # The init estimator's prior is constant: read it off one sample
+            zero = np.zeros((1, n_features))
+            self.bias = float(model.decision_function(zero)[0] - self.contributions(zero).sum())
+        else:
+            raise TypeError(f"No path attributions for {type(model).__name__}")
+        self.bias = float(self.bias)
+
+    def contributions(self, X: np.ndarray) -> np.ndarray:
+        """(n_samples, n_features) attributions for model-space rows"""
+        leaves = self.model.apply(X).reshape(len(X), -1)
+        n_trees = leaves.shape[1]
+        cols = (leaves + self.offsets).ravel()
+        indicator = sparse.csr_matrix((np.ones(cols.size), cols, np.arange(0, cols.size + 1, n_trees)),
+                                      shape=(len(X), self.table.shape[0]))
+        return (indicator @ self.table).toarray()
+
+    @staticmethod
+    def supported(model) -> bool:
+        return isinstance(model, RandomForestClassifier) or (
+            isinstance(model, GradientBoostingClassifier) and model.estimators_.shape[1] == 1)
+
+
+class ThreatExplainer:
+    """Per-sample feature attributions from the voting tree members"""
+
+    def __init__(self, models: Dict, feature_names: List[str], weights: Optional[Dict[str, float]] = None):
+        self.feature_names = list(feature_names)
+        self.feature_index = {name: i for i, name in enumerate(self.feature_names)}
+        trees = {name: m for name, m in models.items() if TreeContributions.supported(m)}
+        voting = {name: m for name, m in trees.items() if weights is None or weights.get(name, 0) > 0}
+        self.members = {name: TreeContributions(m, len(self.feature_names)) for name, m in (voting or trees).items()}
+        weights = weights or {}
+        self.weights = {name: weights.get(name, 1.0) or 1.0 for name in self.members}
+        self.cost = {name: self._calibrate(member) for name, member in self.members.items()}
+        logger.info(f"✅ ThreatExplainer initialized ({', '.join(self.members) or 'no tree members'})")
+
+    def _calibrate(self, member: TreeContributions):
+        """(fixed seconds, seconds per row) for one member, from timed warm-up calls"""
+        n = len(self.feature_names)
+        timings = {}
+        for rows in (1, 256):
+            X = np.zeros((rows, n))
+            member.contributions(X)
+            start = time.perf_counter()
+            member.contributions(X)
+            timings[rows] = time.perf_counter() - start
+        per_row = max(timings[256] - timings[1], 0.0) / 255
+        return max(timings[1] - per_row, 0.0), per_row
+
+    def rows_within(self, n_rows: int, budget_ms: float) -> int:
+        """How many rows fit the latency budget (always at least one)"""
+        fixed = sum(c[0] for c in self.cost.values())
+        per_row = sum(c[1] for c in self.cost.values())
+        if per_row <= 0:
+            return n_rows
+        return int(min(n_rows, max(1, (budget_ms / 1000 - fixed) / per_row)))
+
+    def explain(self, X: np.ndarray, X_raw: np.ndarray, top_k: int = 5, budget_ms: float = 50.0) -> Dict:
+        """Top-k attributions per row; rows past the latency budget are left unexplained
+
+        X: model-space rows; X_raw: the request's values, reported next to each feature.
+        "top_features" ranks each member's share of its total attribution, averaged
+        with the ensemble weights (positive = pushes towards attack).
+        """
+        total = len(X)
+        n = self.rows_within(total, budget_ms)
+        X, X_raw = X[:n], X_raw[:n]
+        k = min(top_k, len(self.feature_names))
+
+        per_member = {}
+        combined = np.zeros((n, len(self.feature_names)))
+        for name, member in self.members.items():
+            contrib = member.contributions(X)
+            per_member[name] = contrib
+            scale = np.abs(contrib).sum(axis=1, keepdims=True)
+            combined += self.weights[name] * np.divide(contrib, scale, out=np.zeros_like(contrib), where=scale > 0)
+        combined /= max(sum(self.weights.values()), 1e-12)
+
+        explanations = [{"top_features": [], "members": {}} for _ in range(n)]
+        for name, matrix in [("top_features", combined)] + list(per_member.items()):
+            idx = self._top(matrix, k)
+            values = np.take_along_axis(matrix, idx, axis=1)
+            raw = np.take_along_axis(X_raw, idx, axis=1)
+            for row, (cols, vals, raws) in enumerate(zip(idx.tolist(), values.tolist(), raw.tolist())):
+                items = [{"feature": self.feature_names[c], "value": r if math.isfinite(r) else None,
+                          "contribution": v} for c, v, r in zip(cols, vals, raws)]
+                if name == "top_features":
+                    explanations[row]["top_features"] = items
+                else:
+                    explanations[row]["members"][name] = {
+                        "base": self.members[name].bias,
+                        "output": self.members[name].bias + float(per_member[name][row].sum()),
+                        "contributions": items,
+                    }
+        return {
+            "explained_rows": n,
+            "truncated": n < total,
+            "units": {name: m.unit for name, m in self.members.items()},
+            "explanations": explanations,
+        }
+
+    @staticmethod
+    def _top(matrix: np.ndarray, k: int) -> np.ndarray:
+        """Column indices of the k largest |values| per row, largest first"""
+        if k <= 0:
+            return np.zeros((len(matrix), 0), dtype=np.int64)
+        magnitude = np.abs(matrix)
+        idx = np.argpartition(-magnitude, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(magnitude, idx, axis=1), axis=1)
+        return np.take_along_axis(idx, order, axis=1)
+
+    # --- compact storage ---------------------------------------------------
+
+    def pack(self, explanation: Dict) -> bytes:
+        """One row's explanation as bytes: per group k uint16 feature ids + float32 values/contributions"""
+        index = self.feature_index
+        groups = [("", None, explanation["top_features"])] + [
+            (name, m, m["contributions"]) for name, m in explanation["members"].items()]
+        k = len(explanation["top_features"])
+        out = [struct.pack("<BBB", 1, k, len(groups) - 1)]
+        for name, member, items in groups:
+            if member is not None:
+                encoded = name.encode()
+                out.append(struct.pack(f"<B{len(encoded)}sdd", len(encoded), encoded,
+                                       member["base"], member["output"]))
+            out.append(np.array([index[i["feature"]] for i in items], dtype="<u2").tobytes())
+            out.append(np.array([np.nan if i["value"] is None else i["value"] for i in items], dtype="<f4").tobytes())
+            out.append(np.array([i["contribution"] for i in items], dtype="<f4").tobytes())
+        return b"".join(out)
+
+    def unpack(self, blob: bytes) -> Dict:
+        """Inverse of pack (values and contributions come back as float32)"""
+        _, k, n_members = struct.unpack_from("<BBB", blob)
+        pos = 3
+
+        def items():
+            nonlocal pos
+            idx = np.frombuffer(blob, dtype="<u2", count=k, offset=pos)
+            values = np.frombuffer(blob, dtype="<f4", count=k, offset=pos + 2 * k)
+            contrib = np.frombuffer(blob, dtype="<f4", count=k, offset=pos + 6 * k)
+            pos += 10 * k
+            return [{"feature": self.feature_names[i], "value": v if math.isfinite(v) else None,
+                     "contribution": c} for i, v, c in zip(idx.tolist(), values.tolist(), contrib.tolist())]
+
+        explanation = {"top_features": items(), "members": {}}
+        for _ in range(n_members):
+            (length,) = struct.unpack_from("<B", blob, pos)
+            name, base, output = struct.unpack_from(f"<{length}sdd", blob, pos + 1)
+            pos += 1 + length + 16
+            explanation["members"][name.decode()] = {"base": base, "output": output, "contributions": items()}
+        return explanation
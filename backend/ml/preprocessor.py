@@ -4,8 +4,9 @@ Data Preprocessor - Handles all 3 sources
 import pandas as pd
 import numpy as np
 import logging
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -93,4 +94,129 @@ class DataPreprocessor:
         aligned = [d[list(common_cols)].reset_index(drop=True) for d in dfs]
         combined = pd.concat(aligned, ignore_index=True)
         logger.info(f"  ✅ Combined: {len(combined)} rows")
-        return combined
\ No newline at end of file
+        return combined
+
+class FeatureTransform:
+    """Fused training/serving transform: impute non-finite → clip → scale
+
+    Reproduces the training pipeline (inf→NaN, clip, mean imputation,
+    nan_to_num, StandardScaler) with the scaler folded into a single
+    affine step, so serving applies it in one in-place pass.
+    """
+    
+    CLIP_VALUE = 1e12
+    
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, fill: np.ndarray,
+                 mean: np.ndarray, scale: np.ndarray):
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.fill = np.asarray(fill, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        # (x - mean) / scale == x * coef + offset
+        self.coef = 1.0 / self.scale
+        self.offset = -self.mean * self.coef
+    
+    @property
+    def n_features(self) -> int:
+        return len(self.fill)
+    
+    @classmethod
+    def fit(cls, X: np.ndarray, clip: float = CLIP_VALUE) -> "FeatureTransform":
+        """Learn clip bounds, impute values and scaling from raw training data"""
+        X = np.array(X, dtype=np.float64)
+        n_features = X.shape[1]
+        lower = np.full(n_features, -clip)
+        upper = np.full(n_features, clip)
+        
+        X[np.isinf(X)] = np.nan
+        np.clip(X, lower, upper, out=X)
+        
+        # Mean of observed values; all-missing columns fall back to 0
+        counts = np.sum(~np.isnan(X), axis=0)
+        sums = np.nansum(X, axis=0)
+        fill = np.divide(sums, counts, out=np.zeros(n_features), where=counts > 0)
+        
+        rows, cols = np.nonzero(np.isnan(X))
+        X[rows, cols] = fill[cols]
+        
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale < 10 * np.finfo(np.float64).eps] = 1.0  # Same zero handling as StandardScaler
+        return cls(lower, upper, fill, mean, scale)
+    
+    @classmethod
+    def from_scaler(cls, scaler, clip: float = CLIP_VALUE) -> "FeatureTransform":
+        """Build from a fitted StandardScaler (bundles saved before the transform existed)
+
+        The training imputer filled with column means, and the scaler's mean_
+        is the mean of that imputed data, so mean_ is exactly the fill value.
+        """
+        mean = np.asarray(scaler.mean_, dtype=np.float64)
+        n_features = len(mean)
+        return cls(np.full(n_features, -clip), np.full(n_features, clip), mean.copy(),
+                   mean, np.asarray(scaler.scale_, dtype=np.float64))
+    
+    def to_scaler(self):
+        """Equivalent fitted StandardScaler, for code that still expects one"""
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler()
+        scaler.mean_ = self.mean.copy()
+        scaler.scale_ = self.scale.copy()
+        scaler.var_ = self.scale ** 2
+        scaler.n_features_in_ = self.n_features
+        scaler.n_samples_seen_ = 0
+        return scaler
+    
+    def transform(self, X: np.ndarray, copy: bool = True) -> np.ndarray:
+        """Apply the full transform; with copy=False a float64 C-array is modified in place"""
+        if copy:
+            X = np.array(X, dtype=np.float64, order="C")
+        else:
+            X = np.asarray(X, dtype=np.float64, order="C")
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        
+        bad = ~np.isfinite(X)
+        if bad.any():
+            rows, cols = np.nonzero(bad)
+            X[rows, cols] = self.fill[cols]
+        np.clip(X, self.lower, self.upper, out=X)
+        X *= self.coef
+        X += self.offset
+        return X
+
+
+@lru_cache(maxsize=8)
+def _row_hash_multipliers(words: int) -> np.ndarray:
+    return np.random.default_rng(0x5EED).integers(1, 2 ** 63, words, dtype=np.uint64) | np.uint64(1)
+
+
+def unique_rows(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(first, inverse) for the distinct rows of a 2-D array, compared byte for byte
+
+    X[first] holds each distinct row once, in order of first appearance, and
+    X[first][inverse] reproduces X. Rows are hashed through a uint64 view of the
+    contiguous array (one integer dot product per row) and every repeat is
+    checked against its first occurrence; should two different rows share a
+    hash, the exact void-view np.unique is used instead.
+    """
+    X = np.ascontiguousarray(X)
+    n = len(X)
+    width = X.dtype.itemsize * int(np.prod(X.shape[1:]))
+    if width % 8 == 0 and n:
+        words = X.view(np.uint64).reshape(n, -1)
+        inverse, hashes = pd.factorize(words @ _row_hash_multipliers(words.shape[1]))
+        first = np.empty(len(hashes), dtype=np.intp)
+        first[inverse[::-1]] = np.arange(n - 1, -1, -1)  # Earliest write wins
+        repeats = np.flatnonzero(first[inverse] != np.arange(n))
+        if np.array_equal(words[repeats], words[first[inverse[repeats]]]):
+            return first, inverse.astype(np.intp, copy=False)
+    rows = X.view(np.dtype((np.void, width))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.ravel()]
@@ -0,0 +1,311 @@
+"""
+Threat Vectors and Similarity Search
+The feature vector of every flagged threat is appended to a flat file of
+fixed-size records (threat id + float32 features), one file per feature set.
+Writes are single appends under an exclusive flock; every worker reads the
+file through np.memmap, so the rows live once in the page cache. Vectors are
+kept raw rather than scaled, so they outlive a retrained bundle: the index
+maps them into the loaded bundle's scaled space when it is built.
+
+SimilarityIndex answers k-nearest-neighbour queries in that scaled space.
+Rows are projected onto the top principal components, a tree over the
+projections (KD by default, which is faster than a ball tree at this
+dimension) proposes oversample * k candidates, and the candidates are
+re-ranked by exact distance. Rows appended after the last build form a tail
+that is searched by brute force; once it passes rebuild_fraction of the tree
+a background thread rebuilds the index and swaps it in.
+"""
+import os
+import fcntl
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree, KDTree
+
+import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def feature_signature(feature_names: Sequence[str]) -> str:
+    """Short hash of the feature list; bundles with the same features share a store"""
+    return hashlib.sha1("\n".join(map(str, feature_names)).encode()).hexdigest()[:12]
+
+
+class VectorStore:
+    """Append-only, memory-mapped float32 matrix of flagged threats keyed by threat id"""
+
+    def __init__(self, detector, folder=None, settings: Dict = None):
+        self.detector = detector
+        self.folder = Path(folder or config.VECTORS_DIR)
+        self.settings = settings or config.VECTORS
+        self._signature = None
+        self._dtype = None
+        self._path = None
+
+    def _layout(self) -> bool:
+        """Point at the file for the loaded bundle's feature set (False when none is loaded)"""
+        names = self.detector.feature_names
+        if not names:
+            return False
+        signature = feature_signature(names)
+        if signature != self._signature:
+            self._dtype = np.dtype([("id", "<i8"), ("x", "<f4", (len(names),))])
+            self._path = self.folder / f"vectors_{signature}.bin"
+            self._signature = signature
+        return True
+
+    @property
+    def signature(self) -> Optional[str]:
+        return self._signature if self._layout() else None
+
+    @property
+    def dim(self) -> int:
+        return self._dtype["x"].shape[0] if self._layout() else 0
+
+    @property
+    def path(self) -> Optional[Path]:
+        return self._path if self._layout() else None
+
+    @property
+    def dtype(self) -> Optional[np.dtype]:
+        return self._dtype if self._layout() else None
+
+    # --- writes ------------------------------------------------------------
+
+    def on_threat(self, threat_id: int, data: Dict):
+        """Database listener: keep the feature vector of flagged threats"""
+        if self.settings["flagged_only"] and data.get("prediction") != 1:
+            return
+        if data.get("features") is None:
+            return
+        self.append([threat_id], np.asarray(data["features"], dtype=np.float32).reshape(1, -1))
+
+    def on_threats(self, ids: np.ndarray, columns: Dict):
+        """Batch listener (db.add_threats): one append for every flagged row of the batch"""
+        if columns.get("features") is None:
+            return
+        keep = np.ones(len(ids), dtype=bool)
+        if self.settings["flagged_only"]:
+            keep &= np.broadcast_to(np.asarray(columns.get("prediction")) == 1, keep.shape)
+        if keep.any():
+            self.append(np.asarray(ids)[keep], np.asarray(columns["features"])[keep])
+
+    def append(self, ids: Sequence[int], X: np.ndarray) -> int:
+        """Append rows; one write under an exclusive lock, so records never interleave"""
+        if not self._layout():
+            return 0
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.dim:
+            logger.warning(f"⚠️ Vector store expects {self.dim} features, got {X.shape}")
+            return 0
+        records = np.empty(len(ids), dtype=self._dtype)
+        records["id"] = ids
+        records["x"] = X
+        self.folder.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            view = memoryview(records.tobytes())
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)  # Releases the lock
+        metrics.inc("vectors_stored_total", len(ids))
+        return len(ids)
+
+    # --- reads -------------------------------------------------------------
+
+    def count(self) -> int:
+        """Complete records in the file (taken under a shared lock, so never mid-append)"""
+        if not self._layout() or not self._path.exists():
+            return 0
+        with open(self._path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            return os.fstat(f.fileno()).st_size // self._dtype.itemsize
+
+    def records(self, count: Optional[int] = None) -> np.ndarray:
+        """Read-only memmap of the first count records (all complete records by default)"""
+        count = self.count() if count is None else count
+        if count == 0:
+            return np.empty(0, dtype=self._dtype)
+        return np.memmap(self._path, dtype=self._dtype, mode="r", shape=(count,))
+
+
+class _Built:
+    """One immutable index generation"""
+    __slots__ = ("version", "size", "mean", "basis", "tree", "ids", "order")
+
+    def __init__(self, version, size, mean, basis, tree, ids):
+        self.version = version
+        self.size = size
+        self.mean, self.basis = mean, basis
+        self.tree = tree
+        self.ids = ids
+        self.order = np.argsort(ids, kind="stable")  # Appends are nearly, not strictly, id-ordered
+
+
+class SimilarityIndex:
+    """k nearest stored threats in the loaded bundle's scaled feature space"""
+
+    def __init__(self, store: VectorStore, detector, settings: Dict = None):
+        self.store = store
+        self.detector = detector
+        self.settings = settings or config.VECTORS
+        self._lock = threading.Lock()        # Guards the tail
+        self._build_lock = threading.Lock()  # One build at a time
+        self._built: Optional[_Built] = None
+        self._tail_ids = np.empty(0, dtype=np.int64)
+        self._tail_proj = None
+        self._tail_norms = None
+        self._rebuilding = None
+        self._pid = None
+
+    # --- index maintenance -------------------------------------------------
+
+    def _version(self) -> Optional[str]:
+        signature = self.store.signature
+        return f"{self.detector.model_version}-{signature}" if signature else None
+
+    def _scaled(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(self.detector.transform(np.asarray(X, dtype=np.float64)), dtype=np.float32)
+
+    def _project(self, built: _Built, X: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        """Raw rows -> principal-component coordinates, in chunks to bound memory"""
+        out = np.empty((len(X), built.basis.shape[1]), dtype=np.float32)
+        for start in range(0, len(X), chunk):
+            out[start:start + chunk] = (self._scaled(X[start:start + chunk]) - built.mean) @ built.basis
+        return out
+
+    def build(self) -> Optional[_Built]:
+        """Fit the projection and tree over every stored row; the tail restarts after them"""
+        with self._build_lock:
+            version = self._version()
+            size = self.store.count()
+            if version is None or size == 0:
+                return None
+            with metrics.timer("vectors_build_seconds"):
+                records = self.store.records(size)
+                s = self.settings
+                rng = np.random.default_rng(0)
+                sample = np.sort(rng.choice(size, min(size, s["pca_sample"]), replace=False))
+                scaled = self._scaled(records["x"][sample])
+                mean = scaled.mean(axis=0)
+                _, _, vt = np.linalg.svd(scaled - mean, full_matrices=False)
+                basis = np.ascontiguousarray(vt[:min(s["components"], len(vt))].T, dtype=np.float32)
+                built = _Built(version, size, mean, basis, None, np.array(records["id"]))
+                tree = BallTree if s["tree"] == "ball_tree" else KDTree
+                built.tree = tree(self._project(built, records["x"]), leaf_size=s["leaf_size"])
+            with self._lock:
+                # Rows appended while building move into the new tail at the next refresh
+                self._built = built
+                self._tail_ids = np.empty(0, dtype=np.int64)
+                self._tail_proj = np.empty((0, basis.shape[1]), dtype=np.float32)
+                self._tail_norms = np.empty(0, dtype=np.float32)
+            logger.info(f"✅ Similarity index built over {size:,} vectors ({basis.shape[1]} components)")
+            return built
+
+    def refresh(self):
+        """Bring the index up to date with the store: rebuild after a bundle change, extend the
+        tail with new rows, and start a background rebuild when the tail has grown too large.
+        Returns a consistent (built, tail ids, tail projections, their squared norms), or None when nothing is stored."""
+        built = self._built
+        if built is None or built.version != self._version():
+            if self.build() is None:
+                return None
+        with self._lock:
+            built = self._built
+            seen = built.size + len(self._tail_ids)
+            size = self.store.count()
+            if size > seen:
+                new = self.store.records(size)[seen:]
+                self._tail_ids = np.concatenate([self._tail_ids, new["id"]])
+                projected = self._project(built, new["x"])
+                self._tail_proj = np.concatenate([self._tail_proj, projected])
+                self._tail_norms = np.concatenate([self._tail_norms, np.einsum("ij,ij->i", projected, projected)])
+            snapshot = (built, self._tail_ids, self._tail_proj, self._tail_norms)
+        s = self.settings
+        if len(snapshot[1]) >= max(s["rebuild_min_rows"], s["rebuild_fraction"] * built.size):
+            self._rebuild_in_background()
+        return snapshot
+
+    def _rebuild_in_background(self):
+        if self._pid == os.getpid() and self._rebuilding is not None and self._rebuilding.is_alive():
+            return
+        self._pid = os.getpid()
+        self._rebuilding = threading.Thread(target=self._rebuild, daemon=True, name="similarity-rebuild")
+        self._rebuilding.start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception as e:
+            logger.warning(f"⚠️ Similarity index rebuild failed: {e}")
+
+    # --- queries -----------------------------------------------------------
+
+    @staticmethod
+    def _locate(snapshot, threat_id: int) -> Optional[int]:
+        """Store row of a threat id, or None"""
+        built, tail_ids = snapshot[:2]
+        position = np.searchsorted(built.ids, threat_id, sorter=built.order)
+        if position < len(built.ids) and built.ids[built.order[position]] == threat_id:
+            return int(built.order[position])
+        hits = np.flatnonzero(tail_ids == threat_id)
+        return built.size + int(hits[0]) if len(hits) else None
+
+    def similar(self, threat_id: int, k: int = 10) -> Optional[List[Tuple[int, float]]]:
+        """[(threat id, distance)] of the k stored threats closest to this one, nearest first;
+        None when the threat has no stored vector"""
+        snapshot = self.refresh()
+        if snapshot is None:
+            return None
+        row = self._locate(snapshot, threat_id)
+        if row is None:
+            return None
+        vector = self.store.records(row + 1)[row]["x"]
+        return self._nearest(snapshot, vector, k, exclude=threat_id)
+
+    def nearest(self, features: np.ndarray, k: int = 10) -> List[Tuple[int, float]]:
+        """[(threat id, distance)] of the k stored threats closest to a raw feature vector"""
+        snapshot = self.refresh()
+        if snapshot is None:
+            return []
+        return self._nearest(snapshot, np.asarray(features, dtype=np.float32).ravel(), k)
+
+    def _nearest(self, snapshot, vector: np.ndarray, k: int, exclude: Optional[int] = None):
+        built, tail_ids, tail_proj, tail_norms = snapshot
+        with metrics.timer("similar_query_seconds"):
+            query = self._scaled(vector.reshape(1, -1))
+            point = ((query - built.mean) @ built.basis)[0]
+            wanted = k * self.settings["oversample"] + (exclude is not None)
+
+            gaps, rows = built.tree.query(point[None], k=min(wanted, built.size))
+            rows = rows[0]
+            if len(tail_ids):
+                # Only tail rows closer than the tree's furthest candidate can displace one
+                gap = tail_norms - 2 * (tail_proj @ point) + point @ point
+                closer = np.flatnonzero(gap < gaps[0, -1] ** 2) if len(rows) == wanted else np.arange(len(gap))
+                if len(closer) > wanted:
+                    closer = closer[np.argpartition(gap[closer], wanted - 1)[:wanted]]
+                rows = np.concatenate([rows, built.size + closer])
+            rows = np.sort(rows)  # Ascending offsets read the memmap in order
+
+            records = self.store.records(built.size + len(tail_ids))[rows]
+            distances = np.sqrt(((self._scaled(records["x"]) - query) ** 2).sum(axis=1))
+            ids = records["id"]
+            if exclude is not None:
+                keep = ids != exclude
+                ids, distances = ids[keep], distances[keep]
+            best = np.argsort(distances, kind="stable")[:k]
+            return [(int(ids[i]), float(distances[i])) for i in best]
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._built.size + len(self._tail_ids) if self._built is not None else 0
@@ -0,0 +1,341 @@
+"""
+Per-entity Streaming Detection
+The ensemble scores every row on its own; this stage keeps state per entity
+(user, source IP) so it can flag patterns across rows, such as one account
+opening hundreds of patient records in a minute.
+
+Each entity kind has an open-addressing hash table of 64-bit entity hashes,
+and the table slot indexes plain numpy arrays (no Python object per entity):
+
+  ring      events per bucket over the sliding window (window_buckets × bucket_seconds)
+  mean/var  exponentially weighted events per bucket: the entity's own history
+  hll       HyperLogLog registers of the resources touched in the current and
+            previous window, for a distinct count
+  last      bucket of the entity's newest event (idle/LRU eviction order)
+
+A batch of events is applied with array operations only. Entities silent for
+idle_seconds are dropped at the next sweep, which rebuilds the table in place;
+past max_entities the least recently seen go first, so memory is fixed by
+config. Score components are scaled so 1.0 is the alert level:
+
+  volume   events in the window / max_events
+  breadth  distinct resources in the window / max_distinct
+  burst    window count as a z-score against the entity's history / max_burst_z
+"""
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MAX_LOAD = 0.7          # Table slots per entity ≥ 1 / MAX_LOAD
+RING_MAX = np.iinfo(np.uint16).max
+COMPONENTS = ("volume", "breadth", "burst")
+
+
+def entity_hashes(values) -> np.ndarray:
+    """Stable non-zero 64-bit hashes (0 marks an empty table slot)"""
+    values = np.asarray(values)
+    if values.dtype.kind not in "iu":
+        values = values.astype(str).astype(object)
+    hashes = pd.util.hash_array(values, categorize=False)
+    hashes[hashes == 0] = 1
+    return hashes
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """HyperLogLog cardinality per row of registers, with the small-range correction"""
+    m = registers.shape[-1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class EntityWindows:
+    """Sliding-window counters and distinct sketches for one entity kind"""
+
+    def __init__(self, kind: str, settings: Dict):
+        self.kind = kind
+        self.settings = settings
+        self.buckets = settings["window_buckets"]
+        self.registers = settings["hll_registers"]
+        self._p = int(np.log2(self.registers))
+        self.max_entities = settings["max_entities"]
+        self.capacity = int(np.ceil(self.max_entities / MAX_LOAD))
+        self.idle_buckets = int(settings["idle_seconds"] // settings["bucket_seconds"])
+        self.sweep_buckets = max(1, int(settings["sweep_seconds"] // settings["bucket_seconds"]))
+        self.size = 0
+        self.evicted = 0
+        self._next_sweep = None
+
+        n, B = self.capacity, self.buckets
+        self.keys = np.zeros(n, dtype=np.uint64)
+        self.last = np.zeros(n, dtype=np.int32)            # Bucket epoch of the newest event
+        self.ring = np.zeros((n, B), dtype=np.uint16)     # Saturating event counts per bucket
+        self.mean = np.zeros(n, dtype=np.float32)
+        self.var = np.zeros(n, dtype=np.float32)
+        self.history = np.zeros(n, dtype=np.uint16)       # Buckets folded into mean/var
+        self.hll = np.zeros((n, 2, self.registers), dtype=np.uint8)  # [current, previous] window
+        self.alerted = np.zeros(n, dtype=np.int32)        # 1 + window epoch of the last alert
+        self._state = ["keys", "last", "ring", "mean", "var", "history", "hll", "alerted"]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self._state)
+
+    # --- hash table --------------------------------------------------------
+
+    def _locate(self, keys: np.ndarray):
+        """(slots, is_new) for unique keys; unseen keys claim an empty slot"""
+        slots = np.empty(len(keys), dtype=np.int64)
+        new = np.zeros(len(keys), dtype=bool)
+        pos = (keys % np.uint64(self.capacity)).astype(np.int64)
+        todo = np.arange(len(keys))
+        while len(todo):
+            p = pos[todo]
+            found = self.keys[p]
+            hit = found == keys[todo]
+            empty = found == 0
+            slots[todo[hit]] = p[hit]
+            # New keys probing the same empty slot: the first claims it, the rest probe on
+            claimants = np.flatnonzero(empty)
+            claimed, first = np.unique(p[claimants], return_index=True)
+            winners = todo[claimants[first]]
+            self.keys[claimed] = keys[winners]
+            slots[winners] = claimed
+            new[winners] = True
+            done = hit.copy()
+            done[claimants[first]] = True
+            taken = ~hit & ~empty
+            step = p[taken] + 1
+            step[step == self.capacity] = 0
+            pos[todo[taken]] = step
+            todo = todo[~done]
+        return slots, new
+
+    def sweep(self, now: int, need: int = 0) -> int:
+        """Drop idle entities (then the least recently seen, to leave room for need more)
+        and rebuild the table in place; returns the number evicted"""
+        live = self.keys != 0
+        keep = live & (self.last >= now - self.idle_buckets)
+        excess = int(keep.sum()) + need - self.max_entities
+        if excess > 0:
+            # Evict a quarter more than needed so a full table is not rebuilt on every batch
+            excess = min(int(keep.sum()), excess + self.max_entities // 4)
+            kept = np.flatnonzero(keep)
+            keep[kept[np.argpartition(self.last[kept], excess - 1)[:excess]]] = False
+        evicted = int(live.sum() - keep.sum())
+        if evicted == 0:
+            return 0
+        kept = np.flatnonzero(keep)
+        saved = {name: getattr(self, name)[kept] for name in self._state}
+        for name in self._state:
+            getattr(self, name).fill(0)
+        slots, _ = self._locate(saved["keys"])
+        for name in self._state:
+            getattr(self, name)[slots] = saved[name]
+        self.size = len(kept)
+        self.evicted += evicted
+        return evicted
+
+    # --- windows -----------------------------------------------------------
+
+    def _advance(self, slots: np.ndarray, epoch: np.ndarray):
+        """Move entities' windows forward to bucket epoch, folding the buckets they leave
+        into the running mean/variance"""
+        B, a = self.buckets, self.settings["ewma_alpha"]
+        last = self.last[slots].astype(np.int64)
+        gap = epoch - last
+
+        # The bucket of the previous newest event is complete: fold it in,
+        # then the gap - 1 empty buckets after it in closed form
+        delta = self.ring[slots, last % B] - self.mean[slots].astype(np.float64)
+        mean = self.mean[slots] + a * delta
+        var = (1 - a) * (self.var[slots] + a * delta ** 2)
+        decay = (1 - a) ** (gap - 1)
+        self.var[slots] = decay * (var + mean ** 2 * (1 - decay))
+        self.mean[slots] = mean * decay
+        self.history[slots] = np.minimum(self.history[slots] + gap, RING_MAX)
+
+        for k in range(1, B + 1):
+            moved = gap >= k
+            self.ring[slots[moved], (last[moved] + k) % B] = 0
+
+        windows = epoch // B - last // B
+        one, more = slots[windows == 1], slots[windows > 1]
+        self.hll[one, 1] = self.hll[one, 0]
+        self.hll[one, 0] = 0
+        self.hll[more] = 0
+        self.last[slots] = epoch
+
+    def observe(self, keys: np.ndarray, epochs: np.ndarray, resources: Optional[np.ndarray]) -> Dict:
+        """Apply a batch of events; window features per unique entity, as of the end of the batch"""
+        B = self.buckets
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        newest = np.full(len(unique), np.iinfo(np.int64).min)
+        np.maximum.at(newest, inverse, epochs)
+
+        now = int(newest.max())
+        if self._next_sweep is None:
+            self._next_sweep = now + self.sweep_buckets
+        if now >= self._next_sweep or self.size + len(unique) > self.max_entities:
+            self.sweep(now, need=len(unique))
+            self._next_sweep = now + self.sweep_buckets
+
+        slots, new = self._locate(unique)
+        self.size += int(new.sum())
+        self.last[slots[new]] = newest[new]
+        epoch = np.maximum(self.last[slots], newest)
+        moving = epoch > self.last[slots]
+        self._advance(slots[moving], epoch[moving])
+
+        # Event counts into the ring (events older than the window are dropped)
+        event_slots, event_window = slots[inverse], epoch[inverse]
+        inside = epochs > event_window - B
+        cells, counts = np.unique(event_slots[inside] * B + epochs[inside] % B, return_counts=True)
+        ring = self.ring.reshape(-1)
+        ring[cells] = np.minimum(ring[cells] + counts, RING_MAX)
+
+        # Distinct resources: register = low bits, rank = leading zeros of the rest + 1
+        if resources is not None:
+            generation = event_window // B - epochs // B
+            ok = (generation <= 1) & (resources != 0)
+            h = resources[ok]
+            register = (h & np.uint64(self.registers - 1)).astype(np.intp)
+            rest = (h >> np.uint64(self._p)).astype(np.float64)
+            rank = np.where(rest > 0, 64 - self._p - np.frexp(rest)[1] + 1, 64 - self._p + 1)
+            np.maximum.at(self.hll, (event_slots[ok], generation[ok], register), rank.astype(np.uint8))
+
+        features = self._features(slots, epoch)
+        features["slots"], features["first"], features["inverse"] = slots, first, inverse
+        return features
+
+    def _features(self, slots: np.ndarray, epoch: np.ndarray) -> Dict:
+        s, B = self.settings, self.buckets
+        events = self.ring[slots].sum(axis=1, dtype=np.int64)
+        expected = B * self.mean[slots].astype(np.float64)
+        # Poisson floor, so a quiet entity needs a real jump to look bursty
+        sd = np.sqrt(B * self.var[slots] + expected + 1)
+        seasoned = self.history[slots] >= s["min_history_buckets"]
+        burst_z = np.where(seasoned, (events - expected) / sd, 0.0)
+        through = (epoch % B + 1) / B
+        distinct = hll_estimate(self.hll[slots, 0]) + hll_estimate(self.hll[slots, 1]) * (1 - through)
+        distinct = np.minimum(distinct, events)  # Never more resources than events
+        components = np.stack([events / s["max_events"], distinct / s["max_distinct"],
+                               np.maximum(burst_z, 0) / s["max_burst_z"]], axis=1)
+        return {
+            "events": events,
+            "distinct": distinct,
+            "burst_z": burst_z,
+            "score": components.max(axis=1),
+            "reason": components.argmax(axis=1),
+            "window": epoch // B,
+        }
+
+    def mark_alerted(self, slots: np.ndarray, window: np.ndarray) -> np.ndarray:
+        """Mask of entities not yet alerted in this window; records them as alerted"""
+        due = self.alerted[slots] != window + 1
+        self.alerted[slots[due]] = window[due] + 1
+        return due
+
+
+class StreamingDetector:
+    """Per-entity window features and anomaly scores, one table per entity kind"""
+
+    def __init__(self, settings: Dict = None):
+        self.settings = settings or config.STREAMING
+        self.tables = {kind: EntityWindows(kind, self.settings) for kind in self.settings["kinds"]}
+        self._locks = {kind: threading.Lock() for kind in self.tables}
+        # Keep a batch's distinct entities well below the table size
+        self.chunk = max(1, min(self.settings["max_batch"], self.settings["max_entities"] // 2))
+
+    def observe(self, events: pd.DataFrame) -> Dict:
+        """Score access events
+
+        events: one column per entity kind (missing/empty ids are skipped),
+        optional "resource" (e.g. patient id) and "timestamp" (unix seconds or
+        ISO 8601; missing means now).
+        Returns per-event scores and the entities that crossed alert_score for
+        the first time in their current window.
+        """
+        n = len(events)
+        scores = np.zeros(n)
+        reasons = np.full(n, "", dtype=object)
+        alerts = []
+        for start in range(0, n, self.chunk):
+            chunk = events.iloc[start:start + self.chunk]
+            s, r, a = self._observe_chunk(chunk, start)
+            scores[start:start + len(chunk)] = s
+            reasons[start:start + len(chunk)] = r
+            alerts += a
+        return {"scores": scores, "reasons": reasons, "alerts": alerts}
+
+    def _observe_chunk(self, events: pd.DataFrame, offset: int):
+        s = self.settings
+        n = len(events)
+        timestamps = np.full(n, time.time())
+        if "timestamp" in events:
+            column = events["timestamp"]
+            if column.dtype == object and isinstance(column.iloc[0], str):
+                parsed = pd.to_datetime(column, errors="coerce", utc=True)
+                seconds = parsed.astype("int64").to_numpy() / 1e9
+                known = parsed.notna().to_numpy()
+            else:
+                seconds = pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64)
+                known = np.isfinite(seconds)
+            timestamps[known] = seconds[known]
+        epochs = (timestamps // s["bucket_seconds"]).astype(np.int64)
+        resources = None
+        if "resource" in events:
+            present = events["resource"].notna().to_numpy()
+            resources = np.zeros(n, dtype=np.uint64)
+            resources[present] = entity_hashes(events["resource"].to_numpy()[present])
+
+        scores = np.zeros(n)
+        reasons = np.full(n, "", dtype=object)
+        alerts = []
+        for kind, table in self.tables.items():
+            if kind not in events:
+                continue
+            ids = events[kind].to_numpy()
+            if ids.dtype.kind in "iu":
+                rows = np.arange(n)
+            else:
+                rows = np.flatnonzero(pd.notna(ids) & (ids.astype(str) != ""))
+            if not len(rows):
+                continue
+            with self._locks[kind]:
+                f = table.observe(entity_hashes(ids[rows]), epochs[rows],
+                                  None if resources is None else resources[rows])
+                flagged = np.flatnonzero(f["score"] >= s["alert_score"])
+                due = flagged[table.mark_alerted(f["slots"][flagged], f["window"][flagged])]
+
+            per_event = f["score"][f["inverse"]]
+            higher = per_event > scores[rows]
+            scores[rows[higher]] = per_event[higher]
+            reasons[rows[higher]] = [f"{kind}:{COMPONENTS[c]}" for c in f["reason"][f["inverse"]][higher]]
+            for i in due:
+                alerts.append({
+                    "kind": kind,
+                    "entity": str(ids[rows[f["first"][i]]]),
+                    "event": offset + int(rows[f["first"][i]]),  # First event of the entity in the batch
+                    "score": float(f["score"][i]),
+                    "reason": COMPONENTS[f["reason"][i]],
+                    "events": int(f["events"][i]),
+                    "distinct_resources": float(f["distinct"][i]),
+                    "burst_z": float(f["burst_z"][i]),
+                })
+        return scores, reasons, alerts
+
+    def stats(self) -> Dict:
+        return {kind: {"entities": t.size, "capacity": t.capacity, "max_entities": t.max_entities,
+                       "evicted": t.evicted, "bytes": t.nbytes}
+                for kind, t in self.tables.items()}
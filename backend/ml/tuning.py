@@ -0,0 +1,186 @@
+"""
+Hyperparameter Tuning - Successive Halving
+Candidates are scored on small data fractions first; only the best
+1/eta of each rung is promoted to a larger fraction. CV folds are cached
+as memory-mapped arrays in the training-run directory and shared by all
+worker processes.
+"""
+import os
+import json
+import time
+import numpy as np
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+from sklearn.metrics import roc_auc_score
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import config
+from ml.checkpoint import TrainingRun
+from ml.ensemble import member_scores
+
+logger = logging.getLogger(__name__)
+
+
+def _estimators() -> Dict:
+    # Imported lazily so worker processes only pay for what they use
+    from ml.detector import MEMBERS
+    return {name: (estimator, params_key) for name, _, estimator, params_key in MEMBERS}
+
+
+def build_folds(run: TrainingRun, n_folds: int, seed: int = 42) -> Dict[str, str]:
+    """Cache fold assignment and a shuffled row order for the run's training split"""
+    if not run.is_done("cv_folds"):
+        y = run.load_arrays("split", ["y_train"])["y_train"]
+        fold_of_row = np.empty(len(y), dtype=np.int8)
+        skf = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+        for fold, (_, val_idx) in enumerate(skf.split(np.zeros(len(y)), y)):
+            fold_of_row[val_idx] = fold
+        order = np.random.default_rng(seed).permutation(len(y)).astype(np.int64)
+        run.save_arrays("cv_folds", fold_of_row=fold_of_row, order=order)
+    return {
+        name: str(run.run_dir / f"{stage}_{name}.npy")
+        for stage, name in [("split", "X_train"), ("split", "y_train"),
+                            ("cv_folds", "fold_of_row"), ("cv_folds", "order")]
+    }
+
+
+def _evaluate(task: Dict) -> Dict:
+    """Fit one candidate on one fold at one data fraction (runs in a worker process)"""
+    paths = task["paths"]
+    X = np.load(paths["X_train"], mmap_mode="r")
+    y = np.load(paths["y_train"], mmap_mode="r")
+    fold_of_row = np.load(paths["fold_of_row"], mmap_mode="r")
+    order = np.load(paths["order"], mmap_mode="r")
+
+    # The first `fraction` of the shuffled order is this rung's data budget
+    rows = np.sort(order[:max(int(len(order) * task["fraction"]), 2 * task["n_folds"])])
+    in_val = fold_of_row[rows] == task["fold"]
+    train_rows, val_rows = rows[~in_val], rows[in_val]
+
+    estimator, params_key = _estimators()[task["member"]]
+    params = {**config.MODEL_PARAMS[params_key], **task["params"]}
+    if "n_jobs" in params:
+        params["n_jobs"] = 1  # Parallelism comes from the process pool
+    model = estimator(**params)
+
+    start = time.perf_counter()
+    if task["member"] == "iso":
+        model.fit(X[train_rows])
+    else:
+        model.fit(X[train_rows], y[train_rows])
+    fit_seconds = time.perf_counter() - start
+
+    X_val, y_val = X[val_rows], y[val_rows]
+    start = time.perf_counter()
+    scores = member_scores(model, X_val)
+    latency_us = (time.perf_counter() - start) / max(len(val_rows), 1) * 1e6
+
+    auc = roc_auc_score(y_val, scores) if len(np.unique(y_val)) == 2 else 0.5
+    return {
+        "candidate": task["candidate"],
+        "fold": task["fold"],
+        "auc": float(auc),
+        "fit_seconds": fit_seconds,
+        "latency_us_per_row": latency_us,
+        "train_rows": int(len(train_rows)),
+    }
+
+
+def _candidates(member: str, n_candidates: int, seed: int) -> List[Dict]:
+    space = config.TUNING_SPACE[_estimators()[member][1]]
+    grid_size = len(ParameterGrid(space))
+    if grid_size <= n_candidates:
+        return list(ParameterGrid(space))
+    return list(ParameterSampler(space, n_iter=n_candidates, random_state=seed))
+
+
+def successive_halving(member: str, paths: Dict[str, str], pool: ProcessPoolExecutor,
+                       settings: Dict) -> Dict:
+    """Run successive halving for one ensemble member"""
+    eta = settings["eta"]
+    n_folds = settings["cv_folds"]
+    candidates = _candidates(member, settings["n_candidates"], settings["seed"])
+    alive = list(range(len(candidates)))
+    # Enough rungs that the last one compares a handful of configs on all the data
+    n_rungs = 1
+    while eta ** n_rungs <= len(candidates):
+        n_rungs += 1
+    n_rungs = max(1, n_rungs - 1)
+    fraction = max(settings["min_fraction"], float(eta) ** -(n_rungs - 1))
+    history = []
+
+    for rung in range(n_rungs):
+        logger.info(f"  🔎 {member} rung {rung}: {len(alive)} configs on {fraction:.0%} of data")
+        tasks = [
+            {"member": member, "candidate": c, "params": candidates[c], "fold": fold,
+             "fraction": fraction, "n_folds": n_folds, "paths": paths}
+            for c in alive for fold in range(n_folds)
+        ]
+        results = list(pool.map(_evaluate, tasks))
+
+        summary = {}
+        for c in alive:
+            runs = [r for r in results if r["candidate"] == c]
+            summary[c] = {
+                "rung": rung,
+                "fraction": fraction,
+                "params": candidates[c],
+                "auc": float(np.mean([r["auc"] for r in runs])),
+                "fit_seconds": float(sum(r["fit_seconds"] for r in runs)),
+                "latency_us_per_row": float(np.mean([r["latency_us_per_row"] for r in runs])),
+            }
+        history.extend(summary.values())
+
+        ranked = sorted(alive, key=lambda c: summary[c]["auc"], reverse=True)
+        if rung == n_rungs - 1:
+            best = summary[ranked[0]]
+            break
+        alive = ranked[:max(1, len(alive) // eta)]
+        fraction = min(1.0, fraction * eta)
+
+    logger.info(f"  🏆 {member}: AUC {best['auc']:.4f} with {best['params']}")
+    return {"best": best, "history": history}
+
+
+def tune(members: Optional[List[str]] = None, run_dir: Optional[str] = None) -> Dict:
+    """Tune members on the cached training split and write the config override file"""
+    settings = config.TUNING
+    estimators = _estimators()
+    members = members or list(estimators)
+
+    run = TrainingRun(run_dir) if run_dir else TrainingRun.latest(str(config.RUNS_FOLDER))
+    if run is None or not run.is_done("split"):
+        raise ValueError("No training run with cached splits; run main.py --train first")
+    paths = build_folds(run, settings["cv_folds"], settings["seed"])
+
+    logger.info(f"🎛️ Tuning {', '.join(members)} from {run.run_dir}")
+    report = {}
+    with ProcessPoolExecutor(max_workers=settings["n_jobs"] or os.cpu_count()) as pool:
+        for member in members:
+            report[member] = successive_halving(member, paths, pool, settings)
+
+    write_overrides({estimators[m][1]: report[m]["best"]["params"] for m in members})
+    report_path = run.run_dir / "tuning_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    logger.info(f"✅ Tuning report written to {report_path}")
+    return report
+
+
+def write_overrides(best_params: Dict[str, Dict]):
+    """Merge winning parameters into the MODEL_PARAMS override file"""
+    path = Path(config.MODEL_PARAMS_OVERRIDE_FILE)
+    overrides = {}
+    if path.exists():
+        with open(path) as f:
+            overrides = json.load(f)
+    for params_key, params in best_params.items():
+        overrides.setdefault(params_key, {}).update(params)
+    with open(path, "w") as f:
+        json.dump(overrides, f, indent=2)
+    logger.info(f"💾 Parameter overrides written to {path}")
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Keep test writes out of the tracked threat_detector.db
+os.environ.setdefault("THREAT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="ehr_tests_"), "threats.db"))
+os.environ.setdefault("VECTORS_DIR", tempfile.mkdtemp(prefix="ehr_vectors_"))
+os.environ.setdefault("REPORTS_DIR", tempfile.mkdtemp(prefix="ehr_reports_"))
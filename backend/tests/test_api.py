@@ -4,6 +4,8 @@ API Endpoint Tests
 
 import unittest
 import json
+from unittest import mock
+import config
 from app.api import create_app
 
 
@@ -19,6 +21,15 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertEqual(data['status'], 'healthy')
+    
+    def test_admin_controls_need_token(self):
+        """Admin control endpoints answer 403 without ADMIN_TOKEN, even when none is configured"""
+        with mock.patch.object(config, "ADMIN_TOKEN", None):
+            self.assertEqual(self.client.get('/api/admin/profile').status_code, 403)
+            self.assertEqual(self.client.post('/api/admin/rescore/pause').status_code, 403)
+        with mock.patch.object(config, "ADMIN_TOKEN", "s3cret"):
+            self.assertEqual(self.client.get('/api/admin/memory', headers={"X-Admin-Token": "wrong"}).status_code, 403)
+            self.assertEqual(self.client.get('/api/admin/profile', headers={"X-Admin-Token": "s3cret"}).status_code, 200)
 
 
 if __name__ == '__main__':
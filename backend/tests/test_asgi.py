@@ -0,0 +1,61 @@
+"""
+Unit Tests for the ASGI app
+"""
+
+import io
+import importlib.util
+import unittest
+import numpy as np
+import config
+
+SERVING = all(importlib.util.find_spec(m) for m in ("fastapi", "httpx", "a2wsgi"))
+
+
+@unittest.skipUnless(SERVING, "fastapi / httpx / a2wsgi not installed")
+class TestASGI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from fastapi.testclient import TestClient
+        from app.asgi import create_asgi_app
+        from app.routes.threat_detection import detector
+        if detector.feature_names is None:
+            raise unittest.SkipTest("No model bundle")
+        cls.width = len(detector.feature_names)
+        cls.client = TestClient(create_asgi_app())
+
+    def test_scoring_routes_match_flask(self):
+        from app.api import create_app
+        X = np.random.default_rng(0).random((20, self.width))
+        asgi = self.client.post('/api/threats/batch', json={"samples": X.tolist()}).json()
+        flask = create_app().test_client().post('/api/threats/batch', json={"samples": X.tolist()}).get_json()
+        self.assertEqual(asgi["predictions"], flask["predictions"])
+
+        buf = io.BytesIO()
+        np.save(buf, X)
+        binary = self.client.post('/api/threats/batch', content=buf.getvalue(),
+                                  headers={"Content-Type": "application/x-npy"})
+        self.assertEqual(np.load(io.BytesIO(binary.content))["prediction"].tolist(), flask["predictions"])
+
+        csv = "\n".join([",".join(f"f{i}" for i in range(self.width))] + [",".join(map(str, row)) for row in X])
+        uploaded = self.client.post('/api/threats/batch-csv', files={"file": ("x.csv", csv.encode())})
+        self.assertEqual(uploaded.json()["total_samples"], 20)
+        self.assertEqual(self.client.post('/api/threats/batch-csv', files={}).status_code, 400)
+
+    def test_body_cap_covers_uploads(self):
+        """CSV uploads over max_body_mb are refused like other bodies"""
+        from fastapi.testclient import TestClient
+        from app.asgi import create_asgi_app
+        client = TestClient(create_asgi_app({**config.ASGI, "max_body_mb": 2 ** -10}))  # 1 KB
+        csv = "\n".join(",".join("0.5" for _ in range(self.width)) for _ in range(50)).encode()
+        self.assertEqual(client.post('/api/threats/batch-csv', files={"file": ("x.csv", csv)}).status_code, 413)
+        self.assertEqual(client.post('/api/threats/batch', content=csv,
+                                     headers={"Content-Type": "application/x-npy"}).status_code, 413)
+
+    def test_flask_routes_are_mounted(self):
+        self.assertEqual(self.client.get('/api/system/health').json()["status"], "healthy")
+        self.assertEqual(self.client.get('/api/threats/?limit=1').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+"""
+Unit Tests for the response cache
+"""
+
+import unittest
+from app.api import create_app
+from app.cache import ResponseCache
+from app.database import db
+from utils.metrics import metrics
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.client = create_app().test_client()
+
+    def test_etag_until_threat_written(self):
+        """Same generation: 304 for the poller's ETag; a new threat changes it"""
+        first = self.client.get('/api/threats/?limit=5')
+        etag = first.headers['ETag']
+        again = self.client.get('/api/threats/?limit=5', headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+
+        threat_id = db.add_threat({"prediction": 1, "confidence": 0.99, "severity": "critical", "threat_type": 1})
+        fresh = self.client.get('/api/threats/?limit=5', headers={'If-None-Match': etag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh.headers['ETag'], etag)
+        self.assertEqual(fresh.get_json()[0]['id'], threat_id)
+
+    def test_hits_are_counted(self):
+        self.client.get('/api/monitoring/anomalies')
+        self.client.get('/api/monitoring/anomalies')
+        counts = ResponseCache.hit_ratios(metrics.aggregate())['monitoring.anomalies']
+        self.assertGreaterEqual(counts['hit'], 1)
+        self.assertGreater(counts['hit_ratio'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""
+Unit Tests for training-run checkpoints
+"""
+
+import tempfile
+import unittest
+import numpy as np
+from ml.checkpoint import TrainingRun
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_runs_started_together_get_their_own_directory(self):
+        root = tempfile.mkdtemp()
+        first, second = TrainingRun.create(root), TrainingRun.create(root)
+        self.assertNotEqual(first.run_dir, second.run_dir)
+        second.mark_done("split")
+        self.assertEqual(TrainingRun.latest(root).run_dir, second.run_dir)
+
+    def test_resume_round_trip(self):
+        """Reopened runs load their stages; members fitted with other params are refitted"""
+        root = tempfile.mkdtemp()
+        run = TrainingRun.create(root)
+        X = np.arange(12.0).reshape(4, 3)
+        params = {"n_estimators": 10, "max_depth": 5}
+        run.save_arrays("split", X_train=X)
+        run.save_object("model_rf", {"fitted": True}, params_hash=run.params_hash(params))
+
+        resumed = TrainingRun.latest(root)
+        np.testing.assert_array_equal(resumed.load_arrays("split", ["X_train"])["X_train"], X)
+        self.assertTrue(resumed.is_done("model_rf", {"max_depth": 5, "n_estimators": 10}))
+        self.assertEqual(resumed.load_object("model_rf"), {"fitted": True})
+        self.assertFalse(resumed.is_done("model_rf", {**params, "max_depth": 8}))
+        self.assertFalse(resumed.is_done("model_gb"))
+
+
+if __name__ == '__main__':
+    unittest.main()
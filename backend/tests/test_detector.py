@@ -5,6 +5,8 @@ Unit Tests for Detector
 import unittest
 import numpy as np
 from ml.detector import AdvancedThreatDetector
+from ml.ensemble import EnsembleVoting, optimize_ensemble
+from ml.calibration import Calibrator
 
 
 class TestDetector(unittest.TestCase):
@@ -20,6 +22,92 @@ class TestDetector(unittest.TestCase):
         self.detector.ensemble = DummyEnsemble()
         result = self.detector.predict(X)
         self.assertEqual(len(result['prediction']), 10)
+    
+    def test_duplicate_rows_scored_once(self):
+        """Repeated rows reuse their first occurrence's scores, in the caller's order"""
+        X = np.random.randn(20, 4)[np.tile(np.arange(20), 5)]
+        self.detector.scaler = DummyScaler()
+        self.detector.ensemble = RowSumEnsemble()
+        result = self.detector.predict(X)
+        self.assertEqual(self.detector.ensemble.rows_seen, 20)
+        self.assertAlmostEqual(result['dedup_ratio'], 0.8)
+        np.testing.assert_allclose(result['confidence'], 1 / (1 + np.exp(-X.sum(axis=1))))
+
+
+class TestEnsemble(unittest.TestCase):
+    
+    def test_dropped_member_not_evaluated(self):
+        """Members without weight are never called"""
+        ensemble = EnsembleVoting({"good": ConstantModel(0.9), "bad": FailingModel()},
+                                  weights={"good": 1.0, "bad": 0.0})
+        proba = ensemble.predict_proba(np.zeros((4, 3)))
+        np.testing.assert_allclose(proba[:, 1], 0.9)
+    
+    def test_members_scored_once_per_call(self):
+        """Votes and probabilities come from a single pass over the calibrated members"""
+        models = {"a": CountingModel(0.9), "b": CountingModel(0.2), "c": CountingModel(0.7)}
+        identity = Calibrator(np.array([0.0, 1.0]), np.array([0.0, 1.0]), "isotonic")
+        ensemble = EnsembleVoting(models, calibrators={name: identity for name in models})
+        votes, proba = ensemble.score(np.zeros((4, 3)))
+        self.assertEqual([m.calls for m in models.values()], [1, 1, 1])
+        np.testing.assert_array_equal(votes, 1)
+        np.testing.assert_allclose(proba[:, 1], 0.6)
+    
+    def test_optimizer_respects_budget(self):
+        """Optimizer never selects more cost than the budget allows"""
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(200, 3))
+        y = (X[:, 0] > 0).astype(int)
+        models = {"signal": FeatureModel(0), "noise": FeatureModel(1)}
+        settings = {"latency_budget_ms": 1e6, "latency_batch_size": 1,
+                    "timing_repeats": 1, "min_auc_gain": 0.0005}
+        result = optimize_ensemble(models, X, y, settings)
+        self.assertEqual(list(result["weights"]), ["signal"])
+        self.assertGreater(result["val_auc"], 0.99)
+
+
+class TestCalibration(unittest.TestCase):
+    
+    def test_isotonic_is_monotone_probability(self):
+        """Calibrated scores are monotone and within [0, 1]"""
+        rng = np.random.default_rng(0)
+        scores = rng.normal(size=2000)
+        y = (rng.random(2000) < 1 / (1 + np.exp(-3 * scores))).astype(int)
+        calibrator = Calibrator.fit_isotonic(scores, y, max_knots=64)
+        out = calibrator(np.linspace(-5, 5, 101))
+        self.assertLessEqual(len(calibrator.knots), 64)
+        self.assertTrue(np.all(np.diff(out) >= 0))
+        self.assertTrue(np.all((out >= 0) & (out <= 1)))
+
+
+class ConstantModel:
+    def __init__(self, p):
+        self.p = p
+    
+    def predict_proba(self, X):
+        return np.column_stack([np.full(len(X), 1 - self.p), np.full(len(X), self.p)])
+
+
+class FeatureModel:
+    def __init__(self, column):
+        self.column = column
+    
+    def predict_proba(self, X):
+        p = 1 / (1 + np.exp(-X[:, self.column]))
+        return np.column_stack([1 - p, p])
+
+
+class CountingModel(ConstantModel):
+    calls = 0
+    
+    def predict_proba(self, X):
+        self.calls += 1
+        return super().predict_proba(X)
+
+
+class FailingModel:
+    def predict_proba(self, X):
+        raise AssertionError("dropped member was evaluated")
 
 
 class DummyScaler:
@@ -28,11 +116,17 @@ class DummyScaler:
 
 
 class DummyEnsemble:
-    def predict(self, X):
-        return np.zeros(len(X))
+    def score(self, X):
+        return np.zeros(len(X)), np.column_stack([np.ones(len(X)), np.zeros(len(X))])
+
+
+class RowSumEnsemble:
+    rows_seen = 0
     
-    def predict_proba(self, X):
-        return np.zeros(len(X))
+    def score(self, X):
+        self.rows_seen += len(X)
+        p = 1 / (1 + np.exp(-X.sum(axis=1)))
+        return (X.sum(axis=1) > 0).astype(int), np.column_stack([1 - p, p])
 
 
 if __name__ == '__main__':
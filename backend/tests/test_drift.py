@@ -0,0 +1,77 @@
+"""
+Unit Tests for the feature drift monitor
+"""
+
+import unittest
+import numpy as np
+import config
+from ml.drift import DriftBaseline, DriftMonitor, bin_counts
+from ml.preprocessor import unique_rows
+
+
+def monitor(baseline, **settings):
+    return DriftMonitor(baseline, [f"f{i}" for i in range(baseline.edges.shape[0])], "test",
+                        settings={**config.DRIFT, **settings}, store_dir="")
+
+
+class TestDrift(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.baseline = DriftBaseline.fit(self.rng.standard_normal((20000, 4)), bins=10)
+
+    def test_bin_counts_match_searchsorted(self):
+        X = self.rng.standard_normal((500, 4))
+        counts = bin_counts(X, [np.ascontiguousarray(c) for c in self.baseline.edges.T])
+        for j in range(4):
+            expected = np.bincount(np.searchsorted(self.baseline.edges[j], X[:, j]), minlength=10)
+            np.testing.assert_array_equal(counts[j], expected)
+
+    def test_shifted_feature_is_flagged(self):
+        """Only the shifted feature crosses the PSI alert threshold"""
+        m = monitor(self.baseline, overhead_budget=1e6)
+        X = self.rng.standard_normal((5000, 4))
+        X[:, 2] += 1.0
+        for chunk in np.array_split(X, 10):
+            m.update(chunk, inference_seconds=1.0)
+
+        report = m.report()
+        self.assertEqual(report["status"], "drift")
+        self.assertEqual(report["features_drifting"], 1)
+        self.assertEqual(report["features"][0]["feature"], "f2")
+        self.assertAlmostEqual(report["features"][0]["mean_shift"], 1.0, delta=0.1)
+
+    def test_updates_stay_within_budget(self):
+        """Batches arriving without enough earned budget are skipped"""
+        m = monitor(self.baseline, overhead_budget=0.001)
+        for _ in range(200):
+            m.update(self.rng.standard_normal((1, 4)), inference_seconds=1e-5)
+        self.assertEqual(m.rows_seen, 200)
+        self.assertLess(m.rows_sampled, 200)
+        self.assertEqual(m.report()["status"], "insufficient_data")
+
+    def test_deduplicated_baseline_keeps_repeats(self):
+        """A repeated-row batch from the training distribution scores no drift against
+        a baseline fitted on the deduplicated rows with their counts"""
+        rows = self.rng.standard_normal((300, 4))
+        share = 1.0 / np.arange(1, 301) ** 1.2  # A few flows repeat far more than the rest
+        share /= share.sum()
+        train = rows[self.rng.choice(300, 20000, p=share)]
+        unique, inverse = unique_rows(train)
+        fitted = DriftBaseline.fit(train[unique], bins=10, counts=np.bincount(inverse))
+        unweighted = DriftBaseline.fit(train[unique], bins=10)
+
+        batch = rows[self.rng.choice(300, 5000, p=share)]
+        first, index = unique_rows(batch)
+        reports = []
+        for baseline in (fitted, unweighted):
+            m = monitor(baseline, overhead_budget=1e6)
+            m.update(batch[first], inference_seconds=1.0, index=index)
+            reports.append(m.report())
+        self.assertLess(reports[0]["psi_max"], 0.05)
+        self.assertEqual(reports[0]["status"], "stable")
+        self.assertEqual(reports[1]["status"], "drift")
+
+
+if __name__ == '__main__':
+    unittest.main()
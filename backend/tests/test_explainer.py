@@ -0,0 +1,113 @@
+"""
+Unit Tests for the per-prediction explainer
+"""
+
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+import config
+from app.explanations import ExplanationStore
+from ml.explainer import TreeContributions, ThreatExplainer
+
+
+class TestExplainer(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        cls.X = rng.normal(size=(400, 6))
+        y = (cls.X[:, 0] + cls.X[:, 1] ** 2 > 1).astype(int)
+        cls.rf = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0).fit(cls.X, y)
+        cls.gb = GradientBoostingClassifier(n_estimators=10, random_state=0).fit(cls.X, y)
+    
+    def test_contributions_are_exact(self):
+        """Base value plus attributions reproduces each member's output"""
+        rf = TreeContributions(self.rf, 6)
+        gb = TreeContributions(self.gb, 6)
+        np.testing.assert_allclose(rf.bias + rf.contributions(self.X).sum(axis=1),
+                                   self.rf.predict_proba(self.X)[:, 1], atol=1e-9)
+        np.testing.assert_allclose(gb.bias + gb.contributions(self.X).sum(axis=1),
+                                   self.gb.decision_function(self.X), atol=1e-9)
+    
+    def test_top_k(self):
+        """Every explained row has top_k features, strongest first"""
+        explainer = ThreatExplainer({"rf": self.rf, "gb": self.gb}, [f"f{i}" for i in range(6)])
+        result = explainer.explain(self.X[:3], self.X[:3], top_k=2, budget_ms=1000)
+        self.assertEqual(result["explained_rows"], 3)
+        top = result["explanations"][0]["top_features"]
+        self.assertEqual(len(top), 2)
+        self.assertGreaterEqual(abs(top[0]["contribution"]), abs(top[1]["contribution"]))
+    
+    def test_pack_round_trip(self):
+        """Stored explanations decode to the same features and (float32) contributions"""
+        explainer = ThreatExplainer({"rf": self.rf, "gb": self.gb}, [f"f{i}" for i in range(6)])
+        explanation = explainer.explain(self.X[:1], self.X[:1], top_k=3)["explanations"][0]
+        restored = explainer.unpack(explainer.pack(explanation))
+        self.assertEqual([i["feature"] for i in restored["members"]["gb"]["contributions"]],
+                         [i["feature"] for i in explanation["members"]["gb"]["contributions"]])
+        self.assertAlmostEqual(restored["top_features"][0]["contribution"],
+                               explanation["top_features"][0]["contribution"], places=5)
+        self.assertEqual(restored["members"]["rf"]["base"], explanation["members"]["rf"]["base"])
+
+
+class StubDetector:
+    """Explains each batch once release is set"""
+    model_version = "v1"
+    feature_names = ["f0", "f1", "f2"]
+    
+    def __init__(self):
+        self.started, self.release = threading.Event(), threading.Event()
+        self.explainer = mock.Mock(pack=lambda e: json.dumps(e).encode(), unpack=json.loads)
+    
+    def explain(self, X, top_k, budget_ms):
+        self.started.set()
+        self.release.wait(5)
+        return {"explanations": [{"top_features": [{"feature": "f0", "contribution": float(x[0])}]} for x in X]}
+
+
+class StubDatabase:
+    def __init__(self):
+        self.rows = {}
+    
+    def save_explanations(self, rows):
+        self.rows.update({(threat_id, version): blob for threat_id, version, blob in rows})
+    
+    def get_explanation(self, threat_id, version):
+        return self.rows.get((threat_id, version))
+    
+    def delete_stale_explanations(self, version):
+        return 0
+
+
+class TestExplanationStore(unittest.TestCase):
+    
+    def test_pending_until_stored(self):
+        """Queued threats read as pending until stored; dropped and unflagged ones as missing"""
+        detector = StubDetector()
+        store = ExplanationStore(detector, StubDatabase(),
+                                 {**config.EXPLAIN_STORE, "queue_size": 1, "batch_size": 1})
+        features = np.arange(3.0)
+        store.on_threat(1, {"severity": "critical", "features": features})
+        self.assertTrue(detector.started.wait(5))  # Worker is explaining 1; the queue is empty
+        store.on_threat(2, {"severity": "warning", "features": features + 1})
+        store.on_threat(3, {"severity": "critical", "features": features})  # Queue full: dropped
+        store.on_threat(4, {"severity": "info", "features": features})
+        self.assertEqual([store.get(i)[0] for i in (1, 2, 3, 4)], ["pending", "pending", "missing", "missing"])
+        
+        detector.release.set()
+        deadline = time.monotonic() + 5
+        while store.get(2)[0] == "pending" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        status, explanation = store.get(2)
+        self.assertEqual(status, "ready")
+        self.assertEqual(explanation["top_features"][0]["contribution"], 1.0)
+        self.assertEqual(store.get(1)[0], "ready")
+        self.assertEqual(store.get(3)[0], "missing")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Unit Tests for the metrics histograms
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from utils.metrics import MetricsCollector, Histogram, summarize
+from app.routes.metrics import render
+
+
+class TestMetrics(unittest.TestCase):
+    
+    def test_concurrent_observations_are_counted(self):
+        """No observation is lost across threads"""
+        hist = Histogram()
+        
+        def work():
+            for _ in range(5000):
+                hist.observe(0.002)
+        
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sum(hist.snapshot()["counts"]), 40000)
+    
+    def test_percentiles(self):
+        """Percentiles land in the right bucket"""
+        hist = Histogram()
+        for _ in range(99):
+            hist.observe(0.001)
+        hist.observe(1.0)
+        summary = summarize(hist.snapshot())
+        self.assertAlmostEqual(summary["p50"], 0.001, delta=0.0002)
+        self.assertGreaterEqual(summary["p99"], 0.001)
+        self.assertAlmostEqual(summary["mean"], (99 * 0.001 + 1.0) / 100)
+    
+    def test_aggregates_across_workers(self):
+        """Snapshots flushed by other processes are merged on read"""
+        store = tempfile.mkdtemp()
+        worker_a = MetricsCollector(store_dir=store)
+        worker_b = MetricsCollector(store_dir=store)
+        worker_a.observe("http_request_seconds", 0.01, route="/a")
+        worker_b.observe("http_request_seconds", 0.02, route="/a")
+        worker_a.flush()
+        
+        # Both collectors live in this process; rename a's file so b reads it as another worker's
+        os.replace(os.path.join(store, f"{os.getpid()}.json"), os.path.join(store, "1.json"))
+        merged = worker_b.merged("http_request_seconds", route="/a")
+        self.assertEqual(merged["count"], 2)
+    
+    def test_recycled_workers_are_retired(self):
+        """An exited worker's counts stay in the totals; its file, process and gauges go"""
+        store = tempfile.mkdtemp()
+        worker_b = MetricsCollector(store_dir=store)
+        worker_b.inc("predictions_total", 1)
+        worker_b.set_gauge("model_load_seconds", 1.0)
+        for fake_pid in (1, 2):
+            worker_a = MetricsCollector(store_dir=store)
+            worker_a.inc("predictions_total", 3)
+            worker_a.observe("http_request_seconds", 0.01, route="/a")
+            worker_a.set_gauge("model_load_seconds", 9.0)
+            worker_a.flush()
+            os.replace(os.path.join(store, f"{os.getpid()}.json"), os.path.join(store, f"{fake_pid}.json"))
+            worker_b.retire(fake_pid)
+        
+        self.assertEqual(sorted(os.listdir(store)), ["retired.json"])
+        agg = worker_b.aggregate()
+        self.assertEqual(agg["processes"], 1)
+        self.assertEqual(agg["counters"]["predictions_total"], 7)
+        self.assertEqual(worker_b.merged("http_request_seconds", agg, route="/a")["count"], 2)
+        self.assertEqual(agg["gauges"]["model_load_seconds"], 1.0)
+    
+    def test_prometheus_exposition(self):
+        """Counters are summed across workers and histogram buckets are cumulative"""
+        store = tempfile.mkdtemp()
+        worker_a = MetricsCollector(store_dir=store)
+        worker_b = MetricsCollector(store_dir=store)
+        worker_a.inc("predictions_total", 3, severity="critical")
+        worker_b.inc("predictions_total", 2, severity="critical")
+        worker_b.observe("db_write_seconds", 0.001)
+        worker_b.observe("db_write_seconds", 0.5)
+        worker_b.set_info("model_bundle_info", version="abc")
+        worker_a.flush()
+        os.replace(os.path.join(store, f"{os.getpid()}.json"), os.path.join(store, "1.json"))
+        
+        text = render(worker_b.aggregate(), openmetrics=True)
+        self.assertIn('ehr_predictions_total{severity="critical"} 5', text)
+        self.assertIn('ehr_db_write_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('ehr_db_write_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('ehr_model_bundle_info{version="abc"} 1', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
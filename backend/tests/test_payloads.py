@@ -0,0 +1,59 @@
+"""
+Unit Tests for binary batch payloads
+"""
+
+import io
+import importlib.util
+import unittest
+import numpy as np
+from app import payloads
+from app.api import create_app
+from app.routes.threat_detection import detector
+
+
+def npy(array):
+    out = io.BytesIO()
+    np.save(out, array)
+    return out.getvalue()
+
+
+class TestPayloads(unittest.TestCase):
+
+    def test_npy_is_a_view(self):
+        """A float64 body is used in place; Fortran order and other dtypes still decode"""
+        X = np.random.default_rng(0).random((50, 7))
+        decoded = payloads.decode_matrix(npy(X), "npy")
+        np.testing.assert_array_equal(decoded, X)
+        self.assertFalse(decoded.flags.owndata)
+        np.testing.assert_array_equal(payloads.decode_matrix(npy(np.asfortranarray(X)), "npy"), X)
+        np.testing.assert_array_equal(payloads.decode_matrix(npy(X.astype(np.float32)), "npy"), X.astype(np.float32))
+        with self.assertRaises(ValueError):
+            payloads.decode_matrix(npy(np.array([["a", "b"]])), "npy")
+
+    @unittest.skipIf(importlib.util.find_spec("pyarrow"), "pyarrow is installed")
+    def test_arrow_without_pyarrow(self):
+        with self.assertRaises(payloads.UnsupportedPayload):
+            payloads.decode_matrix(b"", "arrow")
+
+    def test_batch_route_round_trip(self):
+        """npy in, npy out, with the same scores as the JSON path"""
+        if detector.feature_names is None:
+            self.skipTest("No model bundle")
+        X = np.random.default_rng(1).random((20, len(detector.feature_names)))
+        client = create_app().test_client()
+        response = client.post('/api/threats/batch', data=npy(X), content_type=payloads.NPY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, payloads.NPY)
+        self.assertEqual(response.headers['X-Total-Samples'], "20")
+        records = np.load(io.BytesIO(response.data))
+        expected = client.post('/api/threats/batch', json={"samples": X.tolist()}).get_json()
+        np.testing.assert_array_equal(records["prediction"], expected["predictions"])
+        np.testing.assert_allclose(records["confidence"], expected["confidences"])
+        self.assertEqual(int(response.headers['X-Threats-Detected']), expected["threats_detected"])
+
+        accepted = client.post('/api/threats/batch', json={"samples": X.tolist()}, headers={'Accept': payloads.NPY})
+        self.assertEqual(accepted.mimetype, payloads.NPY)
+
+
+if __name__ == '__main__':
+    unittest.main()
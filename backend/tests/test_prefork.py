@@ -0,0 +1,73 @@
+"""
+Unit Tests for pre-fork serving
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+import numpy as np
+import config
+from ml.detector import AdvancedThreatDetector
+from utils import prefork
+from utils.metrics import MetricsCollector
+
+
+class TestPrefork(unittest.TestCase):
+
+    def test_after_fork_hooks(self):
+        """Setup deferred while preloading runs in the worker; inherited counters restart at zero"""
+        started, hooks = [], list(prefork._after_fork)
+        collector = MetricsCollector()
+        collector.inc("requests_total", 5)
+        collector.set_gauge("model_load_seconds", 2.0)
+        try:
+            prefork.preloading()
+            prefork.after_fork(collector.after_fork)
+            prefork.in_workers(lambda: started.append(os.getpid()))
+            self.assertEqual(started, [])
+            prefork.forked(os.getppid())
+            self.assertEqual(started, [os.getpid()])
+            self.assertEqual(prefork.master_pid, os.getppid())
+        finally:
+            prefork._preloading, prefork._after_fork[:] = False, hooks
+            prefork.master_pid = None
+        snap = collector.snapshot()
+        self.assertEqual(snap["counters"]["requests_total"], 0)
+        self.assertEqual(snap["gauges"]["model_load_seconds"], 2.0)
+        prefork.in_workers(lambda: started.append("now"))
+        self.assertEqual(started[-1], "now")
+
+    def test_protect_keeps_predictions(self):
+        """The bundle's arrays become read-only and scoring is unchanged"""
+        detector = AdvancedThreatDetector()
+        try:
+            detector.load(str(config.MODELS_FOLDER))
+        except Exception:
+            self.skipTest("No model bundle")
+        X = np.random.default_rng(0).random((100, len(detector.feature_names)))
+        before = detector.predict(X)
+        self.assertGreater(prefork.protect(*detector.shared_state()), 0)
+        self.assertFalse(detector.feature_transform.mean.flags.writeable)
+        after = detector.predict(X)
+        np.testing.assert_array_equal(before["confidence"], after["confidence"])
+
+    @unittest.skipUnless(os.path.exists("/proc/self/smaps_rollup"), "Linux only")
+    def test_memory_report(self):
+        """This process and its children, with unique and shared pages"""
+        child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        try:
+            report = prefork.memory_report(os.getpid())
+        finally:
+            child.kill()
+            child.wait()
+        roles = {p["pid"]: p["role"] for p in report["processes"]}
+        self.assertEqual(roles[os.getpid()], "master")
+        self.assertEqual(roles[child.pid], "worker")
+        for p in report["processes"]:
+            self.assertEqual(p["uss"] + p["shared"], p["rss"])
+        self.assertLessEqual(report["total_pss"], report["total_rss"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Unit Tests for the fused feature transform
+"""
+
+import unittest
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+from ml.preprocessor import FeatureTransform, unique_rows
+
+
+class TestFeatureTransform(unittest.TestCase):
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(500, 8)) * rng.uniform(1, 1000, 8)
+        self.X[rng.random(self.X.shape) < 0.05] = np.nan
+        self.X[rng.random(self.X.shape) < 0.01] = np.inf
+        self.X[0, 3] = 1e15
+    
+    def reference(self, X):
+        """The original four-step training pipeline"""
+        X = np.where(np.isinf(X), np.nan, X)
+        X = np.clip(X, -1e12, 1e12)
+        X = SimpleImputer(strategy="mean").fit_transform(X)
+        X = np.nan_to_num(X, nan=0.0)
+        return StandardScaler().fit_transform(X)
+    
+    def test_matches_training_pipeline(self):
+        """Fused transform reproduces the original pipeline"""
+        transform = FeatureTransform.fit(self.X)
+        np.testing.assert_allclose(transform.transform(self.X), self.reference(self.X), atol=1e-10)
+    
+    def test_from_scaler_matches(self):
+        """Transform rebuilt from a saved scaler gives the same features"""
+        fitted = FeatureTransform.fit(self.X)
+        rebuilt = FeatureTransform.from_scaler(fitted.to_scaler())
+        np.testing.assert_allclose(rebuilt.transform(self.X), fitted.transform(self.X), atol=1e-10)
+    
+    def test_in_place(self):
+        """copy=False reuses the caller's buffer"""
+        transform = FeatureTransform.fit(self.X)
+        X = self.X.copy()
+        out = transform.transform(X, copy=False)
+        self.assertTrue(np.shares_memory(out, X))
+        self.assertTrue(np.isfinite(out).all())
+
+
+class TestUniqueRows(unittest.TestCase):
+    
+    def test_round_trip(self):
+        """Distinct rows in first-appearance order; NaN rows match byte for byte"""
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(300, 7))
+        X[5, 2] = np.nan
+        X[150:] = X[rng.integers(0, 150, 150)]
+        for A in (X, X.astype(np.float32)):
+            first, inverse = unique_rows(A)
+            self.assertEqual(len(first), len({row.tobytes() for row in A}))
+            self.assertTrue((np.diff(first) > 0).all())
+            self.assertEqual(A[first][inverse].tobytes(), A.tobytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Unit Tests for the on-demand profiler
+"""
+
+import unittest
+from utils.profiling import Profiler
+
+
+def busy():
+    return sum(i * i for i in range(2000))
+
+
+class Rule:
+    rule = "/api/threats/detect"
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_deterministic_stacks_are_folded(self):
+        """Profiled requests produce route-rooted folded stacks"""
+        profiler = Profiler()
+        profiler.start("deterministic", seconds=10, requests=5, sample_rate=1.0)
+        token = profiler.begin_request("POST", Rule())
+        busy()
+        profiler.end_request(token)
+
+        lines = profiler.folded().splitlines()
+        self.assertTrue(any(line.startswith("POST /api/threats/detect;") and "busy" in line for line in lines))
+
+    def test_session_ends_at_request_limit(self):
+        """Profiling switches itself off once the request budget is used"""
+        profiler = Profiler()
+        profiler.start("deterministic", seconds=10, requests=2, sample_rate=1.0)
+        for _ in range(3):
+            token = profiler.begin_request("GET", None)
+            if token is not None:
+                profiler.end_request(token)
+        status = profiler.status()
+        self.assertFalse(status["active"])
+        self.assertEqual(status["ended"], "request limit")
+        self.assertEqual(status["requests_profiled"], 2)
+
+    def test_rejects_windows_over_the_cap(self):
+        profiler = Profiler()
+        with self.assertRaises(ValueError):
+            profiler.start("sampling", seconds=10 ** 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Unit Tests for report rollups and snapshots
+"""
+
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from app.api import create_app
+from app.database import db
+from app.reports import ReportSnapshots
+from app.routes.reports import send_snapshot
+
+
+class Detector:
+    model_version = "test"
+
+
+def add(day, prediction, severity, source_ip="10.0.0.1"):
+    db.add_threat({"timestamp": f"{day}T12:00:00", "prediction": prediction, "confidence": 0.9,
+                   "severity": severity, "threat_type": prediction, "source_ip": source_ip})
+
+
+class TestReports(unittest.TestCase):
+
+    def test_rollups_are_incremental(self):
+        """Rows added after a refresh are folded into the existing day"""
+        add("1999-01-01", 1, "critical")
+        add("1999-01-02", 0, "info")
+        db.refresh_rollups()
+        add("1999-01-01", 1, "warning", "10.0.0.2")
+        db.refresh_rollups()
+
+        days = {r["bucket"]: r for r in db.get_rollups("1999-01-01", "1999-01-02")}
+        self.assertEqual((days["1999-01-01"]["total"], days["1999-01-01"]["threats"]), (2, 2))
+        self.assertEqual((days["1999-01-01"]["critical"], days["1999-01-01"]["warning"]), (1, 1))
+        self.assertEqual(days["1999-01-02"]["threats"], 0)
+        self.assertEqual(db.get_rollups("1999-01-01", "1999-01-31", 7)[0]["total"], 3)
+        self.assertEqual(len(db.top_sources("1999-01-01", "1999-01-02")), 2)
+
+    def test_range_snapshot_reused_until_period_changes(self):
+        snapshots = ReportSnapshots(db, Detector(), folder=tempfile.mkdtemp())
+        add("1999-02-01", 1, "critical")
+        first = snapshots.range(date(1999, 2, 1), date(1999, 2, 28))
+        add("2000-01-01", 1, "critical")  # Outside the period
+        self.assertEqual(snapshots.range(date(1999, 2, 1), date(1999, 2, 28))["id"], first["id"])
+        add("1999-02-02", 1, "critical")
+        second = snapshots.range(date(1999, 2, 1), date(1999, 2, 28))
+        self.assertNotEqual(second["id"], first["id"])
+        self.assertTrue(second["path"].read_bytes().startswith(b"%PDF"))
+
+    def test_pruned_snapshot_is_fetched_again(self):
+        """A snapshot deleted between lookup and send is replaced by a fresh one, not a 500"""
+        folder = Path(tempfile.mkdtemp())
+        (folder / "live-new.pdf").write_bytes(b"%PDF-new")
+        found = iter([{"id": "live-old", "path": folder / "live-old.pdf", "stale": True},
+                      {"id": "live-new", "path": folder / "live-new.pdf", "stale": False}])
+        with create_app().test_request_context():
+            response = send_snapshot(lambda: next(found), "report.pdf")
+            response.direct_passthrough = False
+            self.assertEqual(response.headers["X-Report-Id"], "live-new")
+            self.assertEqual(response.get_data(), b"%PDF-new")
+            response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
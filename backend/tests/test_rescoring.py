@@ -0,0 +1,79 @@
+"""
+Unit Tests for re-scoring stored threats
+"""
+
+import tempfile
+import unittest
+import numpy as np
+import config
+from app.database import db
+from app.rescoring import Rescorer
+from ml.detector import AdvancedThreatDetector
+from ml.similarity import VectorStore
+
+
+def add(confidence, version="old", features=None):
+    return db.add_threat({"prediction": 1, "confidence": confidence, "severity": "critical", "threat_type": 1,
+                          "source_ip": "10.0.0.7", "type": "Malware", "model_version": version,
+                          "features": features})
+
+
+def rollup_matches_table():
+    conn = db._get_conn()
+    rolled = conn.execute("SELECT SUM(total), SUM(threats), SUM(critical), SUM(warning), "
+                          "ROUND(SUM(confidence_sum), 6) FROM threat_daily").fetchone()
+    actual = conn.execute("SELECT COUNT(*), SUM(prediction = 1), SUM(severity = 'critical'), "
+                          "SUM(severity = 'warning'), ROUND(TOTAL(confidence), 6) FROM threats").fetchone()
+    conn.close()
+    return rolled == actual
+
+
+class TestRescoring(unittest.TestCase):
+
+    def test_batches_keep_rollups_exact(self):
+        """Rolled-up days get the difference between old and new scores; a repeat writes nothing"""
+        ids = [add(0.99) for _ in range(5)]
+        db.refresh_rollups()
+        job = db.create_rescore_job("new", "sig", len(ids))
+        self.assertTrue(db.claim_rescore_job(job, "me", 0, len(ids)))
+        rows = [(i, 0, 0.1, "info", "Normal") for i in ids[:3]] + [(i, 1, 0.85, "warning", "Malware") for i in ids[3:]]
+        self.assertEqual(db.apply_rescores(job, "me", "new", rows, 5), 5)
+        self.assertTrue(rollup_matches_table())
+        self.assertEqual(db.apply_rescores(job, "me", "new", rows, 5), 0)
+        self.assertTrue(rollup_matches_table())
+        found = {row["id"]: row for row in db.get_threats_by_ids(ids)}
+        self.assertEqual((found[ids[0]]["attack_type"], found[ids[0]]["model_version"]), ("Normal", "new"))
+        db.release_rescore_job(job, "me", "done")
+
+    def test_pause_and_take_over(self):
+        """A paused job writes nothing more and can be resumed by another runner"""
+        threat = add(0.99)
+        job = db.create_rescore_job("v2", "sig", 1)
+        self.assertTrue(db.claim_rescore_job(job, "a", 0, 1))
+        self.assertFalse(db.claim_rescore_job(job, "b", 0, 1))  # a's heartbeat is fresh
+        self.assertTrue(db.pause_rescore_job(job))
+        self.assertIsNone(db.apply_rescores(job, "a", "v2", [(threat, 0, 0.2, "info", "Normal")], 1))
+        db.release_rescore_job(job, "a", "paused")
+        self.assertTrue(db.claim_rescore_job(job, "b", 0, 1))
+        self.assertEqual(db.get_rescore_job(job)["cursor"], 0)
+        db.release_rescore_job(job, "b", "paused")
+
+    def test_run_scores_stored_vectors(self):
+        """The pool scores every stored vector with the loaded bundle and the job completes"""
+        detector = AdvancedThreatDetector()
+        detector.load(str(config.MODELS_FOLDER))
+        store = VectorStore(detector, tempfile.mkdtemp())
+        X = np.random.default_rng(0).normal(size=(40, len(detector.feature_names)))
+        ids = [add(0.99, features=x) for x in X]
+        store.append(ids, X)
+        settings = {**config.RESCORE, "workers": 1, "chunk_rows": 16, "batch_rows": 7, "rows_per_second": 0}
+        job = Rescorer(db, store, detector, settings=settings).run()
+        self.assertEqual((job["status"], job["cursor"], job["rescored"]), ("done", 40, 40))
+        expected = detector.predict(X.astype(np.float32).astype(np.float64))["confidence"]
+        stored = [row["confidence"] for row in db.get_threats_by_ids(ids)]
+        np.testing.assert_allclose(stored, expected)
+        self.assertEqual({row["model_version"] for row in db.get_threats_by_ids(ids)}, {detector.model_version})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Unit Tests for batch result assembly and bulk threat writes
+"""
+
+import json
+import unittest
+import numpy as np
+from app import results
+from app.api import create_app
+from app.database import Database
+
+
+class TestResults(unittest.TestCase):
+
+    def test_assemble(self):
+        """Severity follows THREAT_THRESHOLDS; only flagged rows become records"""
+        X = np.arange(12, dtype=np.float64).reshape(4, 3)
+        result = {"prediction": np.array([1, 0, 1, 1]), "confidence": np.array([0.99, 0.1, 0.85, 0.6])}
+        batch = results.assemble(result, X, "Batch Upload", "v1")
+        self.assertEqual((batch["threats"], batch["benign"]), (3, 1))
+        records = batch["records"]
+        self.assertEqual(records["severity"].tolist(), ["critical", "warning", "info"])
+        np.testing.assert_array_equal(records["features"], X[[0, 2, 3]])
+        self.assertTrue(all(ip.startswith("192.168.1.") for ip in records["source_ip"]))
+
+    def test_add_threats(self):
+        """One transaction, consecutive ids, batch listeners get columns, others get rows"""
+        db = Database()
+        batches, rows = [], []
+        db.add_listener(lambda threat_id, data: None, lambda ids, columns: batches.append(ids))
+        db.add_listener(lambda threat_id, data: rows.append((threat_id, data["source_ip"], data["type"])))
+        before = db.generation()
+        ids = db.add_threats({"prediction": 1, "confidence": np.array([0.97, 0.82]),
+                              "severity": np.array(["critical", "warning"]), "threat_type": 1,
+                              "source_ip": np.array(["10.9.8.7", "10.9.8.6"], dtype=object), "type": "Batch Upload"})
+        self.assertEqual(ids[1], ids[0] + 1)
+        self.assertEqual(db.generation(), before + 1)
+        self.assertEqual(batches[0].tolist(), ids.tolist())
+        self.assertEqual(rows, [(ids[0], "10.9.8.7", "Batch Upload"), (ids[1], "10.9.8.6", "Batch Upload")])
+        stored, _ = db.search_threats(ip_range=(0x0A090806, 0x0A090807))
+        self.assertEqual(sorted(row["id"] for row in stored), ids.tolist())
+
+    def test_numpy_responses(self):
+        """jsonify writes arrays and NumPy scalars; NaN bodies still parse"""
+        app = create_app()
+        with app.app_context():
+            body = app.json.response({"a": np.arange(3), "b": np.float32(0.5), "c": np.ones((2, 2))[:, 0]})
+            self.assertEqual(json.loads(body.data), {"a": [0, 1, 2], "b": 0.5, "c": [1.0, 1.0]})
+            self.assertTrue(np.isnan(app.json.loads('{"x": NaN}')["x"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Unit Tests for threat search
+"""
+
+import unittest
+from app.api import create_app
+from app.database import db
+
+
+def add(timestamp, severity, source_ip, attack="PortScan", confidence=0.9):
+    return db.add_threat({"timestamp": timestamp, "prediction": 1, "confidence": confidence,
+                          "severity": severity, "threat_type": 1, "source_ip": source_ip, "type": attack})
+
+
+class TestSearch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ids = [
+            add("1998-03-01T10:00:00", "critical", "172.16.4.10", "SSH-Patator", 0.99),
+            add("1998-03-01T11:00:00", "warning", "172.16.4.200", "Web Attack Brute Force", 0.85),
+            add("1998-03-02T09:00:00", "critical", "172.16.9.1", "Web Attack XSS", 0.97),
+            add("1998-03-03T09:00:00", "normal", "fe80::1", "Normal", 0.05),
+        ]
+
+    def search(self, **filters):
+        rows, _ = db.search_threats(**{"start": "1998-03-01", "end": "1998-03-04", **filters})
+        return [row["id"] for row in rows]
+
+    def test_filters(self):
+        a, b, c, d = self.ids
+        self.assertEqual(self.search(), [d, c, b, a])
+        self.assertEqual(self.search(severities=["critical"]), [c, a])
+        self.assertEqual(self.search(severities=["critical", "warning"], ip_range=(0xAC100400, 0xAC1004FF)), [b, a])
+        self.assertEqual(self.search(source_ip="fe80::1"), [d])
+        self.assertEqual(self.search(end="1998-03-02"), [b, a])
+        self.assertEqual(self.search(min_confidence=0.9, max_confidence=0.98), [c])
+        self.assertEqual(self.search(text="web attack"), [c, b])
+        self.assertEqual(self.search(text="brute*"), [b])
+        self.assertEqual(self.search(text="172.16.4.10"), [a])
+
+    def test_keyset_pages(self):
+        first, cursor = db.search_threats(start="1998-03-01", end="1998-03-04", limit=3)
+        second, last = db.search_threats(start="1998-03-01", end="1998-03-04", limit=3, before_id=cursor)
+        self.assertEqual([r["id"] for r in first + second], self.ids[::-1])
+        self.assertIsNone(last)
+
+    def test_endpoint_cidr(self):
+        client = create_app().test_client()
+        body = client.get('/api/threats/search?ip=172.16.4.0/24&start=1998-03-01&end=1998-03-04').get_json()
+        self.assertEqual([r["id"] for r in body["results"]], self.ids[1::-1])
+        self.assertIsNone(body["next_cursor"])
+        self.assertEqual(client.get('/api/threats/search?ip=fe80::/64').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
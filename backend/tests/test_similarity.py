@@ -0,0 +1,66 @@
+"""
+Unit Tests for the threat vector store and similarity index
+"""
+
+import tempfile
+import unittest
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+import config
+from ml.detector import AdvancedThreatDetector
+from ml.similarity import VectorStore, SimilarityIndex
+
+
+class TestSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(scale=5.0, size=(20, 12))
+        self.X = (centers[rng.integers(0, 20, 3000)] + rng.normal(size=(3000, 12))).astype(np.float32)
+        self.detector = AdvancedThreatDetector()
+        self.detector.feature_names = [f"f{i}" for i in range(12)]
+        self.detector.scaler = StandardScaler().fit(self.X)
+        self.detector.model_version = "v1"
+        self.settings = {**config.VECTORS, "components": 6, "rebuild_min_rows": 10 ** 9}
+        self.store = VectorStore(self.detector, tempfile.mkdtemp(), self.settings)
+        self.index = SimilarityIndex(self.store, self.detector, self.settings)
+
+    def exact(self, threat_id, ids, k):
+        scaled = self.detector.transform(self.X[:len(ids)])
+        d = np.linalg.norm(scaled - scaled[ids.index(threat_id)], axis=1)
+        return [ids[i] for i in np.argsort(d) if ids[i] != threat_id][:k]
+
+    def test_listener_keeps_flagged_rows(self):
+        self.store.on_threat(7, {"prediction": 1, "features": self.X[0].tolist()})
+        self.store.on_threat(8, {"prediction": 0, "features": self.X[1].tolist()})
+        self.store.on_threat(9, {"prediction": 1})
+        records = self.store.records()
+        self.assertEqual(records["id"].tolist(), [7])
+        np.testing.assert_array_equal(records["x"][0], self.X[0])
+
+    def test_matches_exact_neighbours_across_tail(self):
+        """Tree rows and rows appended after the build both come back, nearest first"""
+        ids = list(range(100, 3100))
+        self.store.append(ids[:2000], self.X[:2000])
+        self.assertIsNotNone(self.index.similar(ids[0], 5))
+        self.store.append(ids[2000:], self.X[2000:3000])
+        for threat_id in (ids[10], ids[2500]):
+            found = [i for i, _ in self.index.similar(threat_id, 10)]
+            self.assertNotIn(threat_id, found)
+            self.assertEqual(found, self.exact(threat_id, ids, 10))
+        self.assertEqual(self.index._built.size, 2000)
+        self.assertEqual(self.index.size, 3000)
+        self.assertIsNone(self.index.similar(99, 5))
+
+    def test_new_bundle_rebuilds(self):
+        self.store.append(list(range(500)), self.X[:500])
+        self.index.similar(0, 3)
+        self.store.append(list(range(500, 600)), self.X[500:600])
+        self.detector.model_version = "v2"
+        self.index.similar(0, 3)
+        self.assertEqual(self.index._built.version.split("-")[0], "v2")
+        self.assertEqual(self.index._built.size, 600)
+
+
+if __name__ == '__main__':
+    unittest.main()
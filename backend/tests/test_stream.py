@@ -0,0 +1,73 @@
+"""
+Unit Tests for the live threat stream
+"""
+
+import json
+import unittest
+import config
+from app.database import db
+from app.stream import ThreatBroadcaster
+
+
+def add(prediction, severity, confidence=0.9):
+    return db.add_threat({"prediction": prediction, "confidence": confidence,
+                          "severity": severity, "threat_type": prediction, "source_ip": "10.0.0.9"})
+
+
+def events(chunk):
+    """[(event, data)] from a chunk of SSE frames"""
+    parsed = []
+    for frame in chunk.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+class TestStream(unittest.TestCase):
+
+    def test_totals_follow_new_threats(self):
+        live = ThreatBroadcaster(db)
+        before = live.totals()
+        add(1, "critical", 0.99)
+        add(0, "normal", 0.1)
+        after = live.totals()
+        self.assertEqual(after["total_threats"] - before["total_threats"], 1)
+        self.assertEqual(after["total_benign"] - before["total_benign"], 1)
+        self.assertEqual(after["threats_today"] - before["threats_today"], 1)
+        self.assertEqual(after["critical"] - before["critical"], 1)
+        stats = db.get_stats()
+        self.assertEqual(after["total_threats"], stats["total_threats"])
+        self.assertAlmostEqual(after["avg_confidence"], stats["avg_confidence"])
+
+    def test_client_gets_snapshot_then_deltas(self):
+        live = ThreatBroadcaster(db, {**config.STREAM, "tail_seconds": 0.05})
+        frames = live.subscribe()
+        (kind, snapshot), = events(next(frames))
+        self.assertEqual(kind, "snapshot")
+
+        threat_id = add(1, "warning")
+        (kind, update), = events(next(frames))
+        self.assertEqual(kind, "threats")
+        self.assertEqual(update["threats"][0]["id"], threat_id)
+        self.assertEqual(update["delta"]["warning"], 1)
+        self.assertEqual(update["delta"]["total_threats"], 1)
+        frames.close()
+        self.assertEqual(live.clients, 0)
+
+    def test_slow_client_is_resynced(self):
+        """A client past its buffer gets one snapshot instead of every frame"""
+        live = ThreatBroadcaster(db, {**config.STREAM, "buffer_frames": 2, "batch_rows": 1, "tail_seconds": 60})
+        frames = live.subscribe()
+        next(frames)
+        for _ in range(5):
+            add(1, "critical")
+        live.catch_up()
+        (kind, snapshot), = events(next(frames))
+        self.assertEqual(kind, "snapshot")
+        self.assertEqual(snapshot["stats"]["last_id"], db.max_threat_id())
+        frames.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
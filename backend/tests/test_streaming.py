@@ -0,0 +1,61 @@
+"""
+Unit Tests for the per-entity streaming detector
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+import config
+from ml.streaming import EntityWindows, StreamingDetector, entity_hashes
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.start = 1.8e9
+
+    def test_scanner_alerted_once_per_window(self):
+        """One user opening 300 records in a minute is flagged once; quiet users are not"""
+        detector = StreamingDetector({**config.STREAMING, "max_entities": 1000})
+        n = 3000
+        users = self.rng.integers(0, 500, n).astype(str)
+        users[:300] = "scanner"
+        events = pd.DataFrame({
+            "user": users,
+            "resource": self.rng.integers(0, 10 ** 6, n),
+            "timestamp": self.start + self.rng.random(n) * 50,
+        })
+        first = detector.observe(events.iloc[:1500])
+        second = detector.observe(events.iloc[1500:])
+
+        alerts = first["alerts"] + second["alerts"]
+        self.assertEqual([(a["kind"], a["entity"], a["reason"]) for a in alerts],
+                         [("user", "scanner", "breadth")])
+        self.assertEqual(first["reasons"][0], "user:breadth")
+
+    def test_eviction_keeps_table_bounded(self):
+        settings = {**config.STREAMING, "max_entities": 500, "kinds": ["user"]}
+        detector = StreamingDetector(settings)
+        for batch in range(10):
+            detector.observe(pd.DataFrame({
+                "user": np.arange(batch * 300, (batch + 1) * 300),
+                "timestamp": self.start + batch,
+            }))
+        stats = detector.stats()["user"]
+        self.assertLessEqual(stats["entities"], 500)
+        self.assertEqual(stats["entities"] + stats["evicted"], 3000)
+
+    def test_locate_finds_existing_slots(self):
+        table = EntityWindows("user", {**config.STREAMING, "max_entities": 100})
+        keys = np.unique(entity_hashes(np.arange(70)))
+        slots, new = table._locate(keys)
+        self.assertTrue(new.all())
+        self.assertEqual(len(set(slots.tolist())), len(keys))
+        again, new = table._locate(keys)
+        np.testing.assert_array_equal(again, slots)
+        self.assertFalse(new.any())
+
+
+if __name__ == '__main__':
+    unittest.main()
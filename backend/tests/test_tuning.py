@@ -0,0 +1,67 @@
+"""
+Unit Tests for successive-halving tuning
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import numpy as np
+import config
+from ml.checkpoint import TrainingRun
+from ml import tuning
+
+
+def make_run(rows: int = 240) -> TrainingRun:
+    rng = np.random.default_rng(0)
+    y = (rng.random(rows) < 0.4).astype(np.int64)
+    X = rng.normal(size=(rows, 4)) + y[:, None] * 1.5
+    run = TrainingRun.create(tempfile.mkdtemp())
+    run.save_arrays("split", X_train=X, y_train=y)
+    return run
+
+
+class TestTuning(unittest.TestCase):
+
+    def test_build_folds(self):
+        """Stratified folds and a row permutation, cached in the run"""
+        run = make_run()
+        paths = tuning.build_folds(run, n_folds=3, seed=1)
+        fold_of_row, order = np.load(paths["fold_of_row"]), np.load(paths["order"])
+        y = np.load(paths["y_train"])
+        self.assertEqual(sorted(order.tolist()), list(range(len(y))))
+        for fold in range(3):
+            share = y[fold_of_row == fold].mean()
+            self.assertAlmostEqual(share, y.mean(), delta=0.02)
+        self.assertEqual(tuning.build_folds(run, n_folds=5, seed=2), paths)
+        np.testing.assert_array_equal(np.load(paths["fold_of_row"]), fold_of_row)
+
+    def test_successive_halving(self):
+        """Rungs shrink the field by eta and grow the data; the best of the last rung wins"""
+        paths = tuning.build_folds(make_run(), n_folds=2)
+        space = {"n_estimators": [5, 10], "max_depth": [2, 4]}
+        settings = {"eta": 2, "cv_folds": 2, "n_candidates": 4, "min_fraction": 0.25, "seed": 0}
+        with mock.patch.dict(config.TUNING_SPACE, {"random_forest": space}), \
+                ThreadPoolExecutor(2) as pool:
+            result = tuning.successive_halving("rf", paths, pool, settings)
+        rungs = [[h for h in result["history"] if h["rung"] == r] for r in range(2)]
+        self.assertEqual([len(r) for r in rungs], [4, 2])
+        self.assertEqual([r[0]["fraction"] for r in rungs], [0.5, 1.0])
+        self.assertEqual(result["best"], max(rungs[1], key=lambda h: h["auc"]))
+        self.assertGreater(result["best"]["auc"], 0.5)
+
+    def test_write_overrides_merges(self):
+        path = os.path.join(tempfile.mkdtemp(), "override.json")
+        with open(path, "w") as f:
+            json.dump({"svm": {"C": 10}, "random_forest": {"max_depth": 10}}, f)
+        with mock.patch.object(config, "MODEL_PARAMS_OVERRIDE_FILE", path):
+            tuning.write_overrides({"random_forest": {"n_estimators": 200}})
+        with open(path) as f:
+            self.assertEqual(json.load(f), {"svm": {"C": 10},
+                                            "random_forest": {"max_depth": 10, "n_estimators": 200}})
+
+
+if __name__ == '__main__':
+    unittest.main()
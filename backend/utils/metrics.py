@@ -1,41 +1,400 @@
 """
 Performance Metrics
+Fixed-bucket histograms, counters and gauges that can be merged across
+threads and gunicorn workers.
+
+Every thread writes to its own shard, so recording takes no lock; shards
+of finished threads are folded into a retired total when read. Every
+worker periodically writes its snapshot to METRICS_DIR/<pid>.json and
+readers merge all snapshot files (histograms and counters are summed,
+gauges take the max), which gives exact counts and bucket-accurate
+percentiles across processes. When a worker exits (recycled after
+max_requests), the master folds its file into METRICS_DIR/retired.json, so
+the directory holds one file per live worker plus the archive.
 """
 
+import json
 import logging
-from datetime import datetime
-from typing import Dict
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import config
+from utils import prefork
 
 logger = logging.getLogger(__name__)
 
+# Latency bucket upper bounds in seconds: 10^(e/20) for e in -100..35,
+# i.e. 10µs … ~56s, ~12% apart
+LATENCY_BUCKETS = [round(10 ** (e / 20), 9) for e in range(-100, 36)]
+
+# Fold dead threads' shards once this many have accumulated
+MAX_SHARDS = 64
+
+# Histograms and counters of exited workers, folded together by the gunicorn master
+RETIRED = "retired.json"
+
+
+class _Sharded:
+    """Per-thread lists of numbers, summed on read"""
+
+    def __init__(self, width: int):
+        self._width = width
+        self._local = threading.local()
+        self._lock = threading.Lock()  # Only for shard registration and folding
+        self._shards: List[Tuple[threading.Thread, list]] = []
+        self._retired = [0] * width
+
+    def _new_shard(self) -> list:
+        shard = [0] * self._width
+        with self._lock:
+            if len(self._shards) >= MAX_SHARDS:
+                self._fold()
+            self._shards.append((threading.current_thread(), shard))
+        self._local.shard = shard
+        return shard
+
+    def reset(self):
+        """Back to zero (a forked worker starts from the master's totals otherwise)"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = [0] * self._width
+
+    def _fold(self):
+        # Dead threads never write again, so their shards can be merged safely
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for i, v in enumerate(shard):
+                    self._retired[i] += v
+        self._shards = live
+
+    def _total(self) -> list:
+        with self._lock:
+            self._fold()
+            total = list(self._retired)
+            for _, shard in self._shards:
+                for i, v in enumerate(shard):
+                    total[i] += v
+        return total
+
+
+class Histogram(_Sharded):
+    """Fixed-bucket histogram (one overflow bucket) with a running sum"""
+
+    def __init__(self, bounds: List[float] = LATENCY_BUCKETS):
+        super().__init__(len(bounds) + 2)
+        self.bounds = bounds
+        self._log_buckets = bounds is LATENCY_BUCKETS
+        self._overflow = len(bounds)
+
+    def observe(self, value: float):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        if self._log_buckets:
+            # O(1) index for the log-spaced latency buckets
+            idx = math.ceil(20 * math.log10(value)) + 100 if value > 1e-5 else 0
+            if idx > self._overflow:
+                idx = self._overflow
+        else:
+            idx = bisect_left(self.bounds, value)
+        shard[idx] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> Dict:
+        total = self._total()
+        return {"counts": total[:-1], "sum": total[-1]}
+
+
+class Counter(_Sharded):
+    """Monotonic counter"""
 
-class MetricsCollector:
-    """Collect and report metrics"""
-    
     def __init__(self):
-        self.metrics = {
-            'total_predictions': 0,
-            'threats_detected': 0,
-            'benign_detected': 0,
-            'avg_confidence': 0,
-            'start_time': datetime.now(),
+        super().__init__(1)
+
+    def inc(self, amount: float = 1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard[0] += amount
+
+    def value(self) -> float:
+        return self._total()[0]
+
+
+class Timer:
+    """Times a with-block into a histogram (a plain class is cheaper than @contextmanager)"""
+
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+def percentile(counts: List[int], q: float, bounds: List[float] = LATENCY_BUCKETS) -> float:
+    """q-th percentile from bucket counts (upper bound of the bucket holding it)"""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    rank = q / 100 * total
+    seen = 0
+    for i, c in enumerate(counts):
+        seen += c
+        if seen >= rank and c:
+            return bounds[min(i, len(bounds) - 1)]
+    return bounds[-1]
+
+
+def summarize(snap: Dict, bounds: List[float] = LATENCY_BUCKETS) -> Dict:
+    """count/mean/p50/p95/p99 for a histogram snapshot (values in the histogram's unit)"""
+    counts = snap["counts"]
+    count = sum(counts)
+    return {
+        "count": count,
+        "mean": snap["sum"] / count if count else 0.0,
+        "p50": percentile(counts, 50, bounds),
+        "p95": percentile(counts, 95, bounds),
+        "p99": percentile(counts, 99, bounds),
+    }
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    return name + "|" + ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+
+
+def parse_key(key: str) -> Tuple[str, Dict[str, str]]:
+    """Inverse of the internal series key: name, labels"""
+    name, _, rest = key.partition("|")
+    labels = dict(part.split("=", 1) for part in rest.split(",")) if rest else {}
+    return name, labels
+
+
+def merge(snapshots: List[Optional[Dict]]) -> Dict:
+    """Series of several snapshots (None entries skipped): histograms and counters
+    are summed, gauges take the max"""
+    snapshots = [s for s in snapshots if s is not None]
+    histograms: Dict[str, Dict] = {}
+    counters: Dict[str, float] = {}
+    gauges: Dict[str, float] = {}
+    for snap in snapshots:
+        for key, h in snap["histograms"].items():
+            if key not in histograms:
+                histograms[key] = {"bounds": h["bounds"], "counts": list(h["counts"]), "sum": h["sum"]}
+            else:
+                m = histograms[key]
+                m["counts"] = [a + b for a, b in zip(m["counts"], h["counts"])]
+                m["sum"] += h["sum"]
+        for key, v in snap.get("counters", {}).items():
+            counters[key] = counters.get(key, 0) + v
+        for key, v in snap.get("gauges", {}).items():
+            gauges[key] = max(gauges.get(key, v), v)
+    return {
+        "start_time": min(s["start_time"] for s in snapshots),
+        "histograms": histograms,
+        "counters": counters,
+        "gauges": gauges,
+    }
+
+
+class MetricsCollector:
+    """Process-wide registry of metric series, aggregated across workers on read"""
+
+    def __init__(self, store_dir: Optional[str] = None, flush_interval: float = 1.0):
+        self.store_dir = Path(store_dir) if store_dir else None
+        self.flush_interval = flush_interval
+        self.start_time = time.time()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, float] = {}
+        # (name, labels as given) → series, so hot paths skip building the string key
+        self._series: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def _register(self, fast: tuple, registry: Dict, factory, name: str, labels: Dict):
+        with self._lock:
+            series = registry.setdefault(_key(name, labels), factory())
+            self._series[fast] = series
+        return series
+
+    def histogram(self, name: str, bounds: List[float] = LATENCY_BUCKETS, **labels) -> Histogram:
+        fast = (name, *labels.items())
+        series = self._series.get(fast)
+        if series is None:
+            series = self._register(fast, self._histograms, lambda: Histogram(bounds), name, labels)
+        return series
+
+    def counter(self, name: str, **labels) -> Counter:
+        fast = (name, *labels.items())
+        series = self._series.get(fast)
+        if series is None:
+            series = self._register(fast, self._counters, Counter, name, labels)
+        return series
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation (seconds for latency histograms)"""
+        fast = (name, *labels.items())
+        series = self._series.get(fast)
+        if series is None:
+            series = self._register(fast, self._histograms, Histogram, name, labels)
+        series.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        fast = (name, *labels.items())
+        series = self._series.get(fast)
+        if series is None:
+            series = self._register(fast, self._counters, Counter, name, labels)
+        series.inc(amount)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self._gauges[_key(name, labels)] = float(value)
+
+    def set_info(self, name: str, **labels):
+        """Info-style gauge: exactly one series of name, valued 1"""
+        with self._lock:
+            for key in [k for k in self._gauges if parse_key(k)[0] == name]:
+                del self._gauges[key]
+            self._gauges[_key(name, labels)] = 1.0
+
+    def timer(self, name: str, **labels) -> "Timer":
+        """Time a block into a latency histogram"""
+        return Timer(self.histogram(name, **labels))
+
+    def after_fork(self):
+        """In a worker forked from a preloaded master: zero the inherited histograms and
+        counters (series objects stay, callers may hold them); gauges are kept"""
+        self._lock = threading.Lock()
+        for series in list(self._histograms.values()) + list(self._counters.values()):
+            series.reset()
+        self.start_time = time.time()
+        self._last_flush = 0.0
+
+    def snapshot(self) -> Dict:
+        """This process's series"""
+        return {
+            "pid": os.getpid(),
+            "start_time": self.start_time,
+            "histograms": {k: {"bounds": h.bounds, **h.snapshot()} for k, h in list(self._histograms.items())},
+            "counters": {k: c.value() for k, c in list(self._counters.items())},
+            "gauges": dict(self._gauges),
         }
-    
-    def record_prediction(self, is_threat: bool, confidence: float):
-        """Record prediction"""
-        self.metrics['total_predictions'] += 1
-        if is_threat:
-            self.metrics['threats_detected'] += 1
-        else:
-            self.metrics['benign_detected'] += 1
-        
-        # Update average confidence
-        current_avg = self.metrics['avg_confidence']
-        total = self.metrics['total_predictions']
-        self.metrics['avg_confidence'] = (
-            (current_avg * (total - 1) + confidence) / total
-        )
-    
-    def get_metrics(self) -> Dict:
-        """Get all metrics"""
-        return self.metrics
\ No newline at end of file
+
+    def maybe_flush(self):
+        """Write this process's snapshot if the flush interval has passed"""
+        if self.store_dir is None:
+            return
+        now = time.monotonic()
+        if now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        self.flush()
+
+    def flush(self):
+        if self.store_dir is None:
+            return
+        try:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            self._write(self.store_dir / f"{os.getpid()}.json", self.snapshot())
+        except OSError as e:
+            logger.warning(f"⚠️ Metrics flush failed: {e}")
+
+    def _read(self, path: Path) -> Optional[Dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # Gone, or being replaced right now
+
+    def _write(self, path: Path, snap: Dict):
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(snap, f)
+        os.replace(tmp, path)
+
+    def retire(self, pid: int):
+        """gunicorn child_exit (in the master): fold an exited worker's histograms and
+        counters into the retired snapshot and delete its file; its gauges are dropped"""
+        if self.store_dir is None:
+            return
+        path = self.store_dir / f"{pid}.json"
+        snap = self._read(path)
+        if snap is None:
+            return
+        retired = self._read(self.store_dir / RETIRED)
+        try:
+            self._write(self.store_dir / RETIRED, {"pid": None, **merge([retired, {**snap, "gauges": {}}])})
+            path.unlink()
+        except OSError as e:
+            logger.warning(f"⚠️ Retiring metrics of worker {pid} failed: {e}")
+
+    def aggregate(self) -> Dict:
+        """All workers' series merged: {"processes", "start_time", "histograms", "counters", "gauges"}
+
+        Workers that have exited count through the retired snapshot, not as processes
+        """
+        snapshots, retired = [self.snapshot()], None
+        if self.store_dir is not None and self.store_dir.exists():
+            own = f"{os.getpid()}.json"
+            for path in self.store_dir.glob("*.json"):
+                if path.name == own:
+                    continue
+                if path.name == RETIRED:
+                    retired = self._read(path)
+                    continue
+                snap = self._read(path)
+                if snap is not None:
+                    snapshots.append(snap)
+        return {"processes": len(snapshots), **merge(snapshots + [retired])}
+
+    def summaries(self, name: str, aggregated: Optional[Dict] = None) -> Dict[str, Dict]:
+        """summarize() for every series of a histogram, keyed by its label string"""
+        aggregated = aggregated or self.aggregate()
+        out = {}
+        for key, h in aggregated["histograms"].items():
+            series, labels = parse_key(key)
+            if series == name:
+                label = ",".join(f"{k}={v}" for k, v in sorted(labels.items())) or "all"
+                out[label] = summarize(h, h["bounds"])
+        return out
+
+    def merged(self, name: str, aggregated: Optional[Dict] = None, where=None, **match) -> Dict:
+        """One summary over every series of name whose labels include match (and satisfy where)"""
+        aggregated = aggregated or self.aggregate()
+        counts, total, bounds = None, 0.0, LATENCY_BUCKETS
+        for key, h in aggregated["histograms"].items():
+            series, labels = parse_key(key)
+            if series != name or any(labels.get(k) != v for k, v in match.items()):
+                continue
+            if where is not None and not where(labels):
+                continue
+            bounds = h["bounds"]
+            counts = h["counts"] if counts is None else [a + b for a, b in zip(counts, h["counts"])]
+            total += h["sum"]
+        if counts is None:
+            return summarize({"counts": [0], "sum": 0.0}, bounds)
+        return summarize({"counts": counts, "sum": total}, bounds)
+
+
+# Global instance
+metrics = MetricsCollector(store_dir=config.METRICS_DIR)
+prefork.after_fork(metrics.after_fork)
@@ -0,0 +1,182 @@
+"""
+Pre-fork Serving
+With preload_app (gunicorn.conf.py, PRELOAD=1) the app and its model bundle
+are loaded once in the gunicorn master and every worker is forked from it,
+so the unpickled RF/GB/SVC/MLP models sit in pages the workers share
+copy-on-write instead of one copy per worker. Two things keep those pages
+shared once workers run:
+
+  protect(*roots)  marks every NumPy array reachable from the bundle
+                   read-only, so no code path can write (and copy) them
+  freeze()         moves every object into the GC's permanent generation;
+                   a collection in a worker otherwise writes to the header
+                   of each tracked object and copies its page
+
+The master serves no requests and starts no threads: components that run a
+background thread from app setup register it with in_workers() and get it
+started in each worker after the fork. memory_report() reads
+/proc/<pid>/smaps_rollup for the master and its workers and splits each
+worker's resident memory into unique (USS) and shared pages.
+
+  python -m utils.prefork <master pid>
+"""
+
+import gc
+import logging
+import os
+import sys
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# smaps_rollup fields reported, kB in the file
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+_preloading = False
+_after_fork: List[Callable] = []
+master_pid: Optional[int] = None  # Set in gunicorn workers
+
+
+def preloading():
+    """Called by the gunicorn master before it loads the app (preload_app)"""
+    global _preloading
+    _preloading = True
+
+
+def after_fork(fn: Callable) -> Callable:
+    """Run fn in every worker right after it is forked (gunicorn post_fork)"""
+    _after_fork.append(fn)
+    return fn
+
+
+def in_workers(fn: Callable):
+    """Run fn now, or in every worker after the fork when the app is being preloaded in the master"""
+    if _preloading:
+        after_fork(fn)
+    else:
+        fn()
+
+
+def forked(master: int):
+    """gunicorn post_fork: this process is a worker of master"""
+    global _preloading, master_pid
+    master_pid = master
+    if not _preloading:
+        return
+    _preloading = False
+    for fn in _after_fork:
+        try:
+            fn()
+        except Exception as e:
+            logger.warning(f"⚠️ After-fork hook {getattr(fn, '__qualname__', fn)} failed: {e}")
+
+
+# --- sharing -----------------------------------------------------------------
+
+def protect(*roots) -> int:
+    """Mark every numeric array reachable from roots (through containers and object
+    attributes) read-only; returns their total bytes. Arrays owned by compiled
+    objects (sklearn's tree nodes) are not reachable and stay as they are."""
+    seen, nbytes, stack = set(), 0, list(roots)
+    while stack:
+        obj = stack.pop()
+        if obj is None or id(obj) in seen or isinstance(obj, (str, bytes, int, float, type)):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            if obj.dtype != object:
+                obj.flags.writeable = False
+                nbytes += obj.nbytes
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__") and not callable(obj):
+            stack.extend(vars(obj).values())
+    return nbytes
+
+
+def freeze():
+    """Collect once, then keep everything allocated so far out of later collections"""
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+# --- memory report -----------------------------------------------------------
+
+def smaps(pid: int) -> Optional[Dict[str, int]]:
+    """SMAPS_FIELDS of a process in bytes, plus uss / shared; None if it is gone or unreadable"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    usage = {}
+    for line in lines:
+        key, _, value = line.partition(":")
+        if key in SMAPS_FIELDS:
+            usage[key.lower()] = int(value.split()[0]) * 1024
+    usage["uss"] = usage.get("private_clean", 0) + usage.get("private_dirty", 0)
+    usage["shared"] = usage.get("shared_clean", 0) + usage.get("shared_dirty", 0)
+    return usage
+
+
+def children(pid: int) -> List[int]:
+    """Direct child pids, from /proc/*/stat"""
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # "pid (comm) state ppid ..."; comm may contain spaces and parentheses
+        if int(stat[stat.rindex(")") + 2:].split()[1]) == pid:
+            found.append(int(entry))
+    return sorted(found)
+
+
+def memory_report(master: int = None) -> Dict:
+    """Per-process USS / shared / RSS / PSS of master and its workers (default: this process's
+    master under preload, else this process alone) and the totals with and without sharing"""
+    master = master or master_pid or os.getpid()
+    processes = []
+    for role, pid in [("master", master)] + [("worker", p) for p in children(master)]:
+        usage = smaps(pid)
+        if usage is not None:
+            processes.append({"pid": pid, "role": role, **usage})
+    workers = [p for p in processes if p["role"] == "worker"]
+    return {
+        "master": master,
+        "processes": processes,
+        "workers": len(workers),
+        # Real footprint (shared pages split between their users) vs every page counted per process
+        "total_pss": sum(p["pss"] for p in processes),
+        "total_rss": sum(p["rss"] for p in processes),
+        "worker_uss_mean": sum(p["uss"] for p in workers) / len(workers) if workers else 0,
+        "worker_shared_mean": sum(p["shared"] for p in workers) / len(workers) if workers else 0,
+    }
+
+
+def main(argv: List[str]) -> int:
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("❌ /proc/<pid>/smaps_rollup is not available (Linux 4.14+ only)")
+        return 1
+    report = memory_report(int(argv[0]) if argv else None)
+    mb = lambda b: b / 2**20
+    print(f"{'pid':>8} {'role':<7}{'rss MB':>10}{'pss MB':>10}{'unique MB':>11}{'shared MB':>11}")
+    for p in report["processes"]:
+        print(f"{p['pid']:>8} {p['role']:<7}{mb(p['rss']):>10.1f}{mb(p['pss']):>10.1f}"
+              f"{mb(p['uss']):>11.1f}{mb(p['shared']):>11.1f}")
+    print(f"📊 {report['workers']} workers: {mb(report['total_pss']):.1f} MB in use (PSS), "
+          f"{mb(report['total_rss']):.1f} MB if nothing were shared (RSS)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,388 @@
+"""
+On-demand Profiling
+A session profiles a random fraction of requests until its time window or
+request budget runs out, then switches itself off. Two modes:
+
+  sampling       a background thread reads the stacks of profiled requests
+                 every interval_ms (low overhead; counts are samples)
+  deterministic  sys.setprofile on the request's thread records every call
+                 (exact but slow; counts are microseconds of self time)
+
+Stacks are aggregated as folded lines ("root;frame;frame count"), the input
+of flamegraph.pl and speedscope. With PROFILING_DIR set, a session reaches
+every gunicorn worker through a control file and their stacks are merged
+on read.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sampling", "deterministic")
+ROOT_FRAME = "full_dispatch_request"  # Flask frame wrapping before_request hooks and the view
+POLL_SECONDS = 1.0
+
+_BACKEND = str(Path(__file__).resolve().parent.parent) + os.sep
+_names: Dict[object, str] = {}
+
+
+def frame_name(code) -> str:
+    """path:qualname for a code object, with site-packages and the backend prefix stripped"""
+    name = _names.get(code)
+    if name is None:
+        path = code.co_filename
+        if "site-packages" in path:
+            path = path.split("site-packages" + os.sep, 1)[-1]
+        elif path.startswith(_BACKEND):
+            path = path[len(_BACKEND):]
+        name = _names[code] = f"{path}:{getattr(code, 'co_qualname', code.co_name)}"
+    return name
+
+
+def builtin_name(fn) -> str:
+    module = getattr(fn, "__module__", None) or type(getattr(fn, "__self__", None)).__name__
+    return f"{module}.{getattr(fn, '__qualname__', repr(fn))}"
+
+
+class ProfileSession:
+    """One profiling window and the stacks it collected in this process"""
+
+    def __init__(self, id: str, mode: str, seconds: float, max_requests: int,
+                 sample_rate: float, interval_ms: float, started_at: float):
+        self.id = id
+        self.mode = mode
+        self.seconds = seconds
+        self.max_requests = max_requests
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        self.started_at = started_at
+        self.expires_at = started_at + seconds
+        self.requests = 0
+        self.stacks = Counter()
+        self.ended: Optional[str] = None
+
+    def params(self) -> Dict:
+        return {"id": self.id, "mode": self.mode, "seconds": self.seconds,
+                "max_requests": self.max_requests, "sample_rate": self.sample_rate,
+                "interval_ms": self.interval_ms, "started_at": self.started_at}
+
+    def add(self, key: str, amount: float, max_stacks: int):
+        if key not in self.stacks and len(self.stacks) >= max_stacks:
+            key = key.split(";", 1)[0] + ";[truncated]"
+        self.stacks[key] += amount
+
+
+class _Tracer:
+    """sys.setprofile callback building folded stacks with self time"""
+
+    def __init__(self, session: ProfileSession, label: str, max_depth: int):
+        self.session = session
+        self.keys = [label]
+        self.starts = []
+        self.child = []
+        self.stacks = Counter()
+        self.max_depth = max_depth
+
+    def __call__(self, frame, event, arg):
+        if event == "call" or event == "c_call":
+            parent = self.keys[-1]
+            if len(self.keys) > self.max_depth:
+                self.keys.append(parent)  # Deeper frames fold into the last one kept
+            else:
+                name = frame_name(frame.f_code) if event == "call" else builtin_name(arg)
+                self.keys.append(parent + ";" + name)
+            self.child.append(0.0)
+            self.starts.append(time.perf_counter())
+        elif self.starts:
+            # return / c_return / c_exception; events for frames entered before
+            # profiling began find an empty stack and are ignored
+            elapsed = time.perf_counter() - self.starts.pop()
+            self.stacks[self.keys.pop()] += elapsed - self.child.pop()
+            if self.child:
+                self.child[-1] += elapsed
+
+
+class Profiler:
+    """Process-wide profiling switch driven by the admin endpoints and request hooks"""
+
+    def __init__(self, control_dir: Optional[str] = None, settings: Dict = None):
+        self.control_dir = Path(control_dir) if control_dir else None
+        self.settings = settings or config.PROFILING
+        self.session: Optional[ProfileSession] = None  # Running in this process
+        self.last: Optional[ProfileSession] = None     # Most recent, running or ended
+        self._lock = threading.Lock()
+        self._sampled: Dict[int, tuple] = {}  # thread id → (label, root frame)
+        self._next_poll = 0.0
+        self._control_mtime = None
+        self._dirty = False
+
+    # --- control -----------------------------------------------------------
+
+    def start(self, mode: str, seconds: float = None, requests: int = None,
+              sample_rate: float = None, interval_ms: float = None) -> Dict:
+        """Begin a session on every worker; ValueError for bad or over-cap parameters"""
+        s = self.settings
+        seconds = float(seconds if seconds is not None else s["default_seconds"])
+        requests = int(requests if requests is not None else s["default_requests"])
+        sample_rate = float(sample_rate if sample_rate is not None else s["default_sample_rate"])
+        interval_ms = float(interval_ms if interval_ms is not None else s["sample_interval_ms"])
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if not 0 < seconds <= s["max_seconds"]:
+            raise ValueError(f"seconds must be in (0, {s['max_seconds']}]")
+        if not 0 < requests <= s["max_requests"]:
+            raise ValueError(f"requests must be in (0, {s['max_requests']}]")
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        if not 1 <= interval_ms <= 1000:
+            raise ValueError("interval_ms must be in [1, 1000]")
+
+        self._poll(force=True)
+        with self._lock:
+            if self.session is not None and not self._expired(self.session):
+                raise RuntimeError(f"Profiling session {self.session.id} is already running")
+        session = ProfileSession(uuid.uuid4().hex[:12], mode, seconds, requests,
+                                 sample_rate, interval_ms, time.time())
+        self._begin(session)
+        self._write_control({**session.params(), "stopped": False})
+        logger.info(f"🔬 Profiling {session.id} started: {mode}, {seconds:.0f}s / {requests} requests, "
+                    f"{sample_rate:.0%} of requests")
+        return self.status()
+
+    def stop(self) -> Dict:
+        """End the running session on every worker"""
+        session = self.session
+        if session is not None:
+            self._end(session, "stopped")
+            self._write_control({**session.params(), "stopped": True})
+        return self.status()
+
+    def status(self) -> Dict:
+        self._poll(force=True)
+        session = self.session or self.last
+        if session is None:
+            return {"active": False}
+        if self.session is not None and self._expired(self.session):
+            self._end(self.session, "time limit")
+        workers = self._worker_results(session.id)
+        return {
+            "active": session.ended is None,
+            **session.params(),
+            "expires_at": session.expires_at,
+            "seconds_left": max(0.0, session.expires_at - time.time()) if session.ended is None else 0.0,
+            "ended": session.ended,
+            "requests_profiled": sum(w["requests"] for w in workers),
+            "workers": len(workers),
+            "unit": "samples" if session.mode == "sampling" else "microseconds",
+        }
+
+    def folded(self) -> str:
+        """Merged stacks of the most recent session, one "stack count" line each"""
+        self._poll(force=True)
+        session = self.session or self.last
+        if session is None:
+            return ""
+        merged = Counter()
+        for worker in self._worker_results(session.id):
+            merged.update(worker["stacks"])
+        if session.mode == "deterministic":
+            merged = Counter({k: int(round(v * 1e6)) for k, v in merged.items()})
+        return "".join(f"{stack} {count}\n" for stack, count in merged.most_common() if count > 0)
+
+    # --- request hooks -----------------------------------------------------
+
+    def begin_request(self, method: str, url_rule):
+        """Called at the start of every request; returns a token when this one is profiled"""
+        if self.control_dir is not None:
+            self._poll()
+        session = self.session
+        if session is None:
+            return None
+        if self._expired(session):
+            self._end(session, "time limit")
+            return None
+        if random.random() >= session.sample_rate:
+            return None
+        with self._lock:
+            if session.requests >= session.max_requests:
+                token = None
+            else:
+                session.requests += 1
+                token = session
+        if token is None:
+            self._end(session, "request limit")
+            return None
+        self._dirty = True
+        label = f"{method} {url_rule.rule if url_rule else 'unmatched'}"
+
+        if session.mode == "deterministic":
+            tracer = _Tracer(session, label, self.settings["max_stack_depth"])
+            sys.setprofile(tracer)
+            return tracer
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code.co_name != ROOT_FRAME:
+            frame = frame.f_back
+        ident = threading.get_ident()
+        self._sampled[ident] = (label, frame)
+        return ident
+
+    def end_request(self, token):
+        if isinstance(token, _Tracer):
+            sys.setprofile(None)
+            with self._lock:
+                for key, seconds in token.stacks.items():
+                    token.session.add(key, seconds, self.settings["max_stacks"])
+        else:
+            self._sampled.pop(token, None)
+
+    # --- internals ---------------------------------------------------------
+
+    @staticmethod
+    def _expired(session: ProfileSession) -> bool:
+        return time.time() >= session.expires_at
+
+    def _begin(self, session: ProfileSession):
+        with self._lock:
+            if self.session is not None:
+                self.session.ended = self.session.ended or "replaced"
+            self.session = self.last = session
+            self._sampled.clear()
+        if session.mode == "sampling":
+            threading.Thread(target=self._sample, args=(session,), daemon=True,
+                             name=f"profiler-{session.id}").start()
+
+    def _end(self, session: ProfileSession, reason: str):
+        with self._lock:
+            if session.ended is None:
+                session.ended = reason
+                logger.info(f"🔬 Profiling {session.id} ended ({reason}) after {session.requests} requests")
+            if self.session is session:
+                self.session = None
+            self._sampled.clear()
+        self._flush(session)
+
+    def _sample(self, session: ProfileSession):
+        """Sampling loop: one folded stack per profiled thread per tick"""
+        interval = session.interval_ms / 1000
+        depth = self.settings["max_stack_depth"]
+        own = threading.get_ident()
+        next_flush = time.monotonic() + POLL_SECONDS
+        while session.ended is None:
+            time.sleep(interval)
+            if self._expired(session):
+                self._end(session, "time limit")
+                break
+            frames = sys._current_frames()
+            for ident, (label, root) in list(self._sampled.items()):
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                names = []
+                while frame is not None and frame is not root and len(names) < depth:
+                    names.append(frame_name(frame.f_code))
+                    frame = frame.f_back
+                names.append(label)
+                key = ";".join(reversed(names))
+                with self._lock:
+                    session.add(key, 1, self.settings["max_stacks"])
+                self._dirty = True
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + POLL_SECONDS
+                self._flush(session)
+
+    def _poll(self, force: bool = False):
+        """Pick up sessions started or stopped by another worker (at most once a second)"""
+        if self.control_dir is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return
+        self._next_poll = now + POLL_SECONDS
+        if self._dirty and self.last is not None:
+            self._flush(self.last)
+        try:
+            mtime = (self.control_dir / "control.json").stat().st_mtime_ns
+            if mtime == self._control_mtime:
+                return
+            with open(self.control_dir / "control.json") as f:
+                control = json.load(f)
+            self._control_mtime = mtime
+        except (OSError, ValueError):
+            return
+        current = self.session
+        if control["stopped"]:
+            if current is not None and current.id == control["id"]:
+                self._end(current, "stopped")
+        elif (current is None or current.id != control["id"]) and \
+                (self.last is None or self.last.id != control["id"]):
+            session = ProfileSession(control["id"], control["mode"], control["seconds"],
+                                     control["max_requests"], control["sample_rate"],
+                                     control["interval_ms"], control["started_at"])
+            if not self._expired(session):
+                self._begin(session)
+
+    def _write_control(self, control: Dict):
+        if self.control_dir is None:
+            return
+        try:
+            self.control_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.control_dir / f"control.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(control, f)
+            os.replace(tmp, self.control_dir / "control.json")
+            self._control_mtime = (self.control_dir / "control.json").stat().st_mtime_ns
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write profiling control file: {e}")
+
+    def _flush(self, session: ProfileSession):
+        """Write this worker's stacks for other workers to merge"""
+        self._dirty = False
+        if self.control_dir is None:
+            return
+        with self._lock:
+            result = {"id": session.id, "requests": session.requests, "stacks": dict(session.stacks)}
+        try:
+            self.control_dir.mkdir(parents=True, exist_ok=True)
+            path = self.control_dir / f"{os.getpid()}.json"
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write profiling results: {e}")
+
+    def _worker_results(self, session_id: str):
+        results = []
+        own = None
+        if self.last is not None and self.last.id == session_id:
+            with self._lock:
+                own = {"requests": self.last.requests, "stacks": dict(self.last.stacks)}
+            results.append(own)
+        if self.control_dir is not None and self.control_dir.exists():
+            for path in self.control_dir.glob("*.json"):
+                if path.name in ("control.json", f"{os.getpid()}.json"):
+                    continue
+                try:
+                    with open(path) as f:
+                        result = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if result.get("id") == session_id:
+                    results.append(result)
+        return results
+
+
+# Global instance
+profiler = Profiler(control_dir=config.PROFILING_DIR)
@@ -0,0 +1,82 @@
+import { useState, useEffect, useCallback } from 'react';
+import { api } from '../services/api';
+
+export interface StreamStats {
+  records: number;
+  total_threats: number;
+  total_benign: number;
+  threats_today: number;
+  critical: number;
+  warning: number;
+  confidence_sum: number;
+  avg_confidence: number;
+  last_id: number;
+}
+
+export interface StreamThreat {
+  id: number;
+  timestamp: string;
+  prediction: number;
+  confidence: number;
+  severity: string;
+  threat_type: number;
+  source_ip: string;
+  attack_type: string;
+}
+
+type StatsDelta = Omit<StreamStats, 'avg_confidence' | 'last_id'>;
+
+const applyDelta = (stats: StreamStats, delta: StatsDelta, lastId: number): StreamStats => {
+  const next = { ...stats, last_id: lastId };
+  (Object.keys(delta) as (keyof StatsDelta)[]).forEach((key) => {
+    next[key] += delta[key];
+  });
+  next.avg_confidence = next.records ? next.confidence_sum / next.records : 0;
+  return next;
+};
+
+/**
+ * Live threats and dashboard totals pushed by the backend (/api/monitoring/stream).
+ * Every (re)connect starts with a snapshot, so nothing needs polling; the
+ * browser reconnects by itself when the server ends or drops the stream.
+ */
+export const useThreatStream = (enabled: boolean = true, keep: number = 50) => {
+  const [stats, setStats] = useState<StreamStats | null>(null);
+  const [threats, setThreats] = useState<StreamThreat[]>([]);
+  const [connected, setConnected] = useState(false);
+  const [lastUpdate, setLastUpdate] = useState<Date | null>(null);
+  const [generation, setGeneration] = useState(0);
+
+  useEffect(() => {
+    if (!enabled) {
+      setConnected(false);
+      return;
+    }
+
+    const source = new EventSource(api.streamUrl());
+    source.onopen = () => setConnected(true);
+    source.onerror = () => setConnected(false);
+
+    source.addEventListener('snapshot', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      setStats(data.stats);
+      setThreats(data.threats.slice(0, keep));
+      setLastUpdate(new Date());
+    });
+
+    source.addEventListener('threats', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      const lastId = data.threats.length ? data.threats[0].id : 0;
+      setThreats((prev) => [...data.threats, ...prev].slice(0, keep));
+      setStats((prev) => (prev ? applyDelta(prev, data.delta, lastId) : prev));
+      setLastUpdate(new Date());
+    });
+
+    return () => source.close();
+  }, [enabled, keep, generation]);
+
+  // Drop the connection and start again from a fresh snapshot
+  const reconnect = useCallback(() => setGeneration((g) => g + 1), []);
+
+  return { stats, threats, connected, lastUpdate, reconnect };
+};
@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 // import { AlertCircle, BarChart3 } from 'lucide-react';
 import { api } from '../services/api';
+import { useThreatStream } from '../hooks/useThreatStream';
 import {
   BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip,
   Legend, ResponsiveContainer, RadarChart, PolarGrid, PolarAngleAxis, PolarRadiusAxis, Radar, AreaChart, Area
@@ -11,7 +12,7 @@ interface AdminMetrics {
   avgConfidence: number;
   totalThreats: number;
   totalBenign: number;
-  perModelAccuracy: Record<string, number>;
+  perModelAuc: Record<string, number>;
   processingStats: {
     avgTime: number;
     totalProcessed: number;
@@ -22,6 +23,8 @@ const Admin: React.FC = () => {
   const [metrics, setMetrics] = useState<AdminMetrics | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string>('');
+  // Totals arrive live; the admin endpoint is only re-read for model and latency figures
+  const { stats: live } = useThreatStream(true, 0);
 
   /**
    * Fetch admin metrics
@@ -43,7 +46,7 @@ const Admin: React.FC = () => {
           avgConfidence: data.avg_confidence || 0,
           totalThreats: data.total_threats || 0,
           totalBenign: data.total_benign || 0,
-          perModelAccuracy: data.per_model_accuracy || {},
+          perModelAuc: data.per_model_auc || {},
           processingStats: {
             avgTime: data.avg_processing_time || 0,
             totalProcessed: data.total_processed || 0,
@@ -69,7 +72,7 @@ const Admin: React.FC = () => {
       if (!isMounted) return;
       await fetchMetrics();
       if (isMounted) {
-        timerId = setTimeout(poll, 10000); // Refresh every 10s
+        timerId = setTimeout(poll, 60000); // Latency figures every 60s; totals are live
       }
     };
 
@@ -113,10 +116,14 @@ const Admin: React.FC = () => {
 
   if (!metrics) return null;
 
-  const modelData = Object.entries(metrics.perModelAccuracy).map(
-    ([model, accuracy]) => ({
-      model: model.replace('_', ' '),
-      accuracy: Math.round(accuracy as number * 100),
+  const totals = live
+    ? { avgConfidence: live.avg_confidence, totalThreats: live.total_threats, totalBenign: live.total_benign }
+    : metrics;
+
+  const modelData = Object.entries(metrics.perModelAuc).map(
+    ([model, auc]) => ({
+      model: model.toUpperCase(),
+      auc: Math.round(auc as number * 1000) / 1000,
     })
   );
 
@@ -137,17 +144,17 @@ const Admin: React.FC = () => {
             },
             {
               label: 'Avg Confidence',
-              value: `${(metrics.avgConfidence * 100).toFixed(2)}%`,
+              value: `${(totals.avgConfidence * 100).toFixed(2)}%`,
               subtext: 'Prediction confidence',
             },
             {
               label: 'Threats Detected',
-              value: metrics.totalThreats,
+              value: totals.totalThreats,
               subtext: 'Total threats',
             },
             {
               label: 'Benign Samples',
-              value: metrics.totalBenign,
+              value: totals.totalBenign,
               subtext: 'Non-threat samples',
             },
           ].map((m, i) => (
@@ -230,15 +237,15 @@ const Admin: React.FC = () => {
           </div>
         </div>
 
-        {/* Per-Model Accuracy Chart */}
+        {/* Per-Model Validation AUC Chart */}
         {modelData.length > 0 && (
           <div className="card mb-8">
-            <h2 className="card-title mb-6">Per-Model Accuracy</h2>
+            <h2 className="card-title mb-6">Per-Model Validation AUC</h2>
             <ResponsiveContainer width="100%" height={300}>
               <BarChart data={modelData}>
                 <CartesianGrid strokeDasharray="3 3" stroke="#1f2937" />
                 <XAxis dataKey="model" stroke="#9ca3af" />
-                <YAxis stroke="#9ca3af" />
+                <YAxis stroke="#9ca3af" domain={[0, 1]} />
                 <Tooltip
                   contentStyle={{
                     backgroundColor: '#1f2937',
@@ -247,7 +254,7 @@ const Admin: React.FC = () => {
                   }}
                 />
                 <Legend />
-                <Bar dataKey="accuracy" fill="#964734" />
+                <Bar dataKey="auc" fill="#964734" />
               </BarChart>
             </ResponsiveContainer>
           </div>
@@ -1,89 +1,19 @@
-import React, { useState, useEffect, useRef } from "react";
+import React, { useState, useEffect } from "react";
 import { AlertCircle, Play, Pause, RotateCcw } from "lucide-react";
-import { api } from "../services/api";
-
-interface Threat {
-  id: string;
-  threat_type: string;
-  confidence: number;
-  timestamp: string;
-  severity: "low" | "medium" | "high";
-}
+import { useThreatStream } from "../hooks/useThreatStream";
 
 const Monitoring: React.FC = () => {
-  const [threats, setThreats] = useState<Threat[]>([]);
-  const [error, setError] = useState<string>("");
-  const [isPolling, setIsPolling] = useState(true);
-  const [lastUpdate, setLastUpdate] = useState<Date | null>(null);
-  const pollIntervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
-
-  /**
-   * Fetch threats with timeout and error handling
-   */
-  const fetchThreats = async (signal?: AbortSignal) => {
-    try {
-      setError("");
-
-      // Create timeout promise
-      const timeoutPromise = new Promise((_, reject) =>
-        setTimeout(() => reject(new Error("Request timeout (10s)")), 10000)
-      );
-
-      // Race between API call and timeout
-      const response = (await Promise.race([
-        api.threats(),
-        timeoutPromise,
-      ])) as any;
-
-      // Safe data check
-      const data = Array.isArray(response.data) ? response.data : [];
-      setThreats(data.slice(0, 50)); // Keep only recent 50
-      setLastUpdate(new Date());
-    } catch (err: any) {
-      // Don't show error on abort
-      if (err.name !== "AbortError") {
-        setError(err.message || "Failed to fetch threats");
-      }
-    }
-  };
-
-  /**
-   * Setup polling
-   */
-  /**
-   * Setup polling (Recursive setTimeout)
-   */
-  useEffect(() => {
-    let isMounted = true;
-    let timerId: ReturnType<typeof setTimeout>;
-
-    const poll = async () => {
-      if (!isPolling || !isMounted) return;
-
-      await fetchThreats();
-
-      if (isPolling && isMounted) {
-        timerId = setTimeout(poll, 3000);
-        pollIntervalRef.current = timerId as any; 
-      }
-    };
-
-    if (isPolling) {
-      poll();
-    }
-
-    return () => {
-      isMounted = false;
-      if (timerId) clearTimeout(timerId);
-    };
-  }, [isPolling]);
+  const [isLive, setIsLive] = useState(true);
+  const [isVisible, setIsVisible] = useState(!document.hidden);
+  const { threats, connected, lastUpdate, reconnect } = useThreatStream(isLive && isVisible, 50);
+  const error = isLive && isVisible && !connected && lastUpdate ? "Live stream disconnected, reconnecting..." : "";
 
   /**
-   * Handle visibility change (pause when tab hidden)
+   * Handle visibility change (close the stream when tab hidden)
    */
   useEffect(() => {
     const handleVisibility = () => {
-      setIsPolling(!document.hidden);
+      setIsVisible(!document.hidden);
     };
 
     document.addEventListener("visibilitychange", handleVisibility);
@@ -93,28 +23,25 @@ const Monitoring: React.FC = () => {
   }, []);
 
   /**
-   * Pause polling
+   * Pause live updates
    */
   const handlePause = () => {
-    setIsPolling(false);
-    if (pollIntervalRef.current) {
-      clearInterval(pollIntervalRef.current);
-      pollIntervalRef.current = null;
-    }
+    setIsLive(false);
   };
 
   /**
-   * Resume polling
+   * Resume live updates
    */
   const handleResume = () => {
-    setIsPolling(true);
+    setIsLive(true);
   };
 
   /**
-   * Manual refresh
+   * Manual refresh: reconnect for a fresh snapshot
    */
-  const handleRefresh = async () => {
-    await fetchThreats();
+  const handleRefresh = () => {
+    setIsLive(true);
+    reconnect();
   };
 
   return (
@@ -132,7 +59,7 @@ const Monitoring: React.FC = () => {
 
           {/* Control Buttons */}
           <div className="flex gap-3">
-            {isPolling ? (
+            {isLive ? (
               <button
                 onClick={handlePause}
                 className="btn btn-outline flex items-center gap-2"
@@ -165,11 +92,11 @@ const Monitoring: React.FC = () => {
             <div className="flex items-center gap-2">
               <div
                 className={`w-3 h-3 rounded-full ${
-                  isPolling ? "bg-green-500 animate-pulse" : "bg-gray-500"
+                  isLive && connected ? "bg-green-500 animate-pulse" : "bg-gray-500"
                 }`}
               />
               <span className="text-navy-300 text-sm">
-                {isPolling ? "Monitoring active" : "Paused"}
+                {!isLive ? "Paused" : connected ? "Monitoring active (live)" : "Connecting..."}
               </span>
             </div>
             <span className="text-navy-400 text-sm">
@@ -218,12 +145,12 @@ const Monitoring: React.FC = () => {
                   <div className="flex justify-between items-start mb-3">
                     <div>
                       <p className="text-cyan-300 font-semibold">
-                        {threat.threat_type}
+                        {threat.attack_type || threat.threat_type}
                       </p>
                       <p className="text-navy-400 text-sm">ID: {threat.id}</p>
                     </div>
                     <span className="badge badge-error text-xs">
-                      {threat.severity.toUpperCase()}
+                      {(threat.severity || "unknown").toUpperCase()}
                     </span>
                   </div>
 
@@ -66,14 +66,19 @@ export const api = {
   threats: (limit: number = 50) =>
     axiosInstance.get(`/api/threats/?limit=${limit}`),
 
-  // Threat search
-  searchThreats: (query: string) =>
-    axiosInstance.get(`/api/threats/search?q=${query}`),
+  // Threat search: q plus optional severity, attack_type, ip (address or CIDR),
+  // start, end, min_confidence, max_confidence, limit and cursor (next_cursor)
+  searchThreats: (query: string, filters: Record<string, string | number> = {}) =>
+    axiosInstance.get('/api/threats/search', { params: { q: query, ...filters } }),
 
   // Threat by ID
   getThreatById: (id: string) =>
     axiosInstance.get(`/api/threats/${id}`),
 
+  // Nearest stored threats by feature vector
+  getSimilarThreats: (id: string | number, k = 10) =>
+    axiosInstance.get(`/api/threats/${id}/similar`, { params: { k } }),
+
   // Anomaly detection
   detectAnomaly: (features: number[]) =>
     axiosInstance.post('/api/threats/detect', { features }),
@@ -87,6 +92,10 @@ export const api = {
     });
   },
 
+  // Live threat stream (server-sent events), used with EventSource
+  streamUrl: () =>
+    `${axiosInstance.defaults.baseURL}/api/monitoring/stream`,
+
   // Dashboard stats
   dashboardStats: () =>
     axiosInstance.get('/api/monitoring/dashboard'),